@@ -0,0 +1,283 @@
+"""
+Компилятор базовых блоков: декодированная программа -> функции Python
+"""
+import hashlib
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, Set
+
+from .models import AddressingMode
+from .flags import FLAG_ZERO, FLAG_CARRY, FLAG_OVERFLOW, FLAG_NEGATIVE, FLAGS_ADD, FLAGS_SUB, FLAGS_LOGIC
+
+# Команды, которые меняют только ACC и флаги и не прерывают блок
+_ALU_EXPRESSIONS = {
+    'ADD': ("(acc + v) & 0xFFFF", FLAGS_ADD),
+    'SUB': ("(acc - v) & 0xFFFF", FLAGS_SUB),
+    'MUL': ("(acc * v) & 0xFFFF", FLAGS_LOGIC),
+    'DIV': ("(acc // v) & 0xFFFF", FLAGS_LOGIC),
+    'AND': ("acc & v", FLAGS_LOGIC),
+    'OR':  ("acc | v", FLAGS_LOGIC),
+    'XOR': ("acc ^ v", FLAGS_LOGIC),
+}
+
+# Условные переходы: (проверяемый флаг, переход при значении флага)
+_CONDITIONAL_JUMPS = {
+    'JZ': (FLAG_ZERO, True), 'JNZ': (FLAG_ZERO, False),
+    'JC': (FLAG_CARRY, True), 'JNC': (FLAG_CARRY, False),
+    'JV': (FLAG_OVERFLOW, True), 'JNV': (FLAG_OVERFLOW, False),
+    'JN': (FLAG_NEGATIVE, True), 'JNN': (FLAG_NEGATIVE, False),
+}
+
+_FLAG_NAMES = {
+    FLAG_ZERO: 'FLAG_ZERO', FLAG_CARRY: 'FLAG_CARRY',
+    FLAG_OVERFLOW: 'FLAG_OVERFLOW', FLAG_NEGATIVE: 'FLAG_NEGATIVE',
+}
+
+_BLOCK_GLOBALS = {
+    'FLAG_ZERO': FLAG_ZERO, 'FLAG_CARRY': FLAG_CARRY,
+    'FLAG_OVERFLOW': FLAG_OVERFLOW, 'FLAG_NEGATIVE': FLAG_NEGATIVE,
+}
+
+
+class CompiledBlock:
+    """Скомпилированный базовый блок
+
+    func(proc, cpu, ram) выполняет все команды блока и записывает в cpu
+    новые ACC и PC. length - число команд блока, max_address - наибольший
+    адрес памяти, к которому обращается блок (блок можно выполнять, только
+    если len(ram) > max_address; иначе команды идут через интерпретатор).
+    """
+
+    __slots__ = ('start', 'length', 'max_address', 'func', 'source')
+
+    def __init__(self, start: int, length: int, max_address: int, func, source: str):
+        self.start = start
+        self.length = length
+        self.max_address = max_address
+        self.func = func
+        self.source = source
+
+
+class BlockCompiler:
+    """Компилятор базовых блоков с общим кэшем
+
+    Программа разбивается на базовые блоки по целям переходов и по самим
+    переходам. Каждый блок транслируется в одну сгенерированную функцию
+    Python, которая держит ACC в локальной переменной и записывает флаги
+    один раз в конце блока (как отложенную операцию, см. RISCProcessor._flag).
+    Блоки кэшируются по ключу (хэш программы, PC начала блока), поэтому
+    повторная загрузка той же программы не требует перекомпиляции.
+
+    DIV всегда начинает новый блок: деление на ноль возникает до любых
+    изменений состояния блока, и состояние процессора совпадает с
+    состоянием интерпретатора в момент ошибки.
+
+    В режиме фон Неймана (задан code_range) STA в область кода завершает
+    блок: следующая команда могла измениться и выбирается заново.
+    """
+
+    _cache: "OrderedDict[Tuple[str, int], Optional[CompiledBlock]]" = OrderedDict()
+    _leaders: "OrderedDict[str, Set[int]]" = OrderedDict()
+
+    def __init__(self, instructions: Dict[str, int], cache_size: int = 4096, max_programs: int = 64):
+        self.names = {opcode: name for name, opcode in instructions.items()}
+        self.cache_size = cache_size
+        self.max_programs = max_programs
+        self.compiled = 0
+
+    @staticmethod
+    def program_key(decoded: List[Tuple[int, Any, Any]]) -> str:
+        """Хэш декодированной программы"""
+        return hashlib.sha1(repr(decoded).encode()).hexdigest()
+
+    def get_block(self, key: str, decoded: List[Tuple[int, Any, Any]], pc: int,
+                  code_range: Optional[Tuple[int, int]] = None) -> Optional[CompiledBlock]:
+        """Блок, начинающийся с pc (None - команду нужно выполнить интерпретатором)
+
+        key должен различать программы с разными code_range.
+        """
+        cache = self._cache
+        cache_key = (key, pc)
+        if cache_key in cache:
+            cache.move_to_end(cache_key)
+            return cache[cache_key]
+
+        leaders = self._leaders.get(key)
+        if leaders is None:
+            leaders = self._find_leaders(decoded)
+            self._leaders[key] = leaders
+            if len(self._leaders) > self.max_programs:
+                self._leaders.popitem(last=False)
+        block = self._compile(decoded, pc, leaders, code_range)
+        cache[cache_key] = block
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return block
+
+    @classmethod
+    def clear_cache(cls):
+        """Очистить общий кэш блоков"""
+        cls._cache.clear()
+        cls._leaders.clear()
+
+    def _kind(self, instr: Tuple[int, Any, Any]) -> Optional[str]:
+        """Имя команды, если ее можно скомпилировать (иначе None)"""
+        opcode, operand, mode = instr
+        name = self.names.get(opcode)
+        if name is None or mode is None:
+            return None
+        if name in ('NOT', 'HALT', 'NOP'):
+            return name
+        if not isinstance(operand, int):
+            # Переход на неизвестную метку - ошибка во время выполнения
+            return None
+        if name == 'JMP' or name in _CONDITIONAL_JUMPS:
+            if mode is AddressingMode.IMMEDIATE or operand >= 0:
+                return name
+            return None
+        if operand < 0:
+            return None
+        return name
+
+    def _find_leaders(self, decoded: List[Tuple[int, Any, Any]]) -> Set[int]:
+        """PC, с которых начинаются базовые блоки"""
+        leaders = {0}
+        for pc, instr in enumerate(decoded):
+            name = self._kind(instr)
+            if name is None or name == 'HALT':
+                leaders.add(pc + 1)
+            elif name == 'DIV':
+                leaders.add(pc)
+            elif name == 'JMP' or name in _CONDITIONAL_JUMPS:
+                leaders.add(pc + 1)
+                _, target, mode = instr
+                if mode is AddressingMode.IMMEDIATE:
+                    leaders.add(target)
+        return leaders
+
+    def _compile(self, decoded: List[Tuple[int, Any, Any]], start: int, leaders: Set[int],
+                 code_range: Optional[Tuple[int, int]] = None) -> Optional[CompiledBlock]:
+        """Сгенерировать функцию для блока, начинающегося с start"""
+        body: List[Tuple[int, str, Any, Any]] = []
+        pc = start
+        while pc < len(decoded):
+            if pc != start and pc in leaders:
+                break
+            name = self._kind(decoded[pc])
+            if name is None:
+                break
+            _, operand, mode = decoded[pc]
+            body.append((pc, name, operand, mode))
+            pc += 1
+            if name == 'HALT' or name == 'JMP' or name in _CONDITIONAL_JUMPS:
+                break
+            if name == 'STA' and code_range is not None and code_range[0] <= operand < code_range[1]:
+                break
+        if not body:
+            return None
+
+        # Флаги нужны только от последней операции блока, которая их меняет
+        last_flag_op = None
+        for i, (_, name, _, _) in enumerate(body):
+            if name in _ALU_EXPRESSIONS or name in ('NOT', 'LDA', 'LDI', 'CMP'):
+                last_flag_op = i
+
+        lines = [f"def block_{start}(proc, cpu, ram):", "    acc = cpu.accumulator"]
+        flag_kind = None
+        max_address = -1
+        end_pc = f"{pc}"
+        for i, (at, name, operand, mode) in enumerate(body):
+            live = i == last_flag_op
+            lines.append(f"    # {at}: {name} {operand if operand is not None else ''}".rstrip())
+            if name in ('ADD', 'SUB', 'MUL', 'DIV', 'AND', 'OR', 'XOR', 'LDA', 'STA', 'CMP'):
+                max_address = max(max_address, operand)
+            if name == 'JMP' or name in _CONDITIONAL_JUMPS:
+                if mode is not AddressingMode.IMMEDIATE:
+                    max_address = max(max_address, operand)
+
+            if name in _ALU_EXPRESSIONS:
+                expression, kind = _ALU_EXPRESSIONS[name]
+                lines.append(f"    v = ram[{operand}]")
+                if name == 'DIV':
+                    lines.append("    if not v:")
+                    lines.append("        raise Exception(\"Division by zero\")")
+                if live:
+                    flag_kind = kind
+                    lines.append("    fa = acc")
+                    lines.append("    fb = v")
+                lines.append(f"    acc = {expression}")
+                if live:
+                    lines.append("    fr = acc")
+            elif name == 'NOT':
+                lines.append("    acc = ~acc & 0xFFFF")
+                if live:
+                    flag_kind = FLAGS_LOGIC
+                    lines.append("    fa = fb = 0")
+                    lines.append("    fr = acc")
+            elif name == 'LDA':
+                lines.append(f"    acc = ram[{operand}]")
+                if live:
+                    flag_kind = FLAGS_LOGIC
+                    lines.append("    fa = fb = 0")
+                    lines.append("    fr = acc")
+            elif name == 'LDI':
+                lines.append(f"    acc = {operand & 0xFFFF}")
+                if live:
+                    flag_kind = FLAGS_LOGIC
+                    lines.append("    fa = fb = 0")
+                    lines.append("    fr = acc")
+            elif name == 'CMP':
+                if live:
+                    flag_kind = FLAGS_SUB
+                    lines.append("    fa = acc")
+                    lines.append(f"    fb = ram[{operand}]")
+                    lines.append("    fr = (fa - fb) & 0xFFFF")
+            elif name == 'STA':
+                lines.append(f"    ram[{operand}] = acc")
+            elif name == 'NOP':
+                pass
+            elif name == 'HALT':
+                lines.append("    cpu.is_halted = True")
+                end_pc = f"{at}"
+            elif name == 'JMP':
+                end_pc = self._target(operand, mode)
+            else:
+                flag, expected = _CONDITIONAL_JUMPS[name]
+                condition = self._condition(flag, flag_kind)
+                if not expected:
+                    condition = f"not ({condition})"
+                lines.append(f"    pc = {self._target(operand, mode)} if {condition} else {at + 1}")
+                end_pc = "pc"
+
+        lines.append("    cpu.accumulator = acc")
+        lines.append(f"    cpu.program_counter = {end_pc}")
+        if flag_kind is not None:
+            lines.append(f"    proc._flag_args = ({flag_kind}, fr, fa, fb)")
+        source = "\n".join(lines) + "\n"
+
+        namespace = dict(_BLOCK_GLOBALS)
+        exec(compile(source, f"<block {start}>", "exec"), namespace)
+        self.compiled += 1
+        return CompiledBlock(start, len(body), max_address, namespace[f"block_{start}"], source)
+
+    @staticmethod
+    def _target(operand: int, mode: AddressingMode) -> str:
+        """Выражение адреса перехода"""
+        if mode is AddressingMode.IMMEDIATE:
+            return f"{operand}"
+        return f"ram[{operand}]"
+
+    @staticmethod
+    def _condition(flag: int, kind: Optional[int]) -> str:
+        """Выражение значения флага по последней операции блока"""
+        if kind is None:
+            # В блоке нет операций с флагами - флаг берется из процессора
+            return f"proc._flag({_FLAG_NAMES[flag]})"
+        if flag == FLAG_ZERO:
+            return "fr == 0"
+        if flag == FLAG_NEGATIVE:
+            return "fr & 0x8000"
+        if kind == FLAGS_ADD:
+            return "fa + fb > 0xFFFF" if flag == FLAG_CARRY else "fr < fa or fr < fb"
+        if kind == FLAGS_SUB:
+            return "fa < fb"
+        return "False"
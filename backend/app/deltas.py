@@ -0,0 +1,187 @@
+"""
+Дельты состояния эмулятора для WebSocket-протокола
+"""
+from typing import List, Dict, Any, Optional, Tuple
+
+from .emulator import RISCEmulator
+
+# Регистры, изменения которых передаются в дельтах
+DELTA_REGISTERS = ('accumulator', 'program_counter', 'instruction_register', 'instruction_register_asm',
+                   'current_command', 'is_halted', 'cycles')
+
+# Ограничение на размер одной подписки и на число шагов в одной команде
+MAX_SUBSCRIPTION = 0x10000
+MAX_STEPS_PER_COMMAND = 10_000
+
+_MISSING = object()
+
+
+class DeltaTracker:
+    """Изменения состояния эмулятора с момента предыдущего сообщения
+
+    Регистры и флаги сравниваются с последними отправленными значениями.
+    Записи в RAM на шаге берутся из журнала истории (ExecutionHistory.writes),
+    а значения ячеек передаются только для подписанных диапазонов: для них
+    хранится теневая копия, и сравниваются только страницы, измененные после
+    прошлой дельты (PagedRAM.pages_changed_since).
+    """
+
+    def __init__(self, emulator: RISCEmulator):
+        self.subscriptions: List[Tuple[int, int]] = []
+        self._shadow: Dict[Tuple[int, int], List[int]] = {}
+        self.seq = 0
+        self.bind(emulator)
+
+    def bind(self, emulator: RISCEmulator):
+        """Привязать трекер к эмулятору (после сброса или восстановления сессии)"""
+        self.emulator = emulator
+        self._registers: Dict[str, Any] = {}
+        self._flags: Dict[str, bool] = {}
+        self._ram = None
+        self._ram_version = 0
+        # Записи истории до привязки клиенту не передаются
+        self._history_length = len(emulator.processor.memory.history)
+
+    def subscribe(self, start: int, length: int) -> Dict[str, Any]:
+        """Подписаться на ячейки [start, start + length); возвращает их текущие значения"""
+        if start < 0 or length < 1 or length > MAX_SUBSCRIPTION:
+            raise Exception(f"Invalid RAM range: start={start}, length={length}")
+        key = (start, start + length)
+        if key not in self._shadow:
+            self.subscriptions.append(key)
+        values = self._read(*key)
+        self._shadow[key] = values
+        return {"type": "ram", "start": start, "values": values}
+
+    def unsubscribe(self, start: Optional[int] = None, length: Optional[int] = None):
+        """Отменить подписку на диапазон (без аргументов - на все)"""
+        if start is None:
+            self.subscriptions = []
+            self._shadow = {}
+            return
+        key = (start, start + (length or 0))
+        if key in self._shadow:
+            self.subscriptions.remove(key)
+            del self._shadow[key]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Полное состояние регистров, флагов и подписанных ячеек (точка отсчета дельт)"""
+        self.bind(self.emulator)
+        message = self.delta(None)
+        message["type"] = "snapshot"
+        return message
+
+    def delta(self, phase: Optional[str], **extra) -> Dict[str, Any]:
+        """Изменения с прошлой дельты"""
+        processor = self.emulator.processor
+        cpu = processor.processor
+        ram = processor.memory.ram
+        history = processor.memory.history
+
+        registers = {}
+        for name in DELTA_REGISTERS:
+            value = getattr(cpu, name)
+            if self._registers.get(name, _MISSING) != value:
+                registers[name] = value
+                self._registers[name] = value
+        flags = {}
+        for name, value in processor.get_flags().items():
+            if self._flags.get(name) != value:
+                flags[name] = value
+                self._flags[name] = value
+
+        # Записи в RAM новых записей истории (пошаговый режим)
+        writes = []
+        if len(history) < self._history_length:
+            self._history_length = 0
+        for index in range(max(self._history_length, history.start), len(history)):
+            writes.extend([addr, new] for addr, _, new in history.writes(index))
+        self._history_length = len(history)
+
+        self.seq += 1
+        message = {
+            "type": "delta",
+            "seq": self.seq,
+            "phase": phase,
+            "registers": registers,
+            "flags": flags,
+            "writes": writes,
+            "ram": self._changed_cells(ram),
+        }
+        message.update(extra)
+        return message
+
+    def _changed_cells(self, ram) -> List[List[int]]:
+        """Изменившиеся подписанные ячейки: [[адрес, значение], ...]"""
+        if ram is not self._ram:
+            # Новая RAM (сброс процессора): сравниваются все подписанные ячейки
+            pages = None
+        else:
+            pages = set(ram.pages_changed_since(self._ram_version))
+        self._ram = ram
+        self._ram_version = ram.version
+        if pages is not None and not pages:
+            return []
+
+        changed = []
+        shift = ram.PAGE_SHIFT
+        size = len(ram)
+        for key in self.subscriptions:
+            start, stop = key
+            shadow = self._shadow[key]
+            for address in range(start, stop):
+                if pages is not None and (address >> shift) not in pages:
+                    continue
+                value = ram[address] if address < size else 0
+                if shadow[address - start] != value:
+                    shadow[address - start] = value
+                    changed.append([address, value])
+        return changed
+
+    def _read(self, start: int, stop: int) -> List[int]:
+        ram = self.emulator.processor.memory.ram
+        values = list(ram[start:min(stop, len(ram))])
+        return values + [0] * (stop - start - len(values))
+
+
+def handle_command(emulator: RISCEmulator, tracker: DeltaTracker, message: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Выполнить команду клиента и вернуть сообщения для отправки
+
+    Команды: step (count фаз), run (max_steps фаз, без истории), reset,
+    state, subscribe/unsubscribe (start, length).
+    """
+    if tracker.emulator is not emulator:
+        tracker.bind(emulator)
+    command = message.get("cmd")
+    processor = emulator.processor
+
+    if command == "step":
+        count = int(message.get("count", 1))
+        if not 1 <= count <= MAX_STEPS_PER_COMMAND:
+            raise Exception(f"Invalid step count: {count}")
+        messages = []
+        for _ in range(count):
+            result = emulator.advance_step()
+            if not result["success"]:
+                raise Exception(result["message"])
+            phase = processor.memory.history.last_phase()
+            messages.append(tracker.delta(phase, continues=result["continues"]))
+            if not result["continues"] or processor.cancel_requested():
+                break
+        return messages
+    if command == "run":
+        max_steps = int(message.get("max_steps", 1000))
+        summary = processor.run(max_instructions=max_steps // 3)
+        return [tracker.delta(None, continues=not processor.processor.is_halted, summary=summary)]
+    if command == "reset":
+        emulator.reset()
+        return [tracker.snapshot()]
+    if command == "state":
+        return [tracker.snapshot()]
+    if command == "subscribe":
+        return [tracker.subscribe(int(message["start"]), int(message["length"]))]
+    if command == "unsubscribe":
+        start = message.get("start")
+        tracker.unsubscribe(None if start is None else int(start), message.get("length"))
+        return [{"type": "unsubscribed", "subscriptions": [[a, b - a] for a, b in tracker.subscriptions]}]
+    raise Exception(f"Unknown command: {command}")
@@ -1,22 +1,30 @@
 """
 Эмулятор одноадресного RISC процессора с архитектурой Фон-Неймана
 """
-from typing import List, Dict, Optional, Any
-from .processor import RISCProcessor
+import threading
+from typing import List, Dict, Optional, Any, Iterable
+from .processor import RISCProcessor, resolve_state_sections
 from .assembler import RISCAssembler
 from .tasks import TaskManager
-from .models import EmulatorState, ProcessorState, MemoryState
+from .wire import encode_state
+from .history import DEFAULT_HISTORY_CAPACITY, DEFAULT_SUMMARY_CAPACITY
+from .writes import DEFAULT_WRITE_INDEX_CAPACITY
+from .models import EmulatorState, ProcessorState
 from .processor import RISCProcessor
 
 class RISCEmulator:
     """Эмулятор одноадресного RISC процессора"""
     
-    def __init__(self, memory_size: int = 8192):
-        self.processor = RISCProcessor(memory_size)
+    def __init__(self, memory_size: int = 8192, history_capacity: Optional[int] = DEFAULT_HISTORY_CAPACITY,
+                 summary_capacity: Optional[int] = DEFAULT_SUMMARY_CAPACITY,
+                 write_index_capacity: Optional[int] = DEFAULT_WRITE_INDEX_CAPACITY):
+        self.processor = RISCProcessor(memory_size, history_capacity, summary_capacity, write_index_capacity)
         self.assembler = RISCAssembler()
         self.task_manager = TaskManager()
         self.current_task = None
         self._task_data_write_index = 0  # Счетчик для постепенной записи данных задач
+        # Блокировка эмулятора: запросы одной сессии выполняются по очереди
+        self.lock = threading.RLock()
 
     def reset(self):
         """Сброс эмулятора в начальное состояние"""
@@ -49,6 +57,69 @@ class RISCEmulator:
             return True
             return False
     
+    def set_fetch_mode(self, fetch_from_ram: bool, code_base: int = 0x0000) -> Dict[str, Any]:
+        """Переключить выборку команд: из compiled_code или из RAM (режим фон Неймана)
+        
+        Загруженная программа перезагружается в новом режиме (регистры и история сбрасываются).
+        """
+        try:
+            if not 0 <= code_base <= 0xFFFF:
+                raise Exception(f"Invalid code base address: {code_base}")
+            self.processor.fetch_from_ram = fetch_from_ram
+            self.processor.code_base = code_base
+            if self.processor.compiled_code:
+                self.processor.load_program(self.processor.compiled_code, self.processor.source_code)
+            return {
+                "success": True,
+                "fetch_from_ram": fetch_from_ram,
+                "code_base": code_base,
+                "code_range": self.processor.code_range(),
+                "message": "Fetch mode updated",
+                "state": self.get_state()
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "message": f"Fetch mode error: {str(e)}"
+            }
+    
+    def seek(self, position: int) -> Dict[str, Any]:
+        """Перейти к состоянию после position выполненных команд (по контрольным точкам)"""
+        try:
+            result = self.processor.seek(position)
+            return {
+                "success": True,
+                **result,
+                "timeline": self.processor.timeline.stats(),
+                "state": self.get_state(),
+                "message": f"Moved to instruction {result['position']}"
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "message": f"Seek error: {str(e)}"
+            }
+    
+    def step_back(self, count: int = 1) -> Dict[str, Any]:
+        """Вернуться на count команд назад"""
+        try:
+            result = self.processor.step_back(count)
+            return {
+                "success": True,
+                **result,
+                "timeline": self.processor.timeline.stats(),
+                "state": self.get_state(),
+                "message": f"Moved back to instruction {result['position']}"
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "message": f"Step back error: {str(e)}"
+            }
+    
     def _encode_instruction_to_machine_code(self, instruction_line: str, labels: Dict[str, int] = None) -> int:
         """Кодирование инструкции в машинный код для записи в RAM (одноадресная архитектура)"""
         from .models import AddressingMode
@@ -103,6 +174,11 @@ class RISCEmulator:
         if not self.processor.compiled_code:
             return
         
+        if self.processor.fetch_from_ram:
+            # В режиме фон Неймана программа уже записана в RAM в исполняемом формате (install_code)
+            print(f"DEBUG _write_program_to_ram: Режим фон Неймана, код уже в RAM с адреса 0x{self.processor.code_base:04X}")
+            return
+        
         # Получаем метки из ассемблера
         compile_result = self.compile_code(self.processor.source_code)
         labels = compile_result.get("labels", {}) if compile_result.get("success") else {}
@@ -119,14 +195,10 @@ class RISCEmulator:
         
         # Убеждаемся, что RAM достаточно большая
         required_size = start_address + total_size + 1
-        if not self.processor.memory.ram or len(self.processor.memory.ram) < required_size:
-            new_ram = list(self.processor.memory.ram) if self.processor.memory.ram else [0] * required_size
-            while len(new_ram) < required_size:
-                new_ram.append(0)
-            self.processor.memory.ram = new_ram
+        new_ram = self.processor.memory.ram
+        new_ram.ensure_size(required_size)
         
-        # Записываем команды в RAM
-        new_ram = list(self.processor.memory.ram)
+        # Записываем команды в RAM (на месте)
         current_addr = start_address
         for instruction_line in self.processor.compiled_code:
             machine_code = self._encode_instruction_to_machine_code(instruction_line, labels)
@@ -146,7 +218,6 @@ class RISCEmulator:
                 print(f"DEBUG _write_program_to_ram: Записана 16-битная команда '{instruction_line}' -> 0x{machine_code:04X} по адресу 0x{current_addr:04X}")
                 current_addr += 1
         
-        self.processor.memory.ram = new_ram
         print(f"DEBUG _write_program_to_ram: Записано {len(self.processor.compiled_code)} команд в RAM начиная с адреса 0x{start_address:04X}, занято {total_size} ячеек памяти")
     
     def load_task(self, task_id: int) -> Dict[str, Any]:
@@ -161,9 +232,7 @@ class RISCEmulator:
         
         try:
             # Сбрасываем процессор (но НЕ память - данные задачи должны сохраниться)
-            # Сохраняем текущую память перед сбросом
-            saved_ram = list(self.processor.memory.ram) if self.processor.memory.ram else []
-            saved_ram_size = len(saved_ram) if saved_ram else self.processor.memory_size
+            ram = self.processor.memory.ram
             
             # Сбрасываем только процессор, но НЕ память
             # Вместо полного reset, сбрасываем только состояние процессора
@@ -171,33 +240,22 @@ class RISCEmulator:
             self.processor.processor.accumulator = 0
             self.processor.processor.program_counter = 0
             self.processor.processor.is_halted = False
-            self.processor.processor.flags = {
-                "zero": False,
-                "carry": False,
-                "overflow": False,
-                "negative": False
-            }
+            self.processor.set_flags(0)
             self.processor.processor.cycles = 0
-            self.processor.memory.history = []
+            self.processor.memory.history.clear()
             
             # Сбрасываем промежуточные переменные для системы фаз выполнения
             self.processor._current_instruction_line = None
             self.processor._current_instruction = None
             self.processor._current_operands = None
             
-            # Восстанавливаем память (гарантируем достаточный размер)
-            if saved_ram and len(saved_ram) >= 0x0101:
-                # Создаем новый список для Pydantic
-                self.processor.memory.ram = list(saved_ram)
-            else:
+            # Гарантируем достаточный размер памяти
+            if len(ram) < 0x0101:
                 # Если память пустая или недостаточного размера, создаем новую
-                min_size = max(saved_ram_size, 0x0200)  # Минимум до 0x0200
+                min_size = max(len(ram) or self.processor.memory_size, 0x0200)  # Минимум до 0x0200
                 self.processor.memory.ram = [0] * min_size
                 print(f"DEBUG load_task: Создана новая память размером {min_size}")
             
-            # Сохраняем память перед загрузкой программы
-            ram_before_load_program = list(self.processor.memory.ram) if self.processor.memory.ram else []
-            
             # Загружаем программу задачи (это НЕ сбрасывает память, только регистры и историю)
             self.load_program(task["program"])
             
@@ -205,13 +263,6 @@ class RISCEmulator:
             if task_id == 2:
                 self._write_program_to_ram(start_address=0x0000)
             
-            # Восстанавливаем память после load_program (на всякий случай)
-            # НО для задачи 2 не восстанавливаем, так как мы только что записали команды
-            if task_id != 2:
-                if ram_before_load_program and len(ram_before_load_program) > 0:
-                    self.processor.memory.ram = ram_before_load_program
-                    print(f"DEBUG load_task: Память восстановлена после load_program, length={len(self.processor.memory.ram)}")
-            
             # Настраиваем данные задачи (ВАЖНО: после load_program, чтобы память не сбросилась)
             # Для задач 1 и 2 НЕ записываем данные сразу - они будут записываться постепенно в execute_step
             if task_id == 1 or task_id == 2:
@@ -224,18 +275,10 @@ class RISCEmulator:
                         expected_data = [size] + elements
                         required_size = 0x0100 + len(expected_data) + 1
                         # Расширяем память до нужного размера
-                        if len(self.processor.memory.ram) < required_size:
-                            new_ram = list(self.processor.memory.ram) if self.processor.memory.ram else [0] * required_size
-                            while len(new_ram) < required_size:
-                                new_ram.append(0)
-                            self.processor.memory.ram = new_ram
+                        ram.ensure_size(required_size)
                         # Очищаем область данных задачи (0x0100 и далее)
-                        new_ram = list(self.processor.memory.ram)
                         for i in range(len(expected_data)):
-                            addr = 0x0100 + i
-                            if addr < len(new_ram):
-                                new_ram[addr] = 0
-                        self.processor.memory.ram = new_ram
+                            ram[0x0100 + i] = 0
                     elif task_id == 2:
                         size_a = test_data[0]
                         a_vals = test_data[1:1 + size_a]
@@ -243,22 +286,12 @@ class RISCEmulator:
                         b_vals = test_data[2 + size_a:2 + size_a + size_b]
                         required_size = max(0x020A, 0x030A) + 2
                         # Расширяем память до нужного размера
-                        if len(self.processor.memory.ram) < required_size:
-                            new_ram = list(self.processor.memory.ram) if self.processor.memory.ram else [0] * required_size
-                            while len(new_ram) < required_size:
-                                new_ram.append(0)
-                            self.processor.memory.ram = new_ram
+                        ram.ensure_size(required_size)
                         # Очищаем область данных задачи (0x0200-0x020A и 0x0300-0x030A)
-                        new_ram = list(self.processor.memory.ram)
                         for i in range(size_a + 1):
-                            addr = 0x0200 + i
-                            if addr < len(new_ram):
-                                new_ram[addr] = 0
+                            ram[0x0200 + i] = 0
                         for i in range(size_b + 1):
-                            addr = 0x0300 + i
-                            if addr < len(new_ram):
-                                new_ram[addr] = 0
-                        self.processor.memory.ram = new_ram
+                            ram[0x0300 + i] = 0
                 # Сбрасываем счетчик для постепенной записи
                 self._task_data_write_index = 0
             else:
@@ -280,13 +313,50 @@ class RISCEmulator:
                 "message": f"Error loading task {task_id}: {str(e)}"
             }
     
-    def execute_step(self) -> Dict[str, Any]:
-        """Выполнение одного шага программы"""
+    def execute_step(self, history_from: int = 0,
+                     sections: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Выполнение одного шага программы
+        
+        history_from и sections - см. RISCProcessor.get_state. Если полная RAM
+        не запрошена, в результат добавляются ячейки, записанные за шаг
+        (writes: [[адрес, значение], ...]), и размер RAM (ram_size): клиент
+        обновляет по ним свою копию памяти. Записанные ячейки берутся из
+        журнала истории; если за шаг в RAM писали в обход журнала (счетчик
+        записей PagedRAM ушел дальше журнала, изменился размер памяти или
+        история очищена), RAM передается полностью.
+        """
+        sections = resolve_state_sections(sections)
+        memory = self.processor.memory
+        ram, history = memory.ram, memory.history
+        generation, offset = history.generation, history.write_count
+        ram_version, ram_size = ram.version, len(ram)
+        
+        result = self.advance_step()
+        if result["success"]:
+            writes = None
+            if 'ram' not in sections:
+                journaled = history.write_count - offset
+                if memory.ram is ram and memory.history is history and history.generation == generation \
+                        and len(ram) == ram_size and ram.version - ram_version == journaled:
+                    writes = [[address, ram[address]] for address in history.cells_written_since(offset)]
+                else:
+                    sections = sections | {'ram'}
+            result["state"] = self.get_state(history_from, sections)
+            if writes is not None:
+                result["writes"] = writes
+                result["ram_size"] = len(ram)
+        return result
+    
+    def advance_step(self) -> Dict[str, Any]:
+        """Выполнение одного шага программы без сериализации состояния
+        
+        Выполняет одну фазу и постепенную запись данных задачи; execute_step
+        добавляет к результату состояние.
+        """
         try:
             if self.processor.processor.is_halted:
                 return {
                     "success": True,
-                    "state": self.get_state(),
                     "continues": False,
                     "message": "Program is halted"
                 }
@@ -295,27 +365,20 @@ class RISCEmulator:
             continues = self.processor.step()
             
             # Определяем фазу, которая только что отработала
-            last_history = self.processor.memory.history[-1] if self.processor.memory.history else None
-            last_phase = last_history.get("execution_phase") if isinstance(last_history, dict) else None
+            last_phase = self.processor.memory.history.last_phase()
             
             # Данные задач пишем ТОЛЬКО после фазы execute первой команды
             if last_phase != "execute":
                 return {
                     "success": True,
-                    "state": self.get_state(),
                     "continues": continues,
                     "message": "Step executed successfully"
                 }
             
-            # Удобная функция для обновления последней записи истории RAM,
+            # Удобная функция для дописывания записи в последнюю запись истории,
             # чтобы frontend видел актуальное состояние для hex/dex сразу после записи
-            def _update_history_ram(new_ram_snapshot: list):
-                if self.processor.memory.history:
-                    entry = self.processor.memory.history[-1]
-                    if isinstance(entry, dict):
-                        entry["ram_after"] = list(new_ram_snapshot)
-                        entry["ram"] = list(new_ram_snapshot)
-                        self.processor.memory.history[-1] = entry
+            def _update_history_ram(addr: int, old_value: int, ram):
+                self.processor.memory.history.record_write(addr, old_value, ram[addr], ram)
             
             # Для задач 1 и 2: записываем данные в память постепенно, по одному элементу за execute
             if self.current_task == 1:
@@ -330,21 +393,17 @@ class RISCEmulator:
                         
                         # Вычисляем требуемый размер памяти
                         required_size = 0x0100 + len(expected_data) + 1
-                        if not self.processor.memory.ram or len(self.processor.memory.ram) < required_size:
-                            new_ram = list(self.processor.memory.ram) if self.processor.memory.ram else [0] * required_size
-                            while len(new_ram) < required_size:
-                                new_ram.append(0)
-                            self.processor.memory.ram = new_ram
+                        new_ram = self.processor.memory.ram
+                        new_ram.ensure_size(required_size)
                         
-                        # Записываем данные постепенно: индекс показывает, сколько элементов уже записано
+                        # Записываем данные постепенно (на месте): индекс показывает, сколько элементов уже записано
                         if self._task_data_write_index < len(expected_data):
-                            new_ram = list(self.processor.memory.ram)
                             addr = 0x0100 + self._task_data_write_index
                             if addr < len(new_ram):
+                                old_value = new_ram[addr]
                                 new_ram[addr] = int(expected_data[self._task_data_write_index]) & 0xFFFF
                                 print(f"DEBUG execute_step: Записано значение {expected_data[self._task_data_write_index]} (0x{expected_data[self._task_data_write_index]:04X}) по адресу 0x{addr:04X} (элемент {self._task_data_write_index + 1}/{len(expected_data)})")
-                                self.processor.memory.ram = new_ram
-                                _update_history_ram(new_ram)
+                                _update_history_ram(addr, old_value, new_ram)
                                 self._task_data_write_index += 1
                                 print(f"DEBUG execute_step: Данные задачи 1: записан элемент {self._task_data_write_index}/{len(expected_data)}")
             
@@ -367,16 +426,11 @@ class RISCEmulator:
                         
                         # Вычисляем требуемый размер памяти
                         required_size = max(0x020A, 0x030A) + 2
-                        if not self.processor.memory.ram or len(self.processor.memory.ram) < required_size:
-                            new_ram = list(self.processor.memory.ram) if self.processor.memory.ram else [0] * required_size
-                            while len(new_ram) < required_size:
-                                new_ram.append(0)
-                            self.processor.memory.ram = new_ram
+                        new_ram = self.processor.memory.ram
+                        new_ram.ensure_size(required_size)
                         
-                        # Записываем данные постепенно: один элемент за execute
+                        # Записываем данные постепенно (на месте): один элемент за execute
                         if self._task_data_write_index < total_elements:
-                            new_ram = list(self.processor.memory.ram)
-                            
                             # Определяем адрес для записи
                             if self._task_data_write_index == 0:
                                 # Первый элемент - размер массива A (0x0200)
@@ -394,6 +448,7 @@ class RISCEmulator:
                             
                             if addr < len(new_ram):
                                 value = task_data_sequence[self._task_data_write_index]
+                                old_value = new_ram[addr]
                                 new_ram[addr] = int(value) & 0xFFFF
                                 
                                 # Определяем тип элемента для лога
@@ -407,14 +462,12 @@ class RISCEmulator:
                                     elem_type = f"B[{self._task_data_write_index - size_a - 2}]"
                                 
                                 print(f"DEBUG execute_step: Записано значение {value} (0x{value:04X}) по адресу 0x{addr:04X} ({elem_type}, элемент {self._task_data_write_index + 1}/{total_elements})")
-                                self.processor.memory.ram = new_ram
-                                _update_history_ram(new_ram)
+                                _update_history_ram(addr, old_value, new_ram)
                                 self._task_data_write_index += 1
                                 print(f"DEBUG execute_step: Данные задачи 2: записан элемент {self._task_data_write_index}/{total_elements}")
             
             return {
                 "success": True,
-                "state": self.get_state(),
                 "continues": continues,
                 "message": "Step executed successfully"
             }
@@ -425,23 +478,40 @@ class RISCEmulator:
                 "message": f"Execution error: {str(e)}"
             }
     
-    def execute_program(self, source_code: str = None, max_steps: int = 1000) -> Dict[str, Any]:
-        """Выполнение всей программы"""
+    def execute_program(self, source_code: str = None, max_steps: int = 1000, trace: bool = False) -> Dict[str, Any]:
+        """Выполнение всей программы
+        
+        Args:
+            source_code: Исходный код (если не указан, выполняется загруженная программа)
+            max_steps: Ограничение в фазах (одна команда = fetch + decode + execute)
+            trace: True - пофазное выполнение с историей, False - быстрый режим без истории
+        """
         try:
             if source_code:
                 self.load_program(source_code)
             
-            steps = 0
-            while steps < max_steps and not self.processor.processor.is_halted:
-                self.processor.step()
-                steps += 1
+            if trace:
+                steps = 0
+                while steps < max_steps and not self.processor.processor.is_halted:
+                    if self.processor.cancel_requested():
+                        break
+                    self.processor.step()
+                    steps += 1
+                summary = None
+            else:
+                # Быстрый режим: целые команды, без записи истории фаз
+                summary = self.processor.run(max_instructions=max_steps // 3)
+                steps = summary["phases"]
             
-            return {
+            result = {
                 "success": True,
                 "state": self.get_state(),
                 "steps_executed": steps,
                 "message": f"Program executed in {steps} steps"
             }
+            if summary is not None:
+                result["summary"] = summary
+            return result
         except Exception as e:
             return {
                 "success": False,
@@ -449,9 +519,66 @@ class RISCEmulator:
                 "message": f"Execution error: {str(e)}"
             }
     
-    def get_state(self) -> Dict[str, Any]:
-        """Получение текущего состояния эмулятора"""
-        return self.processor.get_state()
+    def get_state(self, history_from: int = 0,
+                  sections: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Получение текущего состояния эмулятора (параметры - см. RISCProcessor.get_state)"""
+        return self.processor.get_state(history_from, sections)
+    
+    def get_state_binary(self) -> bytes:
+        """Состояние эмулятора в компактном двоичном формате (см. wire.py)"""
+        return encode_state(self.processor)
+    
+    def state_etag(self) -> str:
+        """ETag текущей версии состояния"""
+        return self.processor.state_etag()
+    
+    def get_state_diff(self, since: int) -> Dict[str, Any]:
+        """Изменения состояния с версии since"""
+        return self.processor.get_state_diff(since)
+    
+    def get_memory(self, start: int = 0, length: Optional[int] = None) -> Dict[str, Any]:
+        """Окно RAM"""
+        try:
+            return {"success": True, **self.processor.get_memory(start, length)}
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "message": f"Memory read error: {str(e)}"
+            }
+    
+    def get_history(self, start: int = 0, limit: int = 100, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Страница истории выполнения с выбранными полями"""
+        try:
+            return {"success": True, **self.processor.get_history(start, limit, fields)}
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "message": f"History read error: {str(e)}"
+            }
+    
+    def replay_history(self, start: int, limit: int = 100, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """История фаз окна команд, восстановленная повтором от контрольной точки"""
+        try:
+            return {"success": True, **self.processor.replay_history(start, limit, fields)}
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "message": f"History replay error: {str(e)}"
+            }
+    
+    def get_writes(self, address: int, before: Optional[int] = None, limit: int = 1) -> Dict[str, Any]:
+        """Записи в ячейку RAM (индекс записей истории)"""
+        try:
+            return {"success": True, **self.processor.get_writes(address, before, limit)}
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "message": f"Write index error: {str(e)}"
+            }
     
     def get_tasks(self) -> List[Dict[str, Any]]:
         """Получение списка задач"""
@@ -0,0 +1,95 @@
+"""
+Выполнение работы эмулятора вне цикла событий asyncio
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from .emulator import RISCEmulator
+
+
+class ExecutorBusy(Exception):
+    """Очередь исполнителя заполнена"""
+
+
+class ExecutionTimeout(Exception):
+    """Работа не уложилась в отведенное время"""
+
+
+class EmulatorExecutor:
+    """Ограниченный пул потоков для работы с эмуляторами
+
+    Каждая задача выполняется в потоке пула под блокировкой своего эмулятора
+    (запросы одной сессии идут по очереди, разных сессий - параллельно).
+    Задач в работе и в очереди не больше max_pending, остальные сразу
+    отклоняются (ExecutorBusy). Если задача не уложилась в timeout секунд,
+    ожидающий запрос получает ExecutionTimeout, а сама задача останавливается
+    кооперативно: еще не начатая не запускается, а RISCProcessor.run()
+    проверяет признак отмены на границах отрезков выполнения.
+    """
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 64, timeout: float = 10.0):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="emulator")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    async def submit(self, emulator: RISCEmulator, func: Callable[..., Any], *args,
+                     timeout: float = None) -> Any:
+        """Выполнить func(*args) в пуле под блокировкой эмулятора и дождаться результата"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise ExecutorBusy(f"Executor queue is full ({self.max_pending} tasks)")
+            self._pending += 1
+
+        cancel = threading.Event()
+        future = self._pool.submit(self._call, emulator, cancel, func, args)
+        future.add_done_callback(self._done)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            cancel.set()
+            with self._lock:
+                self.timed_out += 1
+            raise ExecutionTimeout(f"Execution timed out after {timeout or self.timeout} s")
+
+    def shutdown(self):
+        """Остановить пул (начатые задачи отменяются кооперативно)"""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        """Статистика исполнителя"""
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "timeout": self.timeout,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+            }
+
+    @staticmethod
+    def _call(emulator: RISCEmulator, cancel: threading.Event, func: Callable[..., Any], args: tuple) -> Any:
+        with emulator.lock:
+            if cancel.is_set():
+                raise ExecutionTimeout("Execution cancelled before start")
+            processor = emulator.processor
+            processor.cancel_check = cancel.is_set
+            try:
+                return func(*args)
+            finally:
+                processor.cancel_check = None
+
+    def _done(self, _future):
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
@@ -0,0 +1,31 @@
+"""
+Флаги процессора: упакованная битовая маска и виды операций для ленивого вычисления
+"""
+from typing import Dict
+
+# Флаги процессора, упакованные в битовую маску
+FLAG_ZERO = 0x1
+FLAG_CARRY = 0x2
+FLAG_OVERFLOW = 0x4
+FLAG_NEGATIVE = 0x8
+FLAG_BITS = (('zero', FLAG_ZERO), ('carry', FLAG_CARRY), ('overflow', FLAG_OVERFLOW), ('negative', FLAG_NEGATIVE))
+
+# Виды операций, от которых зависит вычисление флагов C и V
+FLAGS_ADD = 0      # Сложение: C - перенос из 16 бит, V - результат меньше операнда
+FLAGS_SUB = 1      # Вычитание и сравнение: C = V = заем (ACC < operand)
+FLAGS_LOGIC = 2    # Остальные операции: C = V = 0
+FLAG_KINDS = {"add": FLAGS_ADD, "sub": FLAGS_SUB, "cmp": FLAGS_SUB}
+
+
+def flags_to_dict(bits: int) -> Dict[str, bool]:
+    """Битовая маска флагов -> словарь {'zero': ..., 'carry': ..., ...}"""
+    return {name: bool(bits & bit) for name, bit in FLAG_BITS}
+
+
+def flags_from_dict(flags: Dict[str, bool]) -> int:
+    """Словарь флагов -> битовая маска"""
+    bits = 0
+    for name, bit in FLAG_BITS:
+        if flags.get(name, False):
+            bits |= bit
+    return bits
@@ -0,0 +1,648 @@
+"""
+История выполнения процессора с дельта-кодированием RAM
+"""
+import json
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple, Sequence
+
+from .flags import flags_from_dict, flags_to_dict
+from .writes import DEFAULT_WRITE_INDEX_CAPACITY, WriteIndex
+
+# Поля полной записи истории с копиями RAM (восстанавливаются по журналу записей)
+HISTORY_RAM_FIELDS = ('ram', 'ram_before', 'ram_after')
+
+# Поля записи истории (порядок ключей словаря записи)
+ENTRY_FIELDS = ('command', 'instruction', 'operands', 'execution_phase',
+                'registers_before', 'registers_after', 'registers',
+                'flags_before', 'flags_after', 'flags',
+                'programCounter', 'programCounter_before', 'programCounter_after',
+                'instruction_register', 'instruction_register_asm')
+
+# Фазы выполнения: код фазы в столбце phase - индекс в PHASES
+PHASES = (None, 'fetch', 'decode', 'execute')
+
+# Столбцы истории (имя, тип array). flags: флаги до фазы - биты 0-3, после - биты 4-7;
+# command, instruction, operands, ir_asm - номера в таблицах строк и списков операндов
+COLUMNS = (('pc_before', 'I'), ('pc_after', 'I'), ('acc_before', 'H'), ('acc_after', 'H'),
+           ('ir', 'H'), ('flags', 'B'), ('phase', 'B'),
+           ('command', 'I'), ('instruction', 'I'), ('operands', 'I'), ('ir_asm', 'I'))
+
+# Емкость истории по умолчанию: подробные записи (фазы) и сводки фаз execute
+DEFAULT_HISTORY_CAPACITY = 4096
+DEFAULT_SUMMARY_CAPACITY = 16384
+
+# Число записей, по которым оценивается средний объем записи (bytes_retained)
+SIZE_SAMPLE = 32
+
+_json = json.JSONEncoder(ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+
+_PHASE_CODES = {phase: code for code, phase in enumerate(PHASES)}
+_PHASE_JSON = [_json.encode(phase) for phase in PHASES]
+_FLAG_DICTS = [flags_to_dict(bits) for bits in range(16)]
+_FLAGS_JSON = [_json.encode(flags) for flags in _FLAG_DICTS]
+_FLAG_CODES = {tuple(flags.items()): bits for bits, flags in enumerate(_FLAG_DICTS)}
+_BLANK_ROW = (0,) * len(COLUMNS)
+
+
+def _size_of(entry: Dict[str, Any]) -> int:
+    """Объем записи (словаря) в памяти (байт)
+
+    Учитываются словарь, его значения и содержимое вложенных списков и
+    словарей (регистры, операнды, флаги); ключи - общие строки, не считаются.
+    """
+    size = sys.getsizeof(entry)
+    for value in entry.values():
+        size += sys.getsizeof(value)
+        if isinstance(value, dict):
+            size += sum(sys.getsizeof(item) for item in value.values())
+        elif isinstance(value, list):
+            size += sum(sys.getsizeof(item) for item in value)
+    return size
+
+
+def _sampled_size(entries: List[Dict[str, Any]]) -> int:
+    """Оценка объема записей по SIZE_SAMPLE равномерно выбранным записям"""
+    if not entries:
+        return 0
+    step = max(len(entries) // SIZE_SAMPLE, 1)
+    sample = entries[::step]
+    return sum(_size_of(entry) for entry in sample) * len(entries) // len(sample)
+
+
+def _is_uint(value: Any, limit: int) -> bool:
+    return type(value) is int and 0 <= value <= limit
+
+
+class ExecutionHistory:
+    """История фаз выполнения (fetch/decode/execute)
+
+    Вместо полной копии RAM в каждой записи хранится общий журнал записей
+    в память (адрес, старое значение, новое значение). Каждая запись истории
+    помнит только смещение конца своего участка журнала. Для быстрого
+    восстановления RAM периодически сохраняются базовые снимки памяти:
+    новый снимок делается, когда с момента предыдущего в журнал попало
+    snapshot_interval записей. Поэтому объем истории растет с числом
+    записей в память, а не с числом шагов × размер памяти.
+
+    Записи хранятся по столбцам (COLUMNS): PC, ACC до/после и IR - массивы
+    чисел, флаги до/после - байт на запись, фаза - код, строки команды и
+    операнды - номера в таблицах, общих для всей истории (история
+    очищается при загрузке программы, поэтому таблицы - на программу).
+    Запись занимает десятки байт вместо нескольких килобайт словаря;
+    словарь записи (ENTRY_FIELDS) собирается только по запросу, а выборка
+    диапазона - срезы столбцов (records, column, fragments). Запись, которая
+    не укладывается в столбцы (другой набор полей или типы значений),
+    хранится словарем как есть.
+
+    Объем истории ограничен по уровням. Подробно хранятся не меньше capacity
+    последних записей; когда их становится больше на четверть capacity,
+    самые старые вытесняются пачкой: фазы execute переходят в сводки
+    (_summarize: команда, аккумулятор, PC и флаги после фазы, записи в
+    память), fetch/decode отбрасываются.
+    Сводок хранится не больше summary_capacity, более старые удаляются.
+    Участок журнала вытесненных записей отбрасывается, а базовый снимок RAM
+    переносится на границу подробных записей; состояние до нее остается
+    доступным через контрольные точки процессора (CheckpointTimeline).
+    capacity/summary_capacity = None - без ограничения.
+
+    Индексы записей абсолютные: номер фазы с последней очистки истории.
+    len() - число всех добавленных записей, start - индекс самой старой
+    подробной записи; записи до start доступны только как сводки.
+
+    Записи в память дополнительно попадают в индекс по адресам
+    (write_index, см. WriteIndex): он не вытесняется вместе с подробными
+    записями и ограничен своей емкостью write_index_capacity.
+    """
+
+    def __init__(self, snapshot_interval: int = 256, capacity: Optional[int] = DEFAULT_HISTORY_CAPACITY,
+                 summary_capacity: Optional[int] = DEFAULT_SUMMARY_CAPACITY,
+                 write_index_capacity: Optional[int] = DEFAULT_WRITE_INDEX_CAPACITY):
+        if capacity is not None and capacity < 1:
+            raise Exception(f"Invalid history capacity: {capacity}")
+        if summary_capacity is not None and summary_capacity < 0:
+            raise Exception(f"Invalid history summary capacity: {summary_capacity}")
+        self.snapshot_interval = snapshot_interval
+        self.capacity = capacity
+        self.summary_capacity = summary_capacity
+        self.generation = 0  # Число очисток истории (записи нумеруются заново)
+        self.write_index = WriteIndex(write_index_capacity)
+        self.clear()
+
+    def clear(self):
+        """Очистить историю"""
+        self.generation += 1
+        self.write_index.clear()
+        self._start = 0               # Индекс первой подробной записи
+        self._columns: Dict[str, array] = {name: array(code) for name, code in COLUMNS}
+        self._column_list = [self._columns[name] for name, _ in COLUMNS]
+        self._irregular: Dict[int, Dict[str, Any]] = {}  # Записи вне схемы столбцов (по индексу)
+        self._strings: List[str] = []        # Таблица строк (команды, инструкции, IR asm)
+        self._string_ids: Dict[str, int] = {}
+        self._string_json: List[str] = []    #   их JSON
+        self._operands: List[Tuple[str, ...]] = []  # Таблица списков операндов
+        self._operand_ids: Dict[Tuple[str, ...], int] = {}
+        self._operand_json: List[str] = []
+        self._ends = array('Q')       # Смещение конца участка журнала для каждой записи
+        self._journal_start = 0       # Смещение первой хранимой записи журнала
+        self._addrs = array('I')      # Журнал записей в RAM: адреса
+        self._old = array('H')        #   значения до записи
+        self._new = array('H')        #   значения после записи
+        self._snapshot_offsets: List[int] = []
+        self._snapshots: List[array] = []  # Компактные копии RAM (array('H'))
+        self._summaries: List[Dict[str, Any]] = []  # Сводки вытесненных фаз execute
+        self._summary_indexes = array('Q')
+        # Метрики вытеснения
+        self.evictions = 0            # Число вытеснений (пачек)
+        self.evicted = 0              # Записей, вытесненных из подробной истории
+        self.summarized = 0           #   из них сохранено в сводках
+        self.summaries_dropped = 0    # Сводок удалено по summary_capacity
+
+    def __len__(self) -> int:
+        return self._start + len(self._ends)
+
+    def __bool__(self) -> bool:
+        return bool(self._ends)
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        """Полная запись истории (с восстановленными ram/ram_before/ram_after)"""
+        return self.materialize(index)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Последовательно восстановить все подробные записи истории"""
+        return self.entries(self._start, len(self))
+
+    @property
+    def start(self) -> int:
+        """Индекс самой старой подробной записи"""
+        return self._start
+
+    def entries(self, start: int, stop: int, with_ram: bool = True) -> Iterator[Dict[str, Any]]:
+        """Подробные записи истории [start, stop) (вытесненные пропускаются)
+
+        RAM восстанавливается один раз для start, дальше к ней
+        последовательно применяется журнал записей. Без with_ram
+        возвращаются записи без ключей ram/ram_before/ram_after.
+        """
+        rows = self.records(start, stop)
+        if not with_ram or not rows:
+            yield from rows
+            return
+        position = max(start, self._start) - self._start
+        offset = self._ends[position - 1] if position > 0 else self._journal_start
+        state = self.ram_at_offset(offset)
+        for row, end in zip(rows, self._ends[position:position + len(rows)]):
+            ram_before = state
+            if end != offset:
+                state = list(state)
+                self._apply(state, offset, end)
+                offset = end
+            yield self._with_ram(row, ram_before, state)
+
+    def records(self, start: int, stop: int, fields: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Словари подробных записей [start, stop) без копий RAM
+
+        Значения полей собираются по срезам столбцов. fields - нужные поля
+        (по умолчанию все поля ENTRY_FIELDS).
+        """
+        lo, hi = self._range(start, stop)
+        if lo >= hi:
+            return []
+        wanted = None if fields is None else set(fields)
+        names = ENTRY_FIELDS if wanted is None else tuple(name for name in ENTRY_FIELDS if name in wanted)
+        if names:
+            values = [self._field_values(name, lo, hi) for name in names]
+            rows = [dict(zip(names, row)) for row in zip(*values)]
+        else:
+            rows = [{} for _ in range(hi - lo)]
+        for index, entry in self._irregular.items():
+            position = index - self._start - lo
+            if 0 <= position < len(rows):
+                rows[position] = {key: value for key, value in entry.items() if wanted is None or key in wanted}
+        return rows
+
+    def column(self, name: str, start: int, stop: int) -> array:
+        """Срез столбца COLUMNS для подробных записей [start, stop)"""
+        lo, hi = self._range(start, stop)
+        return self._columns[name][lo:max(hi, lo)]
+
+    def fragments(self, start: int, stop: int) -> List[str]:
+        """JSON подробных записей [start, stop) без копий RAM
+
+        Собирается по столбцам из готовых JSON строк таблиц, флагов и фаз.
+        """
+        lo, hi = self._range(start, stop)
+        if lo >= hi:
+            return []
+        strings, operands = self._string_json, self._operand_json
+        texts = [
+            f'{{"command":{strings[command]},"instruction":{strings[instruction]},'
+            f'"operands":{operands[ops]},"execution_phase":{_PHASE_JSON[phase]},'
+            f'"registers_before":[{acc_before}],"registers_after":[{acc_after}],"registers":[{acc_after}],'
+            f'"flags_before":{_FLAGS_JSON[flags & 0xF]},"flags_after":{_FLAGS_JSON[flags >> 4]},'
+            f'"flags":{_FLAGS_JSON[flags >> 4]},"programCounter":{pc_after},'
+            f'"programCounter_before":{pc_before},"programCounter_after":{pc_after},'
+            f'"instruction_register":{ir},"instruction_register_asm":{strings[ir_asm]}}}'
+            for pc_before, pc_after, acc_before, acc_after, ir, flags, phase, command, instruction, ops, ir_asm
+            in zip(*(column[lo:hi] for column in self._column_list))
+        ]
+        for index, entry in self._irregular.items():
+            position = index - self._start - lo
+            if 0 <= position < len(texts):
+                texts[position] = _json.encode(entry)
+        return texts
+
+    def summaries(self, start: int, stop: int) -> List[Dict[str, Any]]:
+        """Сводки вытесненных фаз execute с индексами [start, stop)"""
+        lo = bisect_left(self._summary_indexes, start)
+        hi = bisect_left(self._summary_indexes, stop)
+        return self._summaries[lo:hi]
+
+    def append(self, entry: Dict[str, Any], ram: Sequence[int],
+               writes: Sequence[Tuple[int, int, int]] = ()):
+        """Добавить запись истории
+
+        Args:
+            entry: Запись без ключей ram/ram_before/ram_after
+            ram: Текущее состояние RAM (уже после writes)
+            writes: Записи в память, сделанные в этой фазе: (адрес, было, стало)
+        """
+        if not self._snapshots:
+            # Базовый снимок - состояние RAM до первой записи истории
+            base = array('H', ram)
+            for addr, old, _ in reversed(writes):
+                base[addr] = old
+            self._snapshot_offsets.append(self.write_count)
+            self._snapshots.append(base)
+
+        for addr, old, new in writes:
+            self._addrs.append(addr)
+            self._old.append(old & 0xFFFF)
+            self._new.append(new & 0xFFFF)
+
+        row = self._pack(entry)
+        if row is None:
+            self._irregular[len(self)] = entry
+            row = _BLANK_ROW
+        for column, value in zip(self._column_list, row):
+            column.append(value)
+        self._ends.append(self.write_count)
+        if writes:
+            self._index_writes(len(self) - 1, writes)
+        self._maybe_snapshot(ram)
+        if self.capacity is not None and len(self._ends) >= self.capacity + max(self.capacity // 4, 1):
+            self._evict(len(self._ends) - self.capacity)
+
+    def record_write(self, addr: int, old: int, new: int, ram: Sequence[int] = None):
+        """Дописать запись в память к последней записи истории
+
+        Используется для записей, сделанных вне фазы execute (например,
+        постепенная загрузка данных задачи), чтобы они попали в ram_after
+        последней фазы.
+        """
+        if not self._ends:
+            return
+        self._addrs.append(addr)
+        self._old.append(old & 0xFFFF)
+        self._new.append(new & 0xFFFF)
+        self._ends[-1] = self.write_count
+        self._index_writes(len(self) - 1, ((addr, old, new),))
+        if ram is not None:
+            self._maybe_snapshot(ram)
+
+    def get_entry(self, index: int) -> Dict[str, Any]:
+        """Запись истории без восстановления RAM"""
+        index = self._start + self._position(index)
+        return self.records(index, index + 1)[0]
+
+    def fragment(self, index: int) -> str:
+        """JSON записи истории без копий RAM"""
+        index = self._start + self._position(index)
+        return self.fragments(index, index + 1)[0]
+
+    def last_phase(self):
+        """Фаза последней записи истории (или None)"""
+        if not self._ends:
+            return None
+        entry = self._irregular.get(len(self) - 1)
+        if entry is not None:
+            return entry.get('execution_phase')
+        return PHASES[self._columns['phase'][-1]]
+
+    def writes_to(self, address: int, before: Optional[int] = None, limit: int = 1) -> List[Dict[str, Any]]:
+        """Записи в ячейку address, сделанные до фазы before, от новых к старым
+
+        Каждая запись: seq (номер записи в журнале), step (индекс фазы),
+        pc и command (команда фазы), old и new (значения до и после).
+        Записи одной фазы не разделяются (см. WriteIndex.query).
+        """
+        strings = self._strings
+        return [
+            {'seq': seq, 'step': step, 'pc': pc, 'command': strings[command], 'old': old, 'new': new}
+            for seq, step, pc, command, old, new in self.write_index.query(address, before, limit)
+        ]
+
+    def writes(self, index: int) -> List[Tuple[int, int, int]]:
+        """Записи в память, сделанные в фазе с указанным индексом"""
+        start, end = self._bounds(index)
+        start -= self._journal_start
+        end -= self._journal_start
+        return list(zip(self._addrs[start:end], self._old[start:end], self._new[start:end]))
+
+    def ram_before(self, index: int) -> List[int]:
+        """Состояние RAM до фазы с указанным индексом"""
+        return self.ram_at_offset(self._bounds(index)[0])
+
+    def ram_after(self, index: int) -> List[int]:
+        """Состояние RAM после фазы с указанным индексом"""
+        return self.ram_at_offset(self._bounds(index)[1])
+
+    def materialize(self, index: int) -> Dict[str, Any]:
+        """Восстановить полную запись истории по индексу"""
+        start, end = self._bounds(index)
+        ram_before = self.ram_at_offset(start)
+        if end == start:
+            ram_after = ram_before
+        else:
+            ram_after = list(ram_before)
+            self._apply(ram_after, start, end)
+        return self._with_ram(self.get_entry(index), ram_before, ram_after)
+
+    def ram_at_offset(self, offset: int) -> List[int]:
+        """Состояние RAM после применения первых offset записей журнала
+
+        offset отсчитывается с последней очистки истории и должен быть не
+        меньше journal_start (более ранний участок журнала вытеснен).
+        """
+        if not self._snapshots:
+            return []
+        i = max(bisect_right(self._snapshot_offsets, offset) - 1, 0)
+        state = list(self._snapshots[i])
+        self._apply(state, self._snapshot_offsets[i], offset)
+        return state
+
+    @property
+    def write_count(self) -> int:
+        """Число записей в журнале с последней очистки (смещение для cells_written_since)"""
+        return self._journal_start + len(self._addrs)
+
+    @property
+    def journal_start(self) -> int:
+        """Смещение первой хранимой записи журнала (более ранние вытеснены)"""
+        return self._journal_start
+
+    def cells_written_since(self, offset: int) -> List[int]:
+        """Адреса ячеек RAM, записанных после смещения журнала offset (по возрастанию)"""
+        return sorted(set(self._addrs[max(offset - self._journal_start, 0):]))
+
+    def journal(self) -> Tuple[array, array, array, array]:
+        """Журнал записей в RAM: (концы участков подробных записей, адреса, было, стало)
+
+        Концы участков - смещения с последней очистки истории, адреса и
+        значения начинаются со смещения journal_start.
+        """
+        return self._ends, self._addrs, self._old, self._new
+
+    def stats(self) -> Dict[str, int]:
+        """Статистика объема истории и вытеснения"""
+        return {
+            "entries": len(self._ends),
+            "total": len(self),
+            "start": self._start,
+            "summaries": len(self._summaries),
+            "writes": len(self._addrs),
+            "snapshots": len(self._snapshots),
+            "strings": len(self._strings) + len(self._operands),
+            "irregular": len(self._irregular),
+            "indexed_writes": len(self.write_index),
+            "capacity": self.capacity,
+            "summary_capacity": self.summary_capacity,
+            "evictions": self.evictions,
+            "evicted": self.evicted,
+            "summarized": self.summarized,
+            "summaries_dropped": self.summaries_dropped,
+            "bytes": self.bytes_retained(),
+        }
+
+    def bytes_retained(self) -> int:
+        """Оценка объема памяти, занятой историей (байт)
+
+        Столбцы, журнал, индекс записей и снимки RAM считаются точно,
+        таблицы строк - по размеру строк, сводки - по выборке (SIZE_SAMPLE записей).
+        """
+        arrays = self._column_list + [self._ends, self._addrs, self._old, self._new, self._summary_indexes]
+        tables = self._strings + self._string_json + self._operand_json
+        return (sum(len(values) * values.itemsize for values in arrays)
+                + sum(len(snapshot) * snapshot.itemsize for snapshot in self._snapshots)
+                + sum(sys.getsizeof(text) for text in tables)
+                + sum(_size_of(entry) for entry in self._irregular.values())
+                + self.write_index.bytes_retained()
+                + _sampled_size(self._summaries))
+
+    def _index_writes(self, index: int, writes: Iterable[Tuple[int, int, int]]):
+        """Добавить записи в память фазы index в индекс по адресам"""
+        entry = self._irregular.get(index)
+        if entry is None:
+            position = index - self._start
+            pc = self._columns['pc_before'][position]
+            command = self._columns['command'][position]
+        else:
+            pc = entry.get('programCounter_before')
+            pc = pc if type(pc) is int else 0
+            command = self._intern(str(entry.get('command', '')))
+        add = self.write_index.add
+        for addr, old, new in writes:
+            add(index, pc, command, addr, old, new)
+
+    def _pack(self, entry: Dict[str, Any]) -> Optional[Tuple]:
+        """Значения столбцов записи (None - запись не укладывается в столбцы)"""
+        if tuple(entry) != ENTRY_FIELDS:
+            return None
+        registers_before = entry['registers_before']
+        registers_after = entry['registers_after']
+        pc_before = entry['programCounter_before']
+        pc_after = entry['programCounter_after']
+        ir = entry['instruction_register']
+        operands = entry['operands']
+        command = entry['command']
+        instruction = entry['instruction']
+        ir_asm = entry['instruction_register_asm']
+        try:
+            # Флаги - один из 16 словарей flags_to_dict, фаза - из PHASES
+            bits_before = _FLAG_CODES.get(tuple(entry['flags_before'].items()))
+            bits_after = _FLAG_CODES.get(tuple(entry['flags_after'].items()))
+            phase = _PHASE_CODES.get(entry['execution_phase'])
+        except (AttributeError, TypeError):
+            return None
+        if (bits_before is None or bits_after is None or phase is None
+                or entry['flags'] != entry['flags_after']
+                or type(registers_before) is not list or len(registers_before) != 1
+                or type(registers_after) is not list or len(registers_after) != 1
+                or entry['registers'] != registers_after
+                or not _is_uint(registers_before[0], 0xFFFF) or not _is_uint(registers_after[0], 0xFFFF)
+                or not _is_uint(pc_before, 0xFFFFFFFF) or not _is_uint(pc_after, 0xFFFFFFFF)
+                or entry['programCounter'] != pc_after or not _is_uint(ir, 0xFFFF)
+                or type(command) is not str or type(instruction) is not str or type(ir_asm) is not str
+                or type(operands) is not list):
+            return None
+        for operand in operands:
+            if type(operand) is not str:
+                return None
+        return (pc_before, pc_after, registers_before[0], registers_after[0], ir,
+                bits_before | (bits_after << 4), phase,
+                self._intern(command), self._intern(instruction),
+                self._intern_operands(operands), self._intern(ir_asm))
+
+    def _intern(self, text: str) -> int:
+        """Номер строки в таблице строк (строка добавляется при первом появлении)"""
+        index = self._string_ids.get(text)
+        if index is None:
+            index = self._string_ids[text] = len(self._strings)
+            self._strings.append(text)
+            self._string_json.append(_json.encode(text))
+        return index
+
+    def _intern_operands(self, operands: List[str]) -> int:
+        """Номер списка операндов в таблице операндов"""
+        key = tuple(operands)
+        index = self._operand_ids.get(key)
+        if index is None:
+            index = self._operand_ids[key] = len(self._operands)
+            self._operands.append(key)
+            self._operand_json.append(_json.encode(operands))
+        return index
+
+    def _field_values(self, name: str, lo: int, hi: int) -> List[Any]:
+        """Значения поля записи для позиций [lo, hi) по срезам столбцов"""
+        columns = self._columns
+        if name in ('command', 'instruction', 'instruction_register_asm'):
+            strings = self._strings
+            column = columns['ir_asm' if name == 'instruction_register_asm' else name]
+            return [strings[index] for index in column[lo:hi]]
+        if name == 'operands':
+            operands = self._operands
+            return [list(operands[index]) for index in columns['operands'][lo:hi]]
+        if name == 'execution_phase':
+            return [PHASES[code] for code in columns['phase'][lo:hi]]
+        if name == 'registers_before':
+            return [[value] for value in columns['acc_before'][lo:hi]]
+        if name in ('registers_after', 'registers'):
+            return [[value] for value in columns['acc_after'][lo:hi]]
+        if name == 'flags_before':
+            return [_FLAG_DICTS[bits & 0xF].copy() for bits in columns['flags'][lo:hi]]
+        if name in ('flags_after', 'flags'):
+            return [_FLAG_DICTS[bits >> 4].copy() for bits in columns['flags'][lo:hi]]
+        if name == 'programCounter_before':
+            return columns['pc_before'][lo:hi].tolist()
+        if name in ('programCounter', 'programCounter_after'):
+            return columns['pc_after'][lo:hi].tolist()
+        return columns['ir'][lo:hi].tolist()
+
+    def _range(self, start: int, stop: int) -> Tuple[int, int]:
+        """Позиции подробных записей для индексов [start, stop)"""
+        return max(start, self._start) - self._start, min(stop, len(self)) - self._start
+
+    def _position(self, index: int) -> int:
+        """Позиция подробной записи по абсолютному индексу (отрицательный - с конца)"""
+        if index < 0:
+            index += len(self)
+        position = index - self._start
+        if not 0 <= position < len(self._ends):
+            raise IndexError("history index out of range")
+        return position
+
+    def _bounds(self, index: int) -> Tuple[int, int]:
+        position = self._position(index)
+        start = self._ends[position - 1] if position > 0 else self._journal_start
+        return start, self._ends[position]
+
+    def _apply(self, state: List[int], start: int, end: int):
+        """Применить к state записи журнала [start, end)"""
+        addrs, new = self._addrs, self._new
+        base = self._journal_start
+        for i in range(start - base, end - base):
+            addr = addrs[i]
+            if addr >= len(state):
+                state.extend([0] * (addr + 1 - len(state)))
+            state[addr] = new[i]
+
+    def _maybe_snapshot(self, ram: Sequence[int]):
+        offset = self.write_count
+        if offset - self._snapshot_offsets[-1] >= self.snapshot_interval:
+            self._snapshot_offsets.append(offset)
+            self._snapshots.append(array('H', ram))
+
+    def _evict(self, count: int):
+        """Вытеснить count самых старых подробных записей (execute - в сводки)"""
+        base = self._journal_start
+        cut = self._ends[count - 1]
+        columns = self._columns
+        offset = base
+        for position, end, phase, command, accumulator, pc, flags in zip(
+                range(count), self._ends[:count], columns['phase'][:count], columns['command'][:count],
+                columns['acc_after'][:count], columns['pc_after'][:count], columns['flags'][:count]):
+            index = self._start + position
+            entry = self._irregular.pop(index, None)
+            if (PHASES[phase] if entry is None else entry.get('execution_phase')) == 'execute':
+                writes = [[self._addrs[i], self._old[i], self._new[i]] for i in range(offset - base, end - base)]
+                if entry is not None:
+                    summary = self._summarize(index, entry, writes)
+                else:
+                    summary = {
+                        'index': index,
+                        'command': self._strings[command],
+                        'accumulator': accumulator,
+                        'program_counter': pc,
+                        'flag_bits': flags >> 4,
+                        'writes': writes,
+                    }
+                self._summaries.append(summary)
+                self._summary_indexes.append(index)
+                self.summarized += 1
+            offset = end
+
+        # Базовый снимок переносится на границу оставшихся подробных записей
+        snapshot = array('H', self.ram_at_offset(cut))
+        i = bisect_right(self._snapshot_offsets, cut)
+        self._snapshot_offsets[:i] = [cut]
+        self._snapshots[:i] = [snapshot]
+
+        del self._addrs[:cut - base]
+        del self._old[:cut - base]
+        del self._new[:cut - base]
+        self._journal_start = cut
+        for column in self._column_list:
+            del column[:count]
+        del self._ends[:count]
+        self._start += count
+        self.evictions += 1
+        self.evicted += count
+
+        if self.summary_capacity is not None and len(self._summaries) > self.summary_capacity:
+            dropped = len(self._summaries) - self.summary_capacity
+            del self._summaries[:dropped]
+            del self._summary_indexes[:dropped]
+            self.summaries_dropped += dropped
+
+    @staticmethod
+    def _summarize(index: int, entry: Dict[str, Any], writes: List[List[int]]) -> Dict[str, Any]:
+        """Сводка фазы execute по словарю записи: только базовые значения"""
+        registers = entry.get('registers_after') or [0]
+        flags = entry.get('flags_after')
+        return {
+            'index': index,
+            'command': entry.get('command', ''),
+            'accumulator': registers[0],
+            'program_counter': entry.get('programCounter_after', 0),
+            'flag_bits': flags_from_dict(flags) if isinstance(flags, dict) else 0,
+            'writes': writes,
+        }
+
+    @staticmethod
+    def _with_ram(entry: Dict[str, Any], ram_before: List[int], ram_after: List[int]) -> Dict[str, Any]:
+        full = dict(entry)
+        full['ram'] = ram_after
+        full['ram_before'] = ram_before
+        full['ram_after'] = ram_after
+        return full
@@ -0,0 +1,256 @@
+"""
+Фоновые задания: длительное выполнение программ вне HTTP-запросов
+"""
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List
+
+from .emulator import RISCEmulator
+from .trace import TraceWriter
+
+# Состояния задания
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+JOB_FINISHED = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+
+class JobQueueFull(Exception):
+    """Очередь заданий заполнена"""
+
+
+class Job:
+    """Задание: программа и/или задача с бюджетом шагов
+
+    max_steps считается в фазах, как в RISCEmulator.execute_program
+    (одна команда = fetch + decode + execute). С trace выполненные команды
+    записываются в файл трассы trace_path (см. TraceWriter).
+    """
+
+    def __init__(self, source_code: Optional[str], task_id: Optional[int], max_steps: int,
+                 session_id: Optional[str] = None, trace: bool = False, trace_compress: bool = True):
+        self.id = uuid.uuid4().hex
+        self.source_code = source_code
+        self.task_id = task_id
+        self.max_steps = max_steps
+        self.session_id = session_id
+        self.status = JOB_QUEUED
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.instructions = 0
+        self.phases = 0
+        self.error: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.cancel = threading.Event()
+        self.trace = trace
+        self.trace_compress = trace_compress
+        self.trace_path: Optional[str] = None
+        self.trace_stats: Optional[Dict[str, Any]] = None
+
+    @property
+    def max_instructions(self) -> int:
+        return self.max_steps // 3
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        """Описание задания для API"""
+        now = self.finished or time.time()
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "task_id": self.task_id,
+            "max_steps": self.max_steps,
+            "progress": {
+                "instructions": self.instructions,
+                "steps": self.phases,
+                "fraction": min(self.instructions / self.max_instructions, 1.0) if self.max_instructions else 1.0,
+            },
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "elapsed": round(now - self.started, 3) if self.started else 0.0,
+            "error": self.error,
+        }
+        if self.trace:
+            data["trace"] = self.trace_stats
+        if include_result:
+            data["result"] = self.result
+        return data
+
+
+class JobManager:
+    """Пул потоков для заданий с ограниченной очередью
+
+    Каждое задание выполняется на собственном эмуляторе, поэтому не
+    блокирует сессию пользователя. Заданий в очереди и в работе не больше
+    max_queue (иначе JobQueueFull). Выполнение идет порциями по chunk
+    команд через RISCProcessor.run(): между порциями обновляется прогресс
+    и проверяются отмена и ограничение времени timeout. Хранится не больше
+    max_finished завершенных заданий (самые старые удаляются).
+
+    Трассы заданий пишутся потоково в файлы каталога trace_dir (по
+    умолчанию - временный каталог) и удаляются вместе с заданием.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 32, timeout: float = 300.0,
+                 max_finished: int = 256, chunk: int = 100_000, trace_dir: Optional[str] = None):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.max_finished = max_finished
+        self.chunk = chunk
+        self.trace_dir = trace_dir
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, source_code: Optional[str] = None, task_id: Optional[int] = None,
+               max_steps: int = 3_000_000, session_id: Optional[str] = None,
+               trace: bool = False, trace_compress: bool = True) -> Job:
+        """Поставить задание в очередь"""
+        if not source_code and not task_id:
+            raise Exception("Either source_code or task_id is required")
+        if max_steps < 1:
+            raise Exception(f"Invalid step budget: {max_steps}")
+        job = Job(source_code, task_id, max_steps, session_id, trace, trace_compress)
+        with self._lock:
+            active = sum(1 for j in self._jobs.values() if j.status not in JOB_FINISHED)
+            if active >= self.max_queue:
+                raise JobQueueFull(f"Job queue is full ({self.max_queue} jobs)")
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Задание по идентификатору"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, session_id: Optional[str] = None) -> List[Job]:
+        """Задания сессии (или все)"""
+        with self._lock:
+            return [job for job in self._jobs.values() if session_id is None or job.session_id == session_id]
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Отменить задание (выполняемое останавливается на ближайшей проверке)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job.cancel.set()
+            if job.status == JOB_QUEUED:
+                self._finish(job, JOB_CANCELLED)
+            return job
+
+    def shutdown(self):
+        """Отменить все задания и остановить пул"""
+        with self._lock:
+            for job in self._jobs.values():
+                job.cancel.set()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика заданий по состояниям"""
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {"workers": self.max_workers, "max_queue": self.max_queue, "jobs": counts}
+
+    def _run(self, job: Job):
+        with self._lock:
+            if job.status != JOB_QUEUED:
+                return
+            job.status = JOB_RUNNING
+            job.started = time.time()
+        try:
+            status = self._execute(job)
+        except Exception as e:
+            job.error = str(e)
+            status = JOB_FAILED
+        with self._lock:
+            self._finish(job, status)
+
+    def _execute(self, job: Job) -> str:
+        """Выполнить задание; возвращает итоговое состояние"""
+        emulator = RISCEmulator()
+        processor = emulator.processor
+        if job.task_id:
+            result = emulator.load_task(job.task_id)
+            if not result["success"]:
+                raise Exception(result["error"])
+            emulator.task_manager.setup_task_data(processor, job.task_id)
+        if job.source_code:
+            compiled = emulator.compile_code(job.source_code)
+            if not compiled["success"]:
+                raise Exception(compiled["message"])
+            processor.load_program(compiled["machine_code"], job.source_code)
+
+        deadline = job.started + self.timeout
+        processor.cancel_check = job.cancel.is_set
+        trace = self._open_trace(job) if job.trace else None
+        summary = None
+        try:
+            while job.instructions < job.max_instructions and not processor.processor.is_halted:
+                if job.cancel.is_set():
+                    break
+                if time.time() > deadline:
+                    job.error = f"Job timed out after {self.timeout} s"
+                    break
+                summary = processor.run(max_instructions=min(self.chunk, job.max_instructions - job.instructions),
+                                        trace=trace)
+                job.instructions += summary["instructions"]
+                job.phases += summary["phases"]
+                if trace is not None:
+                    job.trace_stats = trace.stats()
+                if summary["error"]:
+                    job.error = summary["error"]
+                    break
+                if not summary["instructions"] and not summary["cancelled"]:
+                    break
+        finally:
+            processor.cancel_check = None
+            if trace is not None:
+                trace.close()
+                job.trace_stats = trace.stats()
+
+        job.result = {
+            "halted": processor.processor.is_halted,
+            "summary": summary,
+            "state": emulator.get_state(),
+        }
+        if job.task_id:
+            job.result["verification"] = emulator.verify_current_task().get("verification")
+        if job.cancel.is_set():
+            return JOB_CANCELLED
+        return JOB_FAILED if job.error else JOB_COMPLETED
+
+    def _open_trace(self, job: Job) -> TraceWriter:
+        """Создать файл трассы задания"""
+        with self._lock:
+            if self.trace_dir is None:
+                self.trace_dir = tempfile.mkdtemp(prefix="emulator-traces-")
+        os.makedirs(self.trace_dir, exist_ok=True)
+        job.trace_path = os.path.join(self.trace_dir, f"{job.id}.trace")
+        return TraceWriter(job.trace_path, compress=job.trace_compress)
+
+    def _finish(self, job: Job, status: str):
+        """Завершить задание и ограничить число хранимых завершенных (под self._lock)"""
+        job.status = status
+        job.finished = time.time()
+        finished = [job_id for job_id, j in self._jobs.items() if j.status in JOB_FINISHED]
+        for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+            removed = self._jobs.pop(job_id)
+            if removed.trace_path is not None:
+                try:
+                    os.remove(removed.trace_path)
+                except OSError:
+                    pass
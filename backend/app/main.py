@@ -1,20 +1,43 @@
 """
 FastAPI приложение для эмулятора одноадресного RISC процессора
 """
+import functools
+import os
 import re
-from fastapi import FastAPI, HTTPException
+import uuid
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from contextlib import asynccontextmanager
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from .models import (
     EmulatorState, CompileRequest, LoadTaskRequest, ExecuteRequest, ResetRequest, 
-    TaskInfo, TaskData
+    TaskInfo, TaskData, FetchModeRequest, SeekRequest, StepBackRequest, JobRequest
 )
 from .emulator import RISCEmulator
+from .history import DEFAULT_HISTORY_CAPACITY, DEFAULT_SUMMARY_CAPACITY
+from .writes import DEFAULT_WRITE_INDEX_CAPACITY
+from .processor import resolve_state_sections
+from .sessions import SessionPool
+from .executor import EmulatorExecutor, ExecutorBusy, ExecutionTimeout
+from .jobs import JobManager, JobQueueFull, JOB_FINISHED
+from .trace import MEDIA_TYPE as TRACE_MEDIA_TYPE
+from .deltas import DeltaTracker, handle_command
+from .progress import run_with_progress
+from .wire import MEDIA_TYPE as WIRE_MEDIA_TYPE, encode_state_json, encode_result_json
 
-# Глобальный объект эмулятора
-emulator = None
+# Пул эмуляторов: у каждой сессии (вкладки браузера) своя машина
+sessions = None
+# Пул потоков, в котором выполняется работа эмуляторов (цикл событий не блокируется)
+executor = None
+# Фоновые задания (длительное выполнение без удержания HTTP-соединения)
+jobs = None
+
+# Сессия определяется заголовком X-Session-Id или cookie; без них выдается новая
+SESSION_HEADER = "X-Session-Id"
+SESSION_COOKIE = "risc_session"
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
 
 def has_manual_array_initialization(source_code: str, task_id: int = None) -> bool:
     """
@@ -157,14 +180,70 @@ def has_manual_array_initialization(source_code: str, task_id: int = None) -> bo
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Инициализация при запуске приложения"""
-    global emulator
+    global sessions, executor, jobs
     
-    emulator = RISCEmulator()
+    # Размер пула задается переменными окружения
+    # Емкость истории фаз сессии: подробные записи и сводки execute (0 - без ограничения)
+    history_capacity = int(os.environ.get("EMULATOR_HISTORY_CAPACITY", str(DEFAULT_HISTORY_CAPACITY))) or None
+    summary_capacity = int(os.environ.get("EMULATOR_HISTORY_SUMMARIES", str(DEFAULT_SUMMARY_CAPACITY)))
+    # Емкость индекса записей в память по адресам (0 - без ограничения)
+    write_index_capacity = int(os.environ.get("EMULATOR_WRITE_INDEX_CAPACITY",
+                                              str(DEFAULT_WRITE_INDEX_CAPACITY))) or None
+    sessions = SessionPool(
+        max_sessions=int(os.environ.get("EMULATOR_MAX_SESSIONS", "64")),
+        idle_timeout=float(os.environ.get("EMULATOR_IDLE_TIMEOUT", "900")),
+        max_snapshots=int(os.environ.get("EMULATOR_MAX_SNAPSHOTS", "1024")),
+        factory=functools.partial(RISCEmulator, history_capacity=history_capacity,
+                                  summary_capacity=summary_capacity,
+                                  write_index_capacity=write_index_capacity)
+    )
+    executor = EmulatorExecutor(
+        max_workers=int(os.environ.get("EMULATOR_WORKERS", "4")),
+        max_pending=int(os.environ.get("EMULATOR_MAX_PENDING", "64")),
+        timeout=float(os.environ.get("EMULATOR_REQUEST_TIMEOUT", "10"))
+    )
+    jobs = JobManager(
+        max_workers=int(os.environ.get("EMULATOR_JOB_WORKERS", "2")),
+        max_queue=int(os.environ.get("EMULATOR_JOB_QUEUE", "32")),
+        timeout=float(os.environ.get("EMULATOR_JOB_TIMEOUT", "300")),
+        trace_dir=os.environ.get("EMULATOR_TRACE_DIR") or None
+    )
     
     yield
     
     # Очистка при завершении
-    emulator = None
+    jobs.shutdown()
+    jobs = None
+    executor.shutdown()
+    executor = None
+    sessions = None
+
+def get_emulator(request: Request, response: Response) -> RISCEmulator:
+    """Эмулятор сессии запроса (зависимость FastAPI)"""
+    if sessions is None:
+        raise HTTPException(status_code=500, detail="Emulator not initialized")
+    
+    session_id = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+    if not session_id:
+        session_id = uuid.uuid4().hex
+    elif not SESSION_ID_PATTERN.match(session_id):
+        raise HTTPException(status_code=400, detail="Invalid session id")
+    
+    if request.cookies.get(SESSION_COOKIE) != session_id:
+        response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="lax")
+    response.headers[SESSION_HEADER] = session_id
+    return sessions.get(session_id)
+
+async def run_emulator(emulator: RISCEmulator, func, *args):
+    """Выполнить работу с эмулятором в пуле потоков с ограничением времени"""
+    if executor is None:
+        raise HTTPException(status_code=500, detail="Emulator not initialized")
+    try:
+        return await executor.submit(emulator, func, *args)
+    except ExecutorBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ExecutionTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
 
 app = FastAPI(
     title="Эмулятор одноадресного RISC процессора",
@@ -182,6 +261,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[SESSION_HEADER, "ETag"],
 )
 
 @app.get("/")
@@ -189,27 +269,137 @@ async def root():
     """Корневой endpoint"""
     return {"message": "Эмулятор одноадресного RISC процессора API"}
 
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Совпадает ли ETag с заголовком If-None-Match (список через запятую, W/ или *)"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+def state_sections(fields: Optional[str]):
+    """Разделы состояния по параметру fields (разделы и профили через запятую)"""
+    names = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    try:
+        return resolve_state_sections(names)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/api/state", response_model=EmulatorState)
-async def get_state():
-    """Получить текущее состояние эмулятора"""
-    if not emulator:
-        raise HTTPException(status_code=500, detail="Emulator not initialized")
+async def get_state(request: Request, response: Response, since: Optional[int] = None,
+                    history_from: int = 0, fields: Optional[str] = None,
+                    emulator: RISCEmulator = Depends(get_emulator)):
+    """Получить текущее состояние эмулятора
+    
+    Ответ содержит ETag версии состояния: при совпадении с If-None-Match
+    возвращается 304 без тела. С параметром since (версия из прошлого ответа)
+    возвращаются только изменения с этой версии. С Accept: application/octet-stream
+    полное состояние передается в двоичном формате (app/wire.py). history_from -
+    первая запись истории в ответе (записи до нее у клиента уже есть).
+    fields - разделы состояния через запятую (processor, ram, history, program)
+    или профили (all, light); по умолчанию - все. Не действует на ответы
+    с since и двоичный формат.
+    """
+    sections = state_sections(fields)
+    if_none_match = request.headers.get("if-none-match")
+    binary = since is None and WIRE_MEDIA_TYPE in request.headers.get("accept", "")
+    
+    def read_state():
+        etag = emulator.state_etag()
+        if binary:
+            # У двоичного представления свой ETag (тот же URL, другое тело)
+            etag = etag[:-1] + '-bin"'
+        if etag_matches(if_none_match, etag):
+            return etag, None
+        if since is not None:
+            return etag, emulator.get_state_diff(since)
+        if binary:
+            return etag, emulator.get_state_binary()
+        # Состояние собрано из базовых типов: кодируется напрямую, без модели EmulatorState
+        state = emulator.get_state(history_from, sections)
+        return etag, encode_state_json(state, emulator.processor.memory.history)
+    
+    etag, state = await run_emulator(emulator, read_state)
+    response.headers["ETag"] = etag
+    response.headers["Vary"] = "Accept"
+    if state is None:
+        return Response(status_code=304, headers=dict(response.headers))
+    if since is not None:
+        return JSONResponse(content=state, headers=dict(response.headers))
+    media_type = WIRE_MEDIA_TYPE if binary else "application/json"
+    return Response(content=state, media_type=media_type, headers=dict(response.headers))
+
+@app.get("/api/memory")
+async def get_memory(start: int = 0, length: Optional[int] = Query(None, alias="len"),
+                     emulator: RISCEmulator = Depends(get_emulator)):
+    """Получить окно RAM [start, start + len) (без len - до конца памяти)"""
+    result = await run_emulator(emulator, emulator.get_memory, start, length)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+    return result
+
+@app.get("/api/history")
+async def get_history(start: int = Query(0, alias="from"), limit: int = 100, fields: Optional[str] = None,
+                      emulator: RISCEmulator = Depends(get_emulator)):
+    """Получить страницу истории выполнения
+    
+    fields - список полей через запятую (например, execution_phase,registers,writes);
+    копии RAM передаются, только если запрошены.
+    """
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    result = await run_emulator(emulator, emulator.get_history, start, limit, field_list)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+    return result
+
+@app.get("/api/history/replay")
+async def replay_history(start: int = Query(0, alias="from"), limit: int = 100, fields: Optional[str] = None,
+                         emulator: RISCEmulator = Depends(get_emulator)):
+    """Восстановить историю фаз команд [from, from + limit) повтором выполнения
+    
+    from - номер команды (как position в /api/seek). Записи строятся заново
+    от ближайшей контрольной точки, поэтому доступны и для быстрого
+    выполнения, и для вытесненной истории; fields - как в /api/history.
+    """
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    result = await run_emulator(emulator, emulator.replay_history, start, limit, field_list)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+    return result
+
+@app.get("/api/memory/writes")
+async def get_memory_writes(address: str, before: Optional[int] = None, limit: int = 1,
+                            emulator: RISCEmulator = Depends(get_emulator)):
+    """Кто и когда писал в ячейку RAM: записи от новых к старым
     
-    state = emulator.get_state()
-    return EmulatorState(**state)
+    address - адрес (десятичный или 0x...); before - индекс фазы истории
+    (записи до нее, для следующей страницы - next из ответа). Каждая
+    запись: step (фаза), pc и command (команда), old/new (значения).
+    """
+    try:
+        cell = int(address, 0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid RAM address: {address}")
+    result = await run_emulator(emulator, emulator.get_writes, cell, before, limit)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+    return result
 
 @app.post("/api/compile")
-async def compile_code(request: CompileRequest):
+async def compile_code(request: CompileRequest, emulator: RISCEmulator = Depends(get_emulator)):
     """Скомпилировать исходный код"""
+    return await run_emulator(emulator, _compile_code, request, emulator)
+
+def _compile_code(request: CompileRequest, emulator: RISCEmulator):
+    """Компиляция и загрузка программы (выполняется в пуле потоков)"""
     # КРИТИЧНО: Логируем СРАЗУ при получении запроса (и в stdout, и в stderr)
     import sys
     log_msg = f"DEBUG compile: ===== ЗАПРОС ПОЛУЧЕН ===== task_id={request.task_id}, source_code length={len(request.source_code) if request.source_code else 0}"
     print(log_msg, file=sys.stderr, flush=True)
     print(log_msg, flush=True)
     
-    if not emulator:
-        raise HTTPException(status_code=500, detail="Emulator not initialized")
-    
     try:
         # Проверяем, содержит ли код ручную инициализацию массива(ов)
         # Передаем task_id для правильной проверки
@@ -365,6 +555,10 @@ async def compile_code(request: CompileRequest):
                 else:
                     print(f"WARNING compile: No RAM to restore!")
         
+        # В режиме фон Неймана восстановление памяти могло затереть код программы
+        if result["success"] and emulator.processor.fetch_from_ram:
+            emulator.processor.install_code()
+        
         # Возвращаем результат с текущим состоянием (включая память)
         if result["success"]:
             state = emulator.get_state()
@@ -402,23 +596,23 @@ async def compile_code(request: CompileRequest):
         raise HTTPException(status_code=400, detail=f"Ошибка компиляции: {str(e)}")
 
 @app.post("/api/load-task")
-async def load_task(request: LoadTaskRequest):
+async def load_task(request: LoadTaskRequest, emulator: RISCEmulator = Depends(get_emulator)):
     """Загрузить данные задачи без выполнения программы"""
-    if not emulator:
-        raise HTTPException(status_code=500, detail="Emulator not initialized")
-    
     try:
-        result = emulator.load_task(request.task_id)
+        result = await run_emulator(emulator, emulator.load_task, request.task_id)
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Ошибка загрузки задачи: {str(e)}")
 
 @app.post("/api/execute")
-async def execute_code(request: ExecuteRequest):
+async def execute_code(request: ExecuteRequest, emulator: RISCEmulator = Depends(get_emulator)):
     """Выполнить код"""
-    if not emulator:
-        raise HTTPException(status_code=500, detail="Emulator not initialized")
-    
+    return await run_emulator(emulator, _execute_code, request, emulator)
+
+def _execute_code(request: ExecuteRequest, emulator: RISCEmulator):
+    """Выполнение программы или задачи (выполняется в пуле потоков)"""
     try:
         if request.task_id and request.task_id > 0:
             # Выполнение предустановленной задачи
@@ -426,8 +620,8 @@ async def execute_code(request: ExecuteRequest):
             if not result["success"]:
                 raise HTTPException(status_code=400, detail=result["error"])
             
-            # Выполняем программу
-            execute_result = emulator.execute_program(max_steps=1000)
+            # Выполняем программу (без истории фаз, если не запрошено пошаговое выполнение)
+            execute_result = emulator.execute_program(max_steps=1000, trace=request.step_by_step)
             
             # Проверяем результат
             verification = emulator.verify_current_task()
@@ -436,28 +630,46 @@ async def execute_code(request: ExecuteRequest):
                 "success": True,
                 "task_id": request.task_id,
                 "verification": verification.get("verification"),
-                "state": execute_result["state"]
+                "state": execute_result["state"],
+                "summary": execute_result.get("summary")
             }
         else:
             # Выполнение пользовательского кода
             if not request.source_code:
                 raise HTTPException(status_code=400, detail="Не указан исходный код для выполнения")
             
-            result = emulator.execute_program(request.source_code)
+            result = emulator.execute_program(request.source_code, trace=request.step_by_step)
             return result
     
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Ошибка выполнения: {str(e)}")
 
 @app.post("/api/step")
-async def execute_step():
-    """Выполнить один шаг"""
-    if not emulator:
-        raise HTTPException(status_code=500, detail="Emulator not initialized")
+async def execute_step(response: Response, history_from: int = 0, fields: str = "light",
+                       emulator: RISCEmulator = Depends(get_emulator)):
+    """Выполнить один шаг
     
+    fields - разделы состояния в ответе (см. GET /api/state); по умолчанию
+    профиль light: только регистры, а ячейки RAM, записанные за шаг, - в
+    writes. Клиенты, которым нужно полное состояние, передают fields=all.
+    history_from - первая запись истории в состоянии ответа: клиент, который
+    дописывает новые записи к уже полученным, передает их число, и размер
+    ответа не растет с длиной сеанса.
+    """
+    sections = state_sections(fields)
+    
+    def step():
+        result = _execute_step(emulator, history_from, sections)
+        return encode_result_json(result, emulator.processor.memory.history)
+    
+    body = await run_emulator(emulator, step)
+    return Response(content=body, media_type="application/json", headers=dict(response.headers))
+
+def _execute_step(emulator: RISCEmulator, history_from: int = 0, sections=None):
+    """Один шаг с проверками памяти (выполняется в пуле потоков)"""
     try:
-        # Сохраняем память ПЕРЕД выполнением шага (чтобы не потерять данные)
-        ram_before_step = list(emulator.processor.memory.ram) if emulator.processor.memory.ram else []
+        # Сохраняем память ПЕРЕД выполнением шага (компактная копия array('H'), чтобы не потерять данные)
+        ram_before_step = emulator.processor.memory.ram.snapshot()
         
         # Определяем текущую задачу
         current_task = emulator.current_task if hasattr(emulator, 'current_task') else None
@@ -475,7 +687,7 @@ async def execute_step():
                 if not ram_before_step or len(ram_before_step) == 0:
                     min_size = max(0x030A, emulator.processor.memory_size)
                     emulator.processor.memory.ram = [0] * min_size
-                    ram_before_step = list(emulator.processor.memory.ram)
+                    ram_before_step = emulator.processor.memory.ram.snapshot()
                     print(f"DEBUG step endpoint: Инициализирована память размером {min_size}")
         elif ram_before_step and 0x0100 < len(ram_before_step):
             mem_val = ram_before_step[0x0100]
@@ -486,16 +698,11 @@ async def execute_step():
             if not ram_before_step or len(ram_before_step) == 0:
                 min_size = max(0x0200, emulator.processor.memory_size)
                 emulator.processor.memory.ram = [0] * min_size
-                ram_before_step = list(emulator.processor.memory.ram)
+                ram_before_step = emulator.processor.memory.ram.snapshot()
                 print(f"DEBUG step endpoint: Инициализирована память размером {min_size}")
         
-        # Получаем текущую фазу выполнения (если есть последняя запись в истории)
-        last_history_entry = None
-        if emulator.processor.memory.history and len(emulator.processor.memory.history) > 0:
-            last_history_entry = emulator.processor.memory.history[-1]
-        
         # Выполняем шаг
-        result = emulator.execute_step()
+        result = emulator.execute_step(history_from, sections)
         
         # Получаем информацию о выполненной фазе из последней записи истории
         phase_info = None
@@ -512,7 +719,7 @@ async def execute_step():
                     print(f"═══════════════════════════════════════════════════════════════")
         
         # Проверяем память после выполнения шага
-        ram_after_step = list(emulator.processor.memory.ram) if emulator.processor.memory.ram else []
+        ram_after_step = emulator.processor.memory.ram
         
         if current_task == 2:
             # Для задачи 2 проверяем адреса 0x0200 и 0x0300
@@ -530,9 +737,9 @@ async def execute_step():
         if ram_after_step and len(ram_after_step) < len(ram_before_step):
             print(f"WARNING step endpoint: Память уменьшилась! Было {len(ram_before_step)}, стало {len(ram_after_step)}")
             # Восстанавливаем память из резервной копии
-            emulator.processor.memory.ram = list(ram_before_step)
+            emulator.processor.memory.ram = ram_before_step
             print(f"DEBUG step endpoint: Память восстановлена из резервной копии")
-            ram_after_step = list(emulator.processor.memory.ram)
+            ram_after_step = emulator.processor.memory.ram
             
             # Проверяем память в зависимости от текущей задачи
             if current_task == 1:
@@ -604,34 +811,194 @@ async def execute_step():
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Ошибка выполнения шага: {str(e)}")
 
+@app.get("/api/run/stream")
+async def run_stream(max_steps: int = 3_000_000, hz: float = 10.0, emulator: RISCEmulator = Depends(get_emulator)):
+    """Выполнить загруженную программу до остановки с потоком прогресса (Server-Sent Events)
+    
+    События progress (не чаще hz раз в секунду): скорость, PC, ACC, циклы;
+    событие done - итог выполнения.
+    """
+    if max_steps < 1:
+        raise HTTPException(status_code=400, detail=f"Invalid step budget: {max_steps}")
+    return StreamingResponse(
+        run_with_progress(emulator, run_emulator, max_steps, hz),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/api/reset")
-async def reset_processor():
+async def reset_processor(emulator: RISCEmulator = Depends(get_emulator)):
     """Сбросить процессор"""
-    if not emulator:
-        raise HTTPException(status_code=500, detail="Emulator not initialized")
+    def reset():
+        emulator.reset()
+        return emulator.get_state()
     
-    emulator.reset()
     return {
         "success": True,
         "message": "Процессор сброшен",
-        "state": emulator.get_state()
+        "state": await run_emulator(emulator, reset)
     }
 
-@app.get("/api/tasks", response_model=List[TaskInfo])
-async def get_tasks():
-    """Получить список задач"""
-    if not emulator:
+@app.post("/api/fetch-mode")
+async def set_fetch_mode(request: FetchModeRequest, emulator: RISCEmulator = Depends(get_emulator)):
+    """Переключить выборку команд: из памяти команд или из RAM (фон Нейман)"""
+    result = await run_emulator(emulator, emulator.set_fetch_mode, request.fetch_from_ram, request.code_base)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+    return result
+
+@app.post("/api/seek")
+async def seek(request: SeekRequest, emulator: RISCEmulator = Depends(get_emulator)):
+    """Перейти к состоянию после указанного числа выполненных команд"""
+    result = await run_emulator(emulator, emulator.seek, request.position)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+    return result
+
+@app.post("/api/step-back")
+async def step_back(request: StepBackRequest, emulator: RISCEmulator = Depends(get_emulator)):
+    """Вернуться на несколько команд назад"""
+    result = await run_emulator(emulator, emulator.step_back, request.count)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+    return result
+
+@app.get("/api/sessions")
+async def get_sessions():
+    """Статистика пула сессий"""
+    if sessions is None:
+        raise HTTPException(status_code=500, detail="Emulator not initialized")
+    
+    return {
+        **sessions.stats(),
+        "executor": executor.stats() if executor else None,
+        "jobs": jobs.stats() if jobs else None
+    }
+
+@app.delete("/api/session")
+async def close_session(request: Request):
+    """Завершить текущую сессию (эмулятор и снимок удаляются)"""
+    if sessions is None:
+        raise HTTPException(status_code=500, detail="Emulator not initialized")
+    
+    session_id = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+    if not session_id or not sessions.drop(session_id):
+        raise HTTPException(status_code=404, detail="Сессия не найдена")
+    return {"success": True, "message": "Session closed"}
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(job_request: JobRequest, request: Request, response: Response):
+    """Запустить программу или задачу в фоне, вернуть идентификатор задания"""
+    if jobs is None:
+        raise HTTPException(status_code=500, detail="Emulator not initialized")
+    
+    session_id = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+    try:
+        job = jobs.submit(job_request.source_code, job_request.task_id, job_request.max_steps, session_id,
+                          job_request.trace, job_request.trace_compress)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка создания задания: {str(e)}")
+    response.headers["Location"] = f"/api/jobs/{job.id}"
+    return {"success": True, **job.to_dict(include_result=False)}
+
+@app.get("/api/jobs")
+async def list_jobs(request: Request):
+    """Задания текущей сессии (без результатов)"""
+    if jobs is None:
+        raise HTTPException(status_code=500, detail="Emulator not initialized")
+    
+    session_id = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+    if not session_id:
+        return []
+    return [job.to_dict(include_result=False) for job in jobs.list(session_id)]
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Прогресс задания и, после завершения, итоговое состояние"""
+    if jobs is None:
+        raise HTTPException(status_code=500, detail="Emulator not initialized")
+    
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    return job.to_dict()
+
+@app.get("/api/jobs/{job_id}/trace")
+async def get_job_trace(job_id: str):
+    """Файл трассы завершенного задания (см. app/trace.py, TraceReader)"""
+    if jobs is None:
         raise HTTPException(status_code=500, detail="Emulator not initialized")
     
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    if not job.trace:
+        raise HTTPException(status_code=404, detail="Трасса для задания не записывалась")
+    if job.status not in JOB_FINISHED:
+        raise HTTPException(status_code=409, detail="Задание еще выполняется")
+    if job.trace_path is None or not os.path.exists(job.trace_path):
+        raise HTTPException(status_code=404, detail="Файл трассы не найден")
+    return FileResponse(job.trace_path, media_type=TRACE_MEDIA_TYPE, filename=f"{job.id}.trace")
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Отменить задание"""
+    if jobs is None:
+        raise HTTPException(status_code=500, detail="Emulator not initialized")
+    
+    job = jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    return job.to_dict(include_result=False)
+
+@app.websocket("/api/ws")
+async def websocket_session(websocket: WebSocket):
+    """Пошаговое выполнение по WebSocket с передачей только изменений
+    
+    Сессия задается параметром ?session_id=, заголовком X-Session-Id или cookie.
+    Клиент отправляет JSON-команды {"cmd": "step" | "run" | "reset" | "state" |
+    "subscribe" | "unsubscribe", ...}; сервер отвечает дельтами: измененные
+    регистры и флаги, записи в RAM и значения подписанных ячеек.
+    """
+    session_id = (websocket.query_params.get("session_id") or websocket.headers.get(SESSION_HEADER)
+                  or websocket.cookies.get(SESSION_COOKIE))
+    if sessions is None or not session_id or not SESSION_ID_PATTERN.match(session_id):
+        await websocket.close(code=1008)
+        return
+    
+    await websocket.accept()
+    tracker = DeltaTracker(sessions.get(session_id))
+    try:
+        while True:
+            message = await websocket.receive_json()
+            request_id = message.get("id") if isinstance(message, dict) else None
+            try:
+                if not isinstance(message, dict):
+                    raise Exception("Command must be a JSON object")
+                emulator = sessions.get(session_id)
+                replies = await run_emulator(emulator, handle_command, emulator, tracker, message)
+            except HTTPException as e:
+                replies = [{"type": "error", "status": e.status_code, "message": e.detail}]
+            except Exception as e:
+                replies = [{"type": "error", "message": str(e)}]
+            for reply in replies:
+                if request_id is not None:
+                    reply["id"] = request_id
+                await websocket.send_json(reply)
+    except WebSocketDisconnect:
+        pass
+
+@app.get("/api/tasks", response_model=List[TaskInfo])
+async def get_tasks(emulator: RISCEmulator = Depends(get_emulator)):
+    """Получить список задач"""
     tasks = emulator.get_tasks()
     return [TaskInfo(**task) for task in tasks]
 
 @app.get("/api/tasks/{task_id}", response_model=TaskInfo)
-async def get_task(task_id: int):
+async def get_task(task_id: int, emulator: RISCEmulator = Depends(get_emulator)):
     """Получить информацию о задаче"""
-    if not emulator:
-        raise HTTPException(status_code=500, detail="Emulator not initialized")
-    
     tasks = emulator.get_tasks()
     task = next((t for t in tasks if t["id"] == task_id), None)
     if not task:
@@ -640,11 +1007,8 @@ async def get_task(task_id: int):
     return TaskInfo(**task)
 
 @app.get("/api/tasks/{task_id}/program")
-async def get_task_program(task_id: int):
+async def get_task_program(task_id: int, emulator: RISCEmulator = Depends(get_emulator)):
     """Получить программу задачи"""
-    if not emulator:
-        raise HTTPException(status_code=500, detail="Emulator not initialized")
-    
     tasks = emulator.get_tasks()
     task = next((t for t in tasks if t["id"] == task_id), None)
     if not task:
@@ -657,11 +1021,8 @@ async def get_task_program(task_id: int):
     }
 
 @app.get("/api/instruction/{instruction}")
-async def get_instruction_info(instruction: str):
+async def get_instruction_info(instruction: str, emulator: RISCEmulator = Depends(get_emulator)):
     """Получить информацию об инструкции"""
-    if not emulator:
-        raise HTTPException(status_code=500, detail="Emulator not initialized")
-    
     return emulator.get_instruction_info(instruction)
 
 if __name__ == "__main__":
@@ -0,0 +1,185 @@
+"""
+Память процессора: компактная RAM на основе array('H') и контейнер памяти
+"""
+from array import array
+from typing import List, Iterable, Optional, Callable
+
+from .history import ExecutionHistory
+
+
+class PagedRAM(array):
+    """RAM из 16-битных слов, изменяемая на месте
+
+    Чтение работает со скоростью обычного array('H'). Каждая запись
+    увеличивает счетчик версий и помечает страницу памяти как измененную:
+    по битовой карте dirty-страниц и версиям страниц можно узнать, что
+    поменялось, не копируя память целиком.
+
+    Для одного диапазона адресов можно назначить наблюдателя (watch):
+    он вызывается при каждой записи в этот диапазон (используется для
+    инвалидации кэша декодирования команд в режиме фон Неймана).
+    """
+
+    PAGE_SHIFT = 8                  # 256 слов на страницу
+    PAGE_SIZE = 1 << PAGE_SHIFT
+
+    def __new__(cls, size: int = 8192):
+        return super().__new__(cls, 'H', bytes(2 * size))
+
+    def __init__(self, size: int = 8192):
+        self.version = 0
+        pages = self._page_count(size)
+        self._dirty = bytearray(pages)
+        self._page_versions = array('L', bytes(array('L').itemsize * pages))
+        self._watch_lo = 0
+        self._watch_hi = 0
+        self._watch = None
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            super().__setitem__(index, value)
+            start, stop, _ = index.indices(len(self))
+            self._touch_range(start, stop)
+            self._notify_range(start, stop)
+            return
+        super().__setitem__(index, value & 0xFFFF)
+        if index < 0:
+            index += len(self)
+        page = index >> self.PAGE_SHIFT
+        self.version += 1
+        self._dirty[page] = 1
+        self._page_versions[page] = self.version
+        if self._watch_lo <= index < self._watch_hi:
+            self._watch(index)
+
+    @property
+    def page_count(self) -> int:
+        return len(self._dirty)
+
+    def ensure_size(self, size: int):
+        """Расширить память нулями до size слов (память не уменьшается)"""
+        if size > len(self):
+            start = len(self)
+            self.frombytes(bytes(2 * (size - start)))
+            self._grow_pages()
+            self._touch_range(start, size)
+
+    def load(self, values: Iterable[int]):
+        """Заменить содержимое памяти на месте
+
+        Помечаются только страницы, содержимое которых действительно изменилось.
+        """
+        if values is self:
+            return
+        new = values if isinstance(values, array) and values.typecode == 'H' \
+            else array('H', [int(v) & 0xFFFF for v in values])
+        old_len = len(self)
+        if len(new) < old_len:
+            del self[len(new):]
+            self._dirty = self._dirty[:self._page_count(len(new))]
+            self._page_versions = self._page_versions[:len(self._dirty)]
+        elif len(new) > old_len:
+            self.frombytes(bytes(2 * (len(new) - old_len)))
+            self._grow_pages()
+
+        size = self.PAGE_SIZE
+        current = memoryview(self)
+        incoming = memoryview(new)
+        for page in range(self.page_count):
+            lo = page * size
+            hi = min(lo + size, len(new))
+            if current[lo:hi] != incoming[lo:hi]:
+                # Наблюдатель узнает только о словах, которые действительно изменились
+                changed = [address for address in range(max(lo, self._watch_lo), min(hi, self._watch_hi))
+                           if current[address] != incoming[address]]
+                current[lo:hi] = incoming[lo:hi]
+                self.version += 1
+                self._dirty[page] = 1
+                self._page_versions[page] = self.version
+                for address in changed:
+                    self._watch(address)
+        current.release()
+        incoming.release()
+
+    def watch(self, start: int, stop: int, callback: Callable[[int], None]):
+        """Вызывать callback(address) при каждой записи в адреса [start, stop)"""
+        self._watch_lo = start
+        self._watch_hi = stop
+        self._watch = callback
+
+    def unwatch(self):
+        """Снять наблюдателя записей"""
+        self._watch_lo = self._watch_hi = 0
+        self._watch = None
+
+    def dirty_pages(self) -> List[int]:
+        """Номера страниц, измененных с момента последнего clear_dirty()"""
+        return [page for page, flag in enumerate(self._dirty) if flag]
+
+    def clear_dirty(self):
+        """Сбросить битовую карту измененных страниц"""
+        self._dirty = bytearray(len(self._dirty))
+
+    def take_dirty(self) -> List[int]:
+        """Получить измененные страницы и сбросить битовую карту"""
+        pages = self.dirty_pages()
+        self.clear_dirty()
+        return pages
+
+    def pages_changed_since(self, version: int) -> List[int]:
+        """Номера страниц, в которые писали после указанной версии"""
+        return [page for page, page_version in enumerate(self._page_versions) if page_version > version]
+
+    def page_range(self, page: int) -> range:
+        """Диапазон адресов страницы"""
+        lo = page << self.PAGE_SHIFT
+        return range(lo, min(lo + self.PAGE_SIZE, len(self)))
+
+    def snapshot(self) -> array:
+        """Компактная копия содержимого памяти"""
+        return array('H', self)
+
+    def _touch_range(self, start: int, stop: int):
+        if stop <= start:
+            return
+        self.version += 1
+        for page in range(start >> self.PAGE_SHIFT, ((stop - 1) >> self.PAGE_SHIFT) + 1):
+            self._dirty[page] = 1
+            self._page_versions[page] = self.version
+
+    def _notify_range(self, start: int, stop: int):
+        lo = max(start, self._watch_lo)
+        hi = min(stop, self._watch_hi)
+        for address in range(lo, hi):
+            self._watch(address)
+
+    def _grow_pages(self):
+        missing = self._page_count(len(self)) - len(self._dirty)
+        if missing > 0:
+            self._dirty.extend(bytes(missing))
+            self._page_versions.extend([0] * missing)
+
+    @classmethod
+    def _page_count(cls, size: int) -> int:
+        return (size + cls.PAGE_SIZE - 1) >> cls.PAGE_SHIFT
+
+
+class Memory:
+    """Память процессора: RAM и история выполнения
+
+    Присваивание memory.ram = [...] не подменяет объект RAM, а загружает
+    значения в существующую PagedRAM, поэтому ссылки на RAM остаются
+    действительными, а изменения видны через версии страниц.
+    """
+
+    def __init__(self, size: int = 8192, history: Optional[ExecutionHistory] = None):
+        self._ram = PagedRAM(size)
+        self.history = history if history is not None else ExecutionHistory()
+
+    @property
+    def ram(self) -> PagedRAM:
+        return self._ram
+
+    @ram.setter
+    def ram(self, values: Iterable[int]):
+        self._ram.load(values)
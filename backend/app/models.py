@@ -41,6 +41,7 @@ class MemoryState(BaseModel):
     """Состояние памяти"""
     ram: List[int] = []
     history: List[Dict[str, Any]] = []
+    history_start: int = 0  # Индекс первой записи history (курсор history_from)
 
 class EmulatorState(BaseModel):
     """Общее состояние эмулятора"""
@@ -49,6 +50,7 @@ class EmulatorState(BaseModel):
     source_code: str = ""
     machine_code: List[str] = []
     current_task: Optional[int] = None
+    version: int = 0  # Версия состояния (см. GET /api/state?since=)
 
 class TaskInfo(BaseModel):
     """Информация о задаче"""
@@ -71,6 +73,27 @@ class ExecuteRequest(BaseModel):
     step_by_step: bool = False
     source_code: Optional[str] = None
 
+class FetchModeRequest(BaseModel):
+    """Запрос на переключение режима выборки команд"""
+    fetch_from_ram: bool = False  # True - команды выбираются из RAM (фон Нейман)
+    code_base: int = 0x0000       # Адрес начала кода в RAM
+
+class SeekRequest(BaseModel):
+    """Запрос на переход к команде с указанным номером"""
+    position: int  # Число выполненных команд (cycles)
+
+class StepBackRequest(BaseModel):
+    """Запрос на шаг назад"""
+    count: int = 1  # Число команд
+
+class JobRequest(BaseModel):
+    """Запрос на фоновое выполнение программы"""
+    source_code: Optional[str] = None  # Программа (если не указана - программа задачи)
+    task_id: Optional[int] = None      # Задача, данные которой загружаются перед запуском
+    max_steps: int = 3_000_000         # Бюджет в фазах (одна команда = 3 фазы)
+    trace: bool = False                # Записать трассу выполнения в файл (GET /api/jobs/{id}/trace)
+    trace_compress: bool = True        # Сжимать трассу zlib
+
 class ResetRequest(BaseModel):
     """Запрос на сброс"""
     pass
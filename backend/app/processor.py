@@ -1,17 +1,89 @@
 """
 Эмулятор одноадресного процессора с архитектурой Фон-Неймана
 """
-from typing import List, Dict, Any, Optional, Tuple
-from .models import ProcessorState, MemoryState, AddressingMode, InstructionField
+from typing import List, Dict, Any, Optional, Tuple, Set, FrozenSet, Iterable
+from .models import ProcessorState, AddressingMode, InstructionField
+from .memory import Memory
+from .history import (
+    HISTORY_RAM_FIELDS, DEFAULT_HISTORY_CAPACITY, DEFAULT_SUMMARY_CAPACITY, ExecutionHistory
+)
+from .writes import DEFAULT_WRITE_INDEX_CAPACITY
+from .blocks import BlockCompiler
+from .timeline import CheckpointTimeline, Checkpoint
+from .versions import StateVersions, VERSION_REGISTERS
+from .flags import (
+    FLAG_ZERO, FLAG_CARRY, FLAG_OVERFLOW, FLAG_NEGATIVE, FLAG_BITS,
+    FLAGS_ADD, FLAGS_SUB, FLAGS_LOGIC, FLAG_KINDS, flags_to_dict, flags_from_dict
+)
+
+# Псевдо-опкод для команд, которые не удалось декодировать при загрузке программы
+DECODE_ERROR = -1
+# Псевдо-опкод записи кэша декодирования, инвалидированной записью в код (режим фон Неймана)
+DECODE_STALE = -2
+
+# Формат команды в RAM (режим фон Неймана): два 16-битных слова на команду
+#   слово 0: [15:8] - опкод, [1:0] - вид операнда; слово 1: операнд
+CODE_WORDS = 2
+OPERAND_IMMEDIATE = 0
+OPERAND_DIRECT = 1
+OPERAND_NONE = 2
+OPERAND_INVALID = 3     # Операнд не кодируется (ошибка разбора), сообщение хранится отдельно
+ILLEGAL_OPCODE = 0xFE   # Команда, которую не удалось декодировать при загрузке
+
+JUMP_INSTRUCTIONS = ('JMP', 'JZ', 'JNZ', 'JC', 'JNC', 'JV', 'JNV', 'JN', 'JNN')
+
+# Условные переходы для суперкоманды LDA/CMP/Jcc: (флаг, переход при значении флага)
+CONDITIONAL_JUMP_FLAGS = {
+    'JZ': (FLAG_ZERO, True), 'JNZ': (FLAG_ZERO, False),
+    'JC': (FLAG_CARRY, True), 'JNC': (FLAG_CARRY, False),
+    'JV': (FLAG_OVERFLOW, True), 'JNV': (FLAG_OVERFLOW, False),
+    'JN': (FLAG_NEGATIVE, True), 'JNN': (FLAG_NEGATIVE, False),
+}
+
+# Размер страницы истории в API (GET /api/history)
+MAX_HISTORY_PAGE = 1000
+# Команд в окне повтора истории (GET /api/history/replay): три фазы на команду
+MAX_REPLAY_INSTRUCTIONS = MAX_HISTORY_PAGE // 3
+
+# Разделы состояния (get_state): регистры, полная RAM, история, исходный и машинный код
+STATE_SECTIONS = ('processor', 'ram', 'history', 'program')
+# Готовые наборы разделов; light - для пошагового выполнения
+STATE_PROFILES = {
+    'all': STATE_SECTIONS,
+    'light': ('processor',),
+}
+
+
+def resolve_state_sections(names: Optional[Iterable[str]] = None) -> FrozenSet[str]:
+    """Разделы состояния по селектору: имена разделов и профилей (None - все разделы)"""
+    if names is None:
+        return frozenset(STATE_SECTIONS)
+    sections = set()
+    for name in names:
+        if name in STATE_PROFILES:
+            sections.update(STATE_PROFILES[name])
+        elif name in STATE_SECTIONS:
+            sections.add(name)
+        else:
+            raise Exception(f"Unknown state section: {name} "
+                            f"(sections: {', '.join(STATE_SECTIONS)}; profiles: {', '.join(STATE_PROFILES)})")
+    return frozenset(sections)
+
 
 class RISCProcessor:
     """Эмулятор одноадресного процессора Фон-Неймана"""
     
-    def __init__(self, memory_size: int = 8192):
+    def __init__(self, memory_size: int = 8192, history_capacity: Optional[int] = DEFAULT_HISTORY_CAPACITY,
+                 summary_capacity: Optional[int] = DEFAULT_SUMMARY_CAPACITY,
+                 write_index_capacity: Optional[int] = DEFAULT_WRITE_INDEX_CAPACITY):
         self.memory_size = memory_size
+        # Емкость истории фаз (см. ExecutionHistory): подробные записи, сводки execute
+        # и индекс записей в память по адресам
+        self.history_capacity = history_capacity
+        self.summary_capacity = summary_capacity
+        self.write_index_capacity = write_index_capacity
         self.processor = ProcessorState()
-        self.memory = MemoryState()
-        self.memory.ram = [0] * memory_size
+        self.memory = Memory(memory_size, self._new_history())
         self.labels = {}  # Метки для переходов
         self.compiled_code = []
         self.source_code = ""
@@ -21,6 +93,15 @@ class RISCProcessor:
         self._current_instruction = None
         self._current_operands = None
         
+        # Записи в RAM текущей фазы (адрес, было, стало) для дельта-истории
+        self._ram_writes = None
+        
+        # Ленивые флаги: последняя операция, влияющая на флаги, хранится как
+        # (вид, результат, ACC до операции, операнд), а сами флаги вычисляются
+        # только по запросу (условный переход, get_state, запись истории)
+        self._flag_bits = 0
+        self._flag_args = None
+        
         # Система команд одноадресного процессора (ACC + один операнд)
         self.instructions = {
             # Арифметико-логические команды
@@ -55,14 +136,61 @@ class RISCProcessor:
             'NOP':  0x00,   # NOP         - нет операции
         }
         
+        # Таблица обработчиков по опкоду и декодированная программа (заполняется в load_program)
+        self._opcode_names = {opcode: name for name, opcode in self.instructions.items()}
+        self._handlers = self._build_dispatch_table()
+        self._decoded = []
+        self._program_meta = []
+        
+        # Скомпилированные базовые блоки для run(): _blocks[pc] - блок с началом в pc,
+        # None - еще не компилировался, False - команду выполняет интерпретатор
+        self._block_compiler = BlockCompiler(self.instructions)
+        self._program_key = None
+        self._blocks = []
+        
+        # Суперкоманды для интерпретатора run(): _fused[pc] = (длина, обработчик, аргументы)
+        # или None. В пошаговом режиме (step) не используются.
+        self._fused = []
+        
+        # Режим фон Неймана: команды выбираются из memory.ram (CODE_WORDS слов на команду,
+        # начиная с code_base), _decoded служит кэшем декодирования по адресам
+        self.fetch_from_ram = False
+        self.code_base = 0x0000
+        self._code_errors = {}
+        self._code_modified = False
+        
+        # Контрольные точки для перемотки (seek / step_back). _timeline_mark - состояние
+        # после последнего выполнения: расхождение с ним означает изменение извне
+        self.timeline = CheckpointTimeline()
+        self._timeline_mark = None
+        
+        # Версии состояния для ETag и изменений с версии клиента (GET /api/state)
+        self.versions = StateVersions()
+        
+        # Кооперативная отмена: функция, возвращающая True, если выполнение нужно
+        # прервать (проверяется run() на границах отрезков, см. EmulatorExecutor)
+        self.cancel_check = None
+        
+    def _new_history(self) -> ExecutionHistory:
+        """Пустая история фаз с емкостью процессора"""
+        return ExecutionHistory(capacity=self.history_capacity, summary_capacity=self.summary_capacity,
+                                write_index_capacity=self.write_index_capacity)
+    
     def reset(self):
         """Сброс процессора в начальное состояние"""
         self.processor = ProcessorState()
-        self.memory = MemoryState()
-        self.memory.ram = [0] * self.memory_size
+        self.memory = Memory(self.memory_size, self._new_history())
         self.labels = {}
         self.compiled_code = []
         self.source_code = ""
+        self._decoded = []
+        self._program_meta = []
+        self._program_key = None
+        self._blocks = []
+        self._fused = []
+        self.set_flags(0)
+        self.timeline.clear()
+        self._timeline_mark = None
         
         # Сбрасываем промежуточные переменные для системы фаз выполнения
         self._current_instruction_line = None
@@ -198,418 +326,586 @@ class RISCProcessor:
     def _set_operand_value(self, operand: Any, value: int, addressing_mode: AddressingMode):
         """Установка значения операнда в зависимости от режима адресации (одноадресная архитектура)"""
         if addressing_mode == AddressingMode.DIRECT:
-            # КРИТИЧНО: Создаем новый список для Pydantic, чтобы изменения были видны
-            if not self.memory.ram:
-                # Если память не инициализирована, создаем новую
-                min_size = max(operand + 1, self.memory_size)
-                self.memory.ram = [0] * min_size
-                print(f"DEBUG _set_operand_value: Инициализирована память размером {min_size}")
+            ram = self.memory.ram
+            # Гарантируем достаточный размер памяти (запись идет на месте, без копии RAM)
+            if operand >= len(ram):
+                ram.ensure_size(max(operand + 1, self.memory_size))
+                print(f"DEBUG _set_operand_value: Расширена память до {len(ram)} для адреса 0x{operand:04X}")
             
-            # Гарантируем достаточный размер памяти
-            if operand >= len(self.memory.ram):
-                new_ram = list(self.memory.ram)
-                new_ram.extend([0] * (operand + 1 - len(new_ram)))
-                self.memory.ram = new_ram
-                print(f"DEBUG _set_operand_value: Расширена память до {len(self.memory.ram)} для адреса 0x{operand:04X}")
-            
-            # Создаем новый список для Pydantic
-            new_ram = list(self.memory.ram)
-            new_ram[operand] = int(value) & 0xFFFF
-            self.memory.ram = new_ram
-            print(f"DEBUG _set_operand_value: Записано значение 0x{value:04X} (decimal {value}) по адресу 0x{operand:04X}, ram[0x{operand:04X}]={self.memory.ram[operand]}")
+            old_value = ram[operand]
+            ram[operand] = value
+            if self._ram_writes is not None:
+                self._ram_writes.append((operand, old_value, value & 0xFFFF))
     
     def update_flags(self, result: int, operation: str = "", acc_before: int = 0, operand: int = 0):
         """
         Обновление флагов после операции для беззнаковой архитектуры (0x0000-0xFFFF)
         
+        Флаги не вычисляются сразу: запоминается только последняя операция и ее
+        операнды, а значения флагов считаются при первом обращении (см. flag_bits).
+        
         Args:
             result: Результат операции (уже обрезанный до 16 бит)
             operation: Тип операции ("add", "sub", "cmp", "mul", "div", "and", "or", "xor", "not", "load")
             acc_before: Значение аккумулятора ДО операции (для проверки переполнения)
             operand: Значение операнда (для проверки переполнения)
         """
-        # Приводим результат к 16-битному беззнаковому числу
-        result_unsigned = int(result) & 0xFFFF
-        
-        # Z (Zero) - флаг нуля: устанавливается в 1, если результат равен нулю
-        self.processor.flags["zero"] = (result_unsigned == 0)
-        
-        # N (Negative) - флаг знака: для беззнаковых чисел проверяем старший бит (бит 15)
-        # Если старший бит установлен, число >= 32768, что можно интерпретировать как "отрицательное"
-        # в контексте сравнения для беззнаковых чисел
-        self.processor.flags["negative"] = ((result_unsigned & 0x8000) != 0)
-        
-        # C (Carry) - флаг переноса: устанавливается при переполнении 16-битного диапазона
-        if operation == "add":
-            # Для сложения: перенос, если acc_before + operand > 0xFFFF
-            full_result = acc_before + operand
-            self.processor.flags["carry"] = (full_result > 0xFFFF)
-        elif operation == "sub":
-            # Для вычитания: перенос (заем), если acc_before < operand (результат был бы отрицательным)
-            # Для беззнаковых чисел: если acc < operand, то результат "отрицательный" (заем)
-            self.processor.flags["carry"] = (acc_before < operand)
-        elif operation == "cmp":
-            # Для сравнения: перенос, если ACC < operand (результат вычитания "отрицательный")
-            self.processor.flags["carry"] = (acc_before < operand)
-        else:
-            # Для остальных операций перенос не устанавливается
-            self.processor.flags["carry"] = False
-        
-        # V (Overflow) - флаг переполнения: для беззнаковых чисел проверяем переполнение при сложении/вычитании
-        if operation == "add":
-            # Переполнение при сложении: если результат < любого из операндов
-            self.processor.flags["overflow"] = (result_unsigned < acc_before or result_unsigned < operand)
-        elif operation == "sub":
-            # Переполнение при вычитании: для беззнаковых чисел переполнение = заем (carry)
-            self.processor.flags["overflow"] = (acc_before < operand)
-        elif operation == "cmp":
-            # Для сравнения переполнение = заем
-            self.processor.flags["overflow"] = (acc_before < operand)
-        else:
-            # Для остальных операций переполнение не устанавливается
-            self.processor.flags["overflow"] = False
-        
-        print(f"DEBUG update_flags: result=0x{result_unsigned:04X}, operation={operation}, "
-              f"Z={self.processor.flags['zero']}, C={self.processor.flags['carry']}, "
-              f"O={self.processor.flags['overflow']}, N={self.processor.flags['negative']}")
+        self._flag_args = (FLAG_KINDS.get(operation, FLAGS_LOGIC), result & 0xFFFF, acc_before, operand)
+    
+    def _flag(self, bit: int) -> bool:
+        """Значение одного флага; вычисляет только его, не трогая остальные"""
+        args = self._flag_args
+        if args is None:
+            return bool(self._flag_bits & bit)
+        kind, result, acc_before, operand = args
+        # Z (Zero) - результат равен нулю
+        if bit == FLAG_ZERO:
+            return result == 0
+        # N (Negative) - установлен старший бит (бит 15) результата
+        if bit == FLAG_NEGATIVE:
+            return (result & 0x8000) != 0
+        if kind == FLAGS_ADD:
+            if bit == FLAG_CARRY:
+                # C (Carry) - перенос, если acc_before + operand > 0xFFFF
+                return acc_before + operand > 0xFFFF
+            # V (Overflow) - результат меньше любого из операндов
+            return result < acc_before or result < operand
+        if kind == FLAGS_SUB:
+            # Для вычитания и сравнения C и V означают заем (ACC < operand)
+            return acc_before < operand
+        # Для остальных операций перенос и переполнение не устанавливаются
+        return False
+    
+    @property
+    def flag_bits(self) -> int:
+        """Флаги процессора в виде битовой маски (FLAG_ZERO | FLAG_CARRY | ...)"""
+        if self._flag_args is not None:
+            bits = 0
+            for _, bit in FLAG_BITS:
+                if self._flag(bit):
+                    bits |= bit
+            self._flag_bits = bits
+            self._flag_args = None
+        return self._flag_bits
+    
+    def set_flags(self, bits: int):
+        """Установить флаги битовой маской (отменяет отложенное вычисление)"""
+        self._flag_args = None
+        self._flag_bits = bits & 0xF
+    
+    def get_flags(self) -> Dict[str, bool]:
+        """Флаги процессора в виде словаря"""
+        return flags_to_dict(self.flag_bits)
     
     def _update_accumulator(self, value: int):
         """Обновить аккумулятор значением value"""
         self.processor.accumulator = int(value) & 0xFFFF
         print(f"DEBUG _update_accumulator: ACC = 0x{self.processor.accumulator:04X} (decimal {self.processor.accumulator})")
     
-    def execute_instruction(self, instruction: str, operands: List[str] = None):
-        """Выполнение одной инструкции (одноадресная архитектура)"""
+    def _build_dispatch_table(self) -> Dict[int, Any]:
+        """Таблица обработчиков команд, индексированная опкодом"""
+        return {
+            self.instructions['ADD']: self._op_add,
+            self.instructions['SUB']: self._op_sub,
+            self.instructions['MUL']: self._op_mul,
+            self.instructions['DIV']: self._op_div,
+            self.instructions['AND']: self._op_and,
+            self.instructions['OR']: self._op_or,
+            self.instructions['XOR']: self._op_xor,
+            self.instructions['NOT']: self._op_not,
+            self.instructions['LDA']: self._op_lda,
+            self.instructions['STA']: self._op_sta,
+            self.instructions['LDI']: self._op_ldi,
+            self.instructions['CMP']: self._op_cmp,
+            self.instructions['JMP']: self._op_jmp,
+            self.instructions['JZ']: self._op_jz,
+            self.instructions['JNZ']: self._op_jnz,
+            self.instructions['JC']: self._op_jc,
+            self.instructions['JNC']: self._op_jnc,
+            self.instructions['JV']: self._op_jv,
+            self.instructions['JNV']: self._op_jnv,
+            self.instructions['JN']: self._op_jn,
+            self.instructions['JNN']: self._op_jnn,
+            self.instructions['HALT']: self._op_halt,
+            self.instructions['NOP']: self._op_nop,
+            DECODE_ERROR: self._op_error,
+            DECODE_STALE: self._op_refetch,
+        }
+    
+    def _predecode(self, instruction: str, operands: List[str] = None) -> Tuple[int, Any, Optional[AddressingMode]]:
+        """Декодирование команды в компактную форму (опкод, операнд, режим адресации)
+        
+        Ошибки формата не выбрасываются сразу, а превращаются в команду DECODE_ERROR,
+        которая выбросит исключение при выполнении (как и при разборе строки на лету).
+        """
         instruction = instruction.upper().strip()
         operands = operands or []
         
         if instruction not in self.instructions:
-            raise Exception(f"Unknown instruction: {instruction}")
-        
-        # Арифметические операции: операнд всегда адрес памяти
-        # Формат: ADD addr - ACC = ACC + память[addr]
-        if instruction == "ADD":
-            if len(operands) >= 1:
-                operand, mode = self._parse_operand(operands[0])
-                # Арифметические операции работают только с памятью
-                if mode != AddressingMode.DIRECT:
-                    raise Exception(f"ADD requires DIRECT addressing mode (memory address), got {mode}")
-                val = self._get_operand_value(operand, mode)
-                acc_before = self.processor.accumulator  # Сохраняем значение ДО операции
-                result = acc_before + val
-                result = int(result) & 0xFFFF
-                self.update_flags(result, "add", acc_before, val)  # Передаем значения ДО операции
-                self._update_accumulator(result)
-                print(f"DEBUG ADD: ACC={self.processor.accumulator:04X}, memory[0x{operand:04X}]={val:04X}, result={result:04X}")
-            else:
-                raise Exception(f"ADD requires 1 operand: ADD addr")
-        
-        # Формат: SUB addr - ACC = ACC - память[addr]
-        elif instruction == "SUB":
-            if len(operands) >= 1:
-                operand, mode = self._parse_operand(operands[0])
-                if mode != AddressingMode.DIRECT:
-                    raise Exception(f"SUB requires DIRECT addressing mode (memory address), got {mode}")
-                val = self._get_operand_value(operand, mode)
-                acc_before = self.processor.accumulator  # Сохраняем значение ДО операции
-                result = acc_before - val
-                # Правильная обработка отрицательных результатов для беззнаковых чисел
-                # Если результат отрицательный, преобразуем в беззнаковое представление
-                if result < 0:
-                    result = (result + 0x10000) & 0xFFFF
-                else:
-                    result = result & 0xFFFF
-                self.update_flags(result, "sub", acc_before, val)  # Передаем значения ДО операции
-                self._update_accumulator(result)
-            else:
-                raise Exception(f"SUB requires 1 operand: SUB addr")
-        
-        # Формат: MUL addr - ACC = ACC * память[addr]
-        elif instruction == "MUL":
-            if len(operands) >= 1:
-                operand, mode = self._parse_operand(operands[0])
-                if mode != AddressingMode.DIRECT:
-                    raise Exception(f"MUL requires DIRECT addressing mode (memory address), got {mode}")
-                val = self._get_operand_value(operand, mode)
-                acc_before = self.processor.accumulator
-                result = acc_before * val
-                result = result & 0xFFFF
-                self.update_flags(result, "mul", acc_before, val)
-                self._update_accumulator(result)
-            else:
-                raise Exception(f"MUL requires 1 operand: MUL addr")
-        
-        # Формат: DIV addr - ACC = ACC / память[addr]
-        elif instruction == "DIV":
-            if len(operands) >= 1:
-                operand, mode = self._parse_operand(operands[0])
-                if mode != AddressingMode.DIRECT:
-                    raise Exception(f"DIV requires DIRECT addressing mode (memory address), got {mode}")
-                val = self._get_operand_value(operand, mode)
-                if val == 0:
-                    raise Exception("Division by zero")
-                acc_before = self.processor.accumulator
-                result = acc_before // val
-                result = result & 0xFFFF
-                self.update_flags(result, "div", acc_before, val)
-                self._update_accumulator(result)
-            else:
-                raise Exception(f"DIV requires 1 operand: DIV addr")
-            
-        # Логические операции: операнд всегда адрес памяти
-        # Формат: AND addr - ACC = ACC & память[addr]
-        elif instruction == "AND":
-            if len(operands) >= 1:
-                operand, mode = self._parse_operand(operands[0])
-                if mode != AddressingMode.DIRECT:
-                    raise Exception(f"AND requires DIRECT addressing mode (memory address), got {mode}")
-                val = self._get_operand_value(operand, mode)
-                acc_before = self.processor.accumulator
-                result = acc_before & val
-                result = result & 0xFFFF
-                self.update_flags(result, "and", acc_before, val)
-                self._update_accumulator(result)
-            else:
-                raise Exception(f"AND requires 1 operand: AND addr")
-            
-        # Формат: OR addr - ACC = ACC | память[addr]
-        elif instruction == "OR":
-            if len(operands) >= 1:
-                operand, mode = self._parse_operand(operands[0])
-                if mode != AddressingMode.DIRECT:
-                    raise Exception(f"OR requires DIRECT addressing mode (memory address), got {mode}")
-                val = self._get_operand_value(operand, mode)
-                acc_before = self.processor.accumulator
-                result = acc_before | val
-                result = result & 0xFFFF
-                self.update_flags(result, "or", acc_before, val)
-                self._update_accumulator(result)
-            else:
-                raise Exception(f"OR requires 1 operand: OR addr")
-            
-        # Формат: XOR addr - ACC = ACC ^ память[addr]
-        elif instruction == "XOR":
-            if len(operands) >= 1:
-                operand, mode = self._parse_operand(operands[0])
-                if mode != AddressingMode.DIRECT:
-                    raise Exception(f"XOR requires DIRECT addressing mode (memory address), got {mode}")
-                val = self._get_operand_value(operand, mode)
-                acc_before = self.processor.accumulator
-                result = acc_before ^ val
-                result = result & 0xFFFF
-                self.update_flags(result, "xor", acc_before, val)
-                self._update_accumulator(result)
-            else:
-                raise Exception(f"XOR requires 1 operand: XOR addr")
-            
-        # Формат: NOT - ACC = ~ACC
-        elif instruction == "NOT":
-            acc_before = self.processor.accumulator
-            result = ~acc_before
-            result = result & 0xFFFF
-            self.update_flags(result, "not", acc_before, 0)
-            self._update_accumulator(result)
-            
-        # Команды загрузки и сохранения
-        # Формат: LDA addr - ACC = память[addr] (загрузка из памяти)
-        elif instruction == "LDA":
-            if len(operands) >= 1:
-                operand, mode = self._parse_operand(operands[0])
-                # LDA всегда работает с адресом памяти
-                if mode != AddressingMode.DIRECT:
-                    raise Exception(f"LDA requires DIRECT addressing mode (memory address), got {mode}")
-                val = self._get_operand_value(operand, mode)
-                val = int(val) & 0xFFFF
-                self._update_accumulator(val)
-                # Обновляем флаги после загрузки (особенно флаг zero)
-                self.update_flags(val, "load", 0, 0)
-                print(f"DEBUG LDA: ACC={self.processor.accumulator:04X}, memory[0x{operand:04X}]={val:04X}")
-            else:
-                raise Exception(f"LDA requires 1 operand: LDA addr")
-            
-        # Формат: STA addr - память[addr] = ACC (сохранение в память)
-        elif instruction == "STA":
-            if len(operands) >= 1:
-                operand, mode = self._parse_operand(operands[0])
-                if mode != AddressingMode.DIRECT:
-                    raise Exception(f"STA requires DIRECT addressing mode (memory address), got {mode}")
-                val = self.processor.accumulator
-                self._set_operand_value(operand, val, mode)
-                print(f"DEBUG STA: memory[0x{operand:04X}] = ACC={val:04X}")
-            else:
-                raise Exception(f"STA requires 1 operand: STA addr")
-            
-        # Формат: LDI imm - ACC = imm (непосредственная загрузка константы)
-        elif instruction == "LDI":
-            if len(operands) >= 1:
-                imm, mode = self._parse_operand(operands[0])
-                # LDI всегда работает с непосредственным значением
-                if mode != AddressingMode.IMMEDIATE:
-                    raise Exception(f"LDI requires IMMEDIATE addressing mode (constant value), got {mode}")
-                imm = int(imm) & 0xFFFF
-                self._update_accumulator(imm)
-                # Обновляем флаги после загрузки (особенно флаг zero)
-                self.update_flags(imm, "load", 0, 0)
-                print(f"DEBUG LDI: ACC={self.processor.accumulator:04X}, imm={imm:04X}")
-            else:
-                raise Exception(f"LDI requires 1 operand: LDI imm")
-            
-        # Команды сравнения: операнд всегда адрес памяти
-        # Формат: CMP addr - установить флаги на основе (ACC - память[addr])
-        # CMP не изменяет аккумулятор, только устанавливает флаги
-        elif instruction == "CMP":
-            if len(operands) >= 1:
-                operand, mode = self._parse_operand(operands[0])
-                if mode != AddressingMode.DIRECT:
-                    raise Exception(f"CMP requires DIRECT addressing mode (memory address), got {mode}")
-                val = self._get_operand_value(operand, mode)
-                acc_before = self.processor.accumulator  # Сохраняем значение ДО операции
-                result = acc_before - val
-                # Правильная обработка отрицательных результатов для беззнаковых чисел
-                # Если результат отрицательный, преобразуем в беззнаковое представление
-                if result < 0:
-                    result = (result + 0x10000) & 0xFFFF
-                else:
-                    result = result & 0xFFFF
-                self.update_flags(result, "cmp", acc_before, val)  # Передаем значения ДО операции
-                # CMP не изменяет аккумулятор - он остается прежним
-                print(f"DEBUG CMP: ACC={acc_before:04X}, memory[0x{operand:04X}]={val:04X}, result={result:04X}, "
-                      f"Z={self.processor.flags['zero']}, C={self.processor.flags['carry']}, "
-                      f"N={self.processor.flags['negative']}")
-            else:
-                raise Exception(f"CMP requires 1 operand: CMP addr")
-        
-        # Формат: JMP address - безусловный переход
-        elif instruction == "JMP":
-            if len(operands) >= 1:
-                addr, mode1 = self._parse_operand(operands[0])
-                if mode1 == AddressingMode.IMMEDIATE:
-                    self.processor.program_counter = addr
-                else:
-                    self.processor.program_counter = self._get_operand_value(addr, mode1)
-            else:
-                raise Exception(f"JMP requires 1 operand: JMP address")
-            return  # Не увеличиваем PC
-        
-        # Формат: JZ address - переход если Z=1
-        elif instruction == "JZ":
-            if len(operands) >= 1:
-                if self.processor.flags["zero"]:
-                    addr, mode1 = self._parse_operand(operands[0])
-                    if mode1 == AddressingMode.IMMEDIATE:
-                        self.processor.program_counter = addr
-                    else:
-                        self.processor.program_counter = self._get_operand_value(addr, mode1)
-                    return
-            else:
-                raise Exception(f"JZ requires 1 operand: JZ address")
-        
-        # Формат: JNZ address - переход если Z=0
-        elif instruction == "JNZ":
-            if len(operands) >= 1:
-                if not self.processor.flags["zero"]:
-                    addr, mode1 = self._parse_operand(operands[0])
-                    if mode1 == AddressingMode.IMMEDIATE:
-                        self.processor.program_counter = addr
-                    else:
-                        self.processor.program_counter = self._get_operand_value(addr, mode1)
-                    return
-            else:
-                raise Exception(f"JNZ requires 1 operand: JNZ address")
-                
-        # Формат: JC address - переход если C=1
-        elif instruction == "JC":
-            if len(operands) >= 1:
-                if self.processor.flags["carry"]:
-                    addr, mode1 = self._parse_operand(operands[0])
-                    if mode1 == AddressingMode.IMMEDIATE:
-                        self.processor.program_counter = addr
-                    else:
-                        self.processor.program_counter = self._get_operand_value(addr, mode1)
-                    return
-            else:
-                raise Exception(f"JC requires 1 operand: JC address")
-                
-        # Формат: JNC address - переход если C=0
-        elif instruction == "JNC":
-            if len(operands) >= 1:
-                if not self.processor.flags["carry"]:
-                    addr, mode1 = self._parse_operand(operands[0])
-                    if mode1 == AddressingMode.IMMEDIATE:
-                        self.processor.program_counter = addr
-                    else:
-                        self.processor.program_counter = self._get_operand_value(addr, mode1)
-                    return
-            else:
-                raise Exception(f"JNC requires 1 operand: JNC address")
-        
-        # Формат: JV address - переход если V=1 (overflow)
-        elif instruction == "JV":
-            if len(operands) >= 1:
-                if self.processor.flags["overflow"]:
-                    addr, mode1 = self._parse_operand(operands[0])
-                    if mode1 == AddressingMode.IMMEDIATE:
-                        self.processor.program_counter = addr
-                    else:
-                        self.processor.program_counter = self._get_operand_value(addr, mode1)
-                    return
-            else:
-                raise Exception(f"JV requires 1 operand: JV address")
-        
-        # Формат: JNV address - переход если V=0 (no overflow)
-        elif instruction == "JNV":
-            if len(operands) >= 1:
-                if not self.processor.flags["overflow"]:
-                    addr, mode1 = self._parse_operand(operands[0])
-                    if mode1 == AddressingMode.IMMEDIATE:
-                        self.processor.program_counter = addr
-                    else:
-                        self.processor.program_counter = self._get_operand_value(addr, mode1)
-                    return
-            else:
-                raise Exception(f"JNV requires 1 operand: JNV address")
-        
-        # Формат: JN address - переход если N=1 (negative flag установлен)
-        elif instruction == "JN":
-            if len(operands) >= 1:
-                if self.processor.flags["negative"]:
-                    addr, mode1 = self._parse_operand(operands[0])
-                    if mode1 == AddressingMode.IMMEDIATE:
-                        self.processor.program_counter = addr
-                    else:
-                        self.processor.program_counter = self._get_operand_value(addr, mode1)
-                    return
-            else:
-                raise Exception(f"JN requires 1 operand: JN address")
-        
-        # Формат: JNN address - переход если N=0 (negative flag не установлен)
-        elif instruction == "JNN":
-            if len(operands) >= 1:
-                if not self.processor.flags["negative"]:
-                    addr, mode1 = self._parse_operand(operands[0])
-                    if mode1 == AddressingMode.IMMEDIATE:
-                        self.processor.program_counter = addr
-                    else:
-                        self.processor.program_counter = self._get_operand_value(addr, mode1)
-                    return
+            return DECODE_ERROR, f"Unknown instruction: {instruction}", None
+        
+        opcode = self.instructions[instruction]
+        
+        # Команды без операнда
+        if instruction in ('NOT', 'HALT', 'NOP'):
+            return opcode, None, AddressingMode.IMMEDIATE
+        
+        if not operands:
+            if instruction in JUMP_INSTRUCTIONS:
+                hint = "address"
+            elif instruction == "LDI":
+                hint = "imm"
             else:
-                raise Exception(f"JNN requires 1 operand: JNN address")
+                hint = "addr"
+            return DECODE_ERROR, f"{instruction} requires 1 operand: {instruction} {hint}", None
         
-        elif instruction == "HALT":
-            self.processor.is_halted = True
-            return
+        try:
+            operand, mode = self._parse_operand(operands[0])
+        except Exception as e:
+            if instruction in JUMP_INSTRUCTIONS:
+                # Для переходов ошибка операнда проявляется только при выполнении перехода
+                return opcode, str(e), None
+            return DECODE_ERROR, str(e), None
+        
+        # Переходы: IMMEDIATE - адрес перехода, DIRECT - адрес ячейки с адресом перехода
+        if instruction in JUMP_INSTRUCTIONS:
+            return opcode, operand, mode
+        
+        # LDI всегда работает с непосредственным значением
+        if instruction == "LDI":
+            if mode != AddressingMode.IMMEDIATE:
+                return DECODE_ERROR, f"LDI requires IMMEDIATE addressing mode (constant value), got {mode}", None
+            try:
+                return opcode, int(operand) & 0xFFFF, mode
+            except Exception as e:
+                return DECODE_ERROR, str(e), None
         
-        elif instruction == "NOP":
-            pass
+        # Остальные команды работают только с адресом памяти
+        if mode != AddressingMode.DIRECT:
+            return DECODE_ERROR, f"{instruction} requires DIRECT addressing mode (memory address), got {mode}", None
+        return opcode, operand, mode
+    
+    def _decode_program(self, compiled_code: List[str]):
+        """Однократное декодирование программы при загрузке
+        
+        Для каждого PC сохраняются:
+        - _decoded[pc] - (опкод, операнд, режим) для таблицы обработчиков
+        - _program_meta[pc] - строковое представление для истории и IR
+        """
+        self._decoded = []
+        self._program_meta = []
+        for line in compiled_code:
+            parts = line.replace(',', ' ').split()
+            instruction = parts[0] if parts else ""
+            operands = [p.strip() for p in parts[1:] if p.strip()] if len(parts) > 1 else []
+            self._decoded.append(self._predecode(instruction, operands))
+            self._program_meta.append((line, instruction, operands, self.instructions.get(instruction, 0)))
+        self._program_key = BlockCompiler.program_key(self._decoded)
+        self._blocks = [None] * len(self._decoded)
+        self._fused = self._fuse_program(self._decoded)
+    
+    def _fuse_program(self, decoded: List[Tuple[int, Any, Any]]) -> List[Optional[Tuple[int, Any, tuple]]]:
+        """Поиск частых последовательностей команд и замена их суперкомандами
+        
+        Распознаются идиомы задач:
+        - LDA a; CMP b; Jcc L  (L - известный адрес)
+        - LDI k; STA t
+        - LDA a; ADD b; STA c
+        Суперкоманда выполняет всю последовательность за одну диспетчеризацию,
+        с теми же флагами и тем же числом циклов. Исходные команды остаются в
+        _decoded, поэтому переход внутрь последовательности работает как обычно.
+        """
+        ops = self.instructions
+        names = {opcode: name for name, opcode in ops.items()}
+        
+        def address(i: int, opcode: int) -> Optional[int]:
+            """Адрес памяти команды decoded[i], если это opcode с корректным адресом"""
+            if i >= len(decoded):
+                return None
+            op, operand, mode = decoded[i]
+            if op != opcode or mode is not AddressingMode.DIRECT or operand < 0:
+                return None
+            return operand
         
-        # Увеличиваем счетчик команд, если не было перехода
+        fused = [None] * len(decoded)
+        for pc, (opcode, operand, mode) in enumerate(decoded):
+            if opcode == ops['LDA'] and address(pc, opcode) is not None:
+                cmp_addr = address(pc + 1, ops['CMP'])
+                if cmp_addr is not None and pc + 2 < len(decoded):
+                    jump_op, target, jump_mode = decoded[pc + 2]
+                    jump = names.get(jump_op)
+                    if jump in CONDITIONAL_JUMP_FLAGS and isinstance(target, int) and jump_mode is not None:
+                        flag, expected = CONDITIONAL_JUMP_FLAGS[jump]
+                        fused[pc] = (3, self._fused_lda_cmp_jcc, (operand, cmp_addr, flag, expected, target, jump_mode))
+                        continue
+                add_addr = address(pc + 1, ops['ADD'])
+                sta_addr = address(pc + 2, ops['STA'])
+                if add_addr is not None and sta_addr is not None:
+                    fused[pc] = (3, self._fused_lda_add_sta, (operand, add_addr, sta_addr))
+            elif opcode == ops['LDI'] and mode is not None:
+                sta_addr = address(pc + 1, ops['STA'])
+                if sta_addr is not None:
+                    fused[pc] = (2, self._fused_ldi_sta, (operand, sta_addr))
+        return fused
+    
+    def install_code(self):
+        """Режим фон Неймана: записать программу в RAM и декодировать ее из слов RAM
+        
+        Команда pc занимает слова [code_base + 2*pc, code_base + 2*pc + 1]; PC,
+        как и раньше, считает команды, поэтому адреса переходов не меняются.
+        _decoded становится кэшем декодирования: запись в слова команды
+        (STA, загрузка данных, API) инвалидирует только ее запись, и команда
+        декодируется заново при следующей выборке.
+        """
+        ram = self.memory.ram
+        ram.unwatch()
+        base = self.code_base
+        end = base + CODE_WORDS * len(self._decoded)
+        ram.ensure_size(end)
+        
+        self._code_errors = {}
+        for pc, entry in enumerate(self._decoded):
+            word0, word1 = self._encode_decoded(pc, entry)
+            ram[base + CODE_WORDS * pc] = word0
+            ram[base + CODE_WORDS * pc + 1] = word1
+        
+        # Кэш декодирования строится по словам RAM, а не по тексту программы
+        self._decoded = [self._decode_words(pc)[0] for pc in range(len(self._decoded))]
+        self._program_key = f"{BlockCompiler.program_key(self._decoded)}@{base:04X}"
+        self._blocks = [None] * len(self._decoded)
+        self._fused = self._fuse_program(self._decoded)
+        self._code_modified = False
+        ram.watch(base, end, self._on_code_write)
+        print(f"DEBUG install_code: Программа записана в RAM 0x{base:04X}-0x{end - 1:04X} ({len(self._decoded)} команд)")
+    
+    def code_range(self) -> Optional[Tuple[int, int]]:
+        """Диапазон адресов RAM с кодом программы [start, stop) в режиме фон Неймана"""
+        if not self.fetch_from_ram:
+            return None
+        return self.code_base, self.code_base + CODE_WORDS * len(self._decoded)
+    
+    def _encode_decoded(self, pc: int, entry: Tuple[int, Any, Any]) -> Tuple[int, int]:
+        """Декодированная команда -> два слова RAM"""
+        opcode, operand, mode = entry
+        if opcode < 0:
+            self._code_errors[pc] = str(operand)
+            return (ILLEGAL_OPCODE << 8) | OPERAND_INVALID, 0
+        if mode is None or isinstance(operand, str):
+            # Переход с неразбираемым операндом или на неизвестную метку
+            self._code_errors[pc] = operand if mode is None else f"Unknown label: {operand}"
+            return (opcode << 8) | OPERAND_INVALID, 0
+        if operand is None:
+            return (opcode << 8) | OPERAND_NONE, 0
+        kind = OPERAND_DIRECT if mode is AddressingMode.DIRECT else OPERAND_IMMEDIATE
+        return (opcode << 8) | kind, operand & 0xFFFF
+    
+    def _decode_words(self, pc: int) -> Tuple[Tuple[int, Any, Any], int, int]:
+        """Декодировать команду pc из слов RAM: ((опкод, операнд, режим), слово 0, слово 1)"""
+        ram = self.memory.ram
+        address = self.code_base + CODE_WORDS * pc
+        word0 = ram[address] if address < len(ram) else 0
+        word1 = ram[address + 1] if address + 1 < len(ram) else 0
+        opcode = word0 >> 8
+        kind = word0 & 0x3
+        name = self._opcode_names.get(opcode)
+        
+        if name is None:
+            message = self._code_errors.get(pc, f"Illegal instruction 0x{word0:04X} at 0x{address:04X}")
+            return (DECODE_ERROR, message, None), word0, word1
+        if kind == OPERAND_INVALID:
+            message = self._code_errors.get(pc, f"Invalid operand in instruction 0x{word0:04X} at 0x{address:04X}")
+            if name in JUMP_INSTRUCTIONS:
+                return (opcode, message, None), word0, word1
+            return (DECODE_ERROR, message, None), word0, word1
+        if name in ('NOT', 'HALT', 'NOP'):
+            return (opcode, None, AddressingMode.IMMEDIATE), word0, word1
+        if kind == OPERAND_NONE:
+            return (DECODE_ERROR, f"{name} requires 1 operand", None), word0, word1
+        
+        mode = AddressingMode.DIRECT if kind == OPERAND_DIRECT else AddressingMode.IMMEDIATE
+        if name == 'LDI' and mode is not AddressingMode.IMMEDIATE:
+            return (DECODE_ERROR, f"LDI requires IMMEDIATE addressing mode (constant value), got {mode}", None), word0, word1
+        if name != 'LDI' and name not in JUMP_INSTRUCTIONS and mode is not AddressingMode.DIRECT:
+            return (DECODE_ERROR, f"{name} requires DIRECT addressing mode (memory address), got {mode}", None), word0, word1
+        return (opcode, word1, mode), word0, word1
+    
+    def _refetch(self, pc: int) -> Tuple[int, Any, Any]:
+        """Заново декодировать команду pc из RAM и обновить кэш декодирования"""
+        entry, word0, word1 = self._decode_words(pc)
+        opcode, operand, mode = entry
+        name = self._opcode_names.get(opcode, "")
+        if opcode == DECODE_ERROR:
+            line, name, operands = f".word 0x{word0:04X}, 0x{word1:04X}", "", []
+        elif mode is None:
+            operands = ["?"]
+            line = f"{name} ?"
+        elif operand is None:
+            operands = []
+            line = name
+        else:
+            operands = [f"0x{operand:04X}" if mode is AddressingMode.DIRECT else str(operand)]
+            line = f"{name} {operands[0]}"
+        self._decoded[pc] = entry
+        self._program_meta[pc] = (line, name, operands, max(opcode, 0))
+        return entry
+    
+    def _on_code_write(self, address: int):
+        """Запись в слова команды: инвалидировать кэш декодирования этой команды"""
+        pc = (address - self.code_base) // CODE_WORDS
+        self._decoded[pc] = (DECODE_STALE, pc, None)
+        # Суперкоманды, захватывающие эту команду, больше не действительны
+        for start in range(max(pc - 2, 0), pc + 1):
+            self._fused[start] = None
+        # Скомпилированные блоки отключаются до перезагрузки программы (список меняется на месте,
+        # чтобы это увидел и уже идущий цикл run())
+        if not self._code_modified:
+            self._code_modified = True
+            self._blocks[:] = [False] * len(self._blocks)
+    
+    def _read_memory(self, address: int) -> int:
+        """Чтение слова памяти (за пределами памяти читается 0)"""
+        ram = self.memory.ram
+        if 0 <= address < len(ram):
+            return ram[address]
+        return 0
+    
+    # Обработчики команд. Каждый обработчик получает уже декодированный операнд
+    # и сам изменяет PC (переход или PC + 1).
+    
+    def _op_add(self, address: int, mode: AddressingMode):
+        """ADD addr - ACC = ACC + память[addr]"""
+        val = self._read_memory(address)
+        acc_before = self.processor.accumulator
+        result = (acc_before + val) & 0xFFFF
+        self._flag_args = (FLAGS_ADD, result, acc_before, val)
+        self.processor.accumulator = result
+        self.processor.program_counter += 1
+    
+    def _op_sub(self, address: int, mode: AddressingMode):
+        """SUB addr - ACC = ACC - память[addr]"""
+        val = self._read_memory(address)
+        acc_before = self.processor.accumulator
+        result = (acc_before - val) & 0xFFFF
+        self._flag_args = (FLAGS_SUB, result, acc_before, val)
+        self.processor.accumulator = result
+        self.processor.program_counter += 1
+    
+    def _op_mul(self, address: int, mode: AddressingMode):
+        """MUL addr - ACC = ACC * память[addr]"""
+        val = self._read_memory(address)
+        acc_before = self.processor.accumulator
+        result = (acc_before * val) & 0xFFFF
+        self._flag_args = (FLAGS_LOGIC, result, acc_before, val)
+        self.processor.accumulator = result
+        self.processor.program_counter += 1
+    
+    def _op_div(self, address: int, mode: AddressingMode):
+        """DIV addr - ACC = ACC / память[addr]"""
+        val = self._read_memory(address)
+        if val == 0:
+            raise Exception("Division by zero")
+        acc_before = self.processor.accumulator
+        result = (acc_before // val) & 0xFFFF
+        self._flag_args = (FLAGS_LOGIC, result, acc_before, val)
+        self.processor.accumulator = result
+        self.processor.program_counter += 1
+    
+    def _op_and(self, address: int, mode: AddressingMode):
+        """AND addr - ACC = ACC & память[addr]"""
+        val = self._read_memory(address)
+        acc_before = self.processor.accumulator
+        result = (acc_before & val) & 0xFFFF
+        self._flag_args = (FLAGS_LOGIC, result, acc_before, val)
+        self.processor.accumulator = result
+        self.processor.program_counter += 1
+    
+    def _op_or(self, address: int, mode: AddressingMode):
+        """OR addr - ACC = ACC | память[addr]"""
+        val = self._read_memory(address)
+        acc_before = self.processor.accumulator
+        result = (acc_before | val) & 0xFFFF
+        self._flag_args = (FLAGS_LOGIC, result, acc_before, val)
+        self.processor.accumulator = result
+        self.processor.program_counter += 1
+    
+    def _op_xor(self, address: int, mode: AddressingMode):
+        """XOR addr - ACC = ACC ^ память[addr]"""
+        val = self._read_memory(address)
+        acc_before = self.processor.accumulator
+        result = (acc_before ^ val) & 0xFFFF
+        self._flag_args = (FLAGS_LOGIC, result, acc_before, val)
+        self.processor.accumulator = result
+        self.processor.program_counter += 1
+    
+    def _op_not(self, operand: Any, mode: AddressingMode):
+        """NOT - ACC = ~ACC"""
+        acc_before = self.processor.accumulator
+        result = ~acc_before & 0xFFFF
+        self._flag_args = (FLAGS_LOGIC, result, acc_before, 0)
+        self.processor.accumulator = result
+        self.processor.program_counter += 1
+    
+    def _op_lda(self, address: int, mode: AddressingMode):
+        """LDA addr - ACC = память[addr]"""
+        val = self._read_memory(address) & 0xFFFF
+        self.processor.accumulator = val
+        # Обновляем флаги после загрузки (особенно флаг zero)
+        self._flag_args = (FLAGS_LOGIC, val, 0, 0)
         self.processor.program_counter += 1
     
+    def _op_sta(self, address: int, mode: AddressingMode):
+        """STA addr - память[addr] = ACC"""
+        self._set_operand_value(address, self.processor.accumulator, mode)
+        self.processor.program_counter += 1
+    
+    def _op_ldi(self, imm: int, mode: AddressingMode):
+        """LDI imm - ACC = imm (значение уже обрезано до 16 бит при декодировании)"""
+        self.processor.accumulator = imm
+        self._flag_args = (FLAGS_LOGIC, imm, 0, 0)
+        self.processor.program_counter += 1
+    
+    def _op_cmp(self, address: int, mode: AddressingMode):
+        """CMP addr - установить флаги на основе (ACC - память[addr]), ACC не меняется"""
+        val = self._read_memory(address)
+        acc_before = self.processor.accumulator
+        self._flag_args = (FLAGS_SUB, (acc_before - val) & 0xFFFF, acc_before, val)
+        self.processor.program_counter += 1
+    
+    def _jump(self, target: Any, mode: Optional[AddressingMode]):
+        """Переход: IMMEDIATE - на адрес target, DIRECT - на адрес из памяти[target]"""
+        if mode is AddressingMode.IMMEDIATE:
+            if isinstance(target, str):
+                raise Exception(f"Unknown label: {target}")
+            self.processor.program_counter = target
+        elif mode is None:
+            # Операнд перехода не удалось разобрать при декодировании
+            raise Exception(target)
+        else:
+            self.processor.program_counter = self._read_memory(target)
+    
+    def _op_jmp(self, target: Any, mode: AddressingMode):
+        """JMP address - безусловный переход"""
+        self._jump(target, mode)
+    
+    def _op_jz(self, target: Any, mode: AddressingMode):
+        """JZ address - переход если Z=1"""
+        if self._flag(FLAG_ZERO):
+            self._jump(target, mode)
+        else:
+            self.processor.program_counter += 1
+    
+    def _op_jnz(self, target: Any, mode: AddressingMode):
+        """JNZ address - переход если Z=0"""
+        if not self._flag(FLAG_ZERO):
+            self._jump(target, mode)
+        else:
+            self.processor.program_counter += 1
+    
+    def _op_jc(self, target: Any, mode: AddressingMode):
+        """JC address - переход если C=1"""
+        if self._flag(FLAG_CARRY):
+            self._jump(target, mode)
+        else:
+            self.processor.program_counter += 1
+    
+    def _op_jnc(self, target: Any, mode: AddressingMode):
+        """JNC address - переход если C=0"""
+        if not self._flag(FLAG_CARRY):
+            self._jump(target, mode)
+        else:
+            self.processor.program_counter += 1
+    
+    def _op_jv(self, target: Any, mode: AddressingMode):
+        """JV address - переход если V=1"""
+        if self._flag(FLAG_OVERFLOW):
+            self._jump(target, mode)
+        else:
+            self.processor.program_counter += 1
+    
+    def _op_jnv(self, target: Any, mode: AddressingMode):
+        """JNV address - переход если V=0"""
+        if not self._flag(FLAG_OVERFLOW):
+            self._jump(target, mode)
+        else:
+            self.processor.program_counter += 1
+    
+    def _op_jn(self, target: Any, mode: AddressingMode):
+        """JN address - переход если N=1"""
+        if self._flag(FLAG_NEGATIVE):
+            self._jump(target, mode)
+        else:
+            self.processor.program_counter += 1
+    
+    def _op_jnn(self, target: Any, mode: AddressingMode):
+        """JNN address - переход если N=0"""
+        if not self._flag(FLAG_NEGATIVE):
+            self._jump(target, mode)
+        else:
+            self.processor.program_counter += 1
+    
+    def _op_halt(self, operand: Any, mode: AddressingMode):
+        """HALT - остановка (PC не меняется)"""
+        self.processor.is_halted = True
+    
+    def _op_nop(self, operand: Any, mode: AddressingMode):
+        """NOP - нет операции"""
+        self.processor.program_counter += 1
+    
+    def _op_error(self, message: str, mode: Any):
+        """Команда, которую не удалось декодировать"""
+        raise Exception(message)
+    
+    def _op_refetch(self, pc: int, mode: Any):
+        """Команда, в слова которой была запись: декодировать заново из RAM и выполнить"""
+        opcode, operand, mode = self._refetch(pc)
+        self._handlers[opcode](operand, mode)
+    
+    # Суперкоманды (см. _fuse_program). Каждая выполняет несколько команд и
+    # оставляет процессор в том же состоянии, что и последовательное выполнение.
+    
+    def _fused_lda_cmp_jcc(self, address: int, cmp_address: int, flag: int, expected: bool,
+                           target: int, mode: AddressingMode):
+        """LDA a; CMP b; Jcc L"""
+        acc = self._read_memory(address)
+        val = self._read_memory(cmp_address)
+        self.processor.accumulator = acc
+        self._flag_args = (FLAGS_SUB, (acc - val) & 0xFFFF, acc, val)
+        self.processor.program_counter += 2
+        if self._flag(flag) == expected:
+            self._jump(target, mode)
+        else:
+            self.processor.program_counter += 1
+    
+    def _fused_ldi_sta(self, imm: int, address: int):
+        """LDI k; STA t"""
+        self.processor.accumulator = imm
+        self._flag_args = (FLAGS_LOGIC, imm, 0, 0)
+        self._set_operand_value(address, imm, AddressingMode.DIRECT)
+        self.processor.program_counter += 2
+    
+    def _fused_lda_add_sta(self, address: int, add_address: int, sta_address: int):
+        """LDA a; ADD b; STA c"""
+        acc = self._read_memory(address)
+        val = self._read_memory(add_address)
+        result = (acc + val) & 0xFFFF
+        self._flag_args = (FLAGS_ADD, result, acc, val)
+        self.processor.accumulator = result
+        self._set_operand_value(sta_address, result, AddressingMode.DIRECT)
+        self.processor.program_counter += 3
+    
+    def execute_instruction(self, instruction: str, operands: List[str] = None):
+        """Выполнение одной инструкции (одноадресная архитектура)"""
+        opcode, operand, mode = self._predecode(instruction, operands)
+        self._handlers[opcode](operand, mode)
+    
     def step(self) -> bool:
         """Выполнить один шаг программы (одну фазу: fetch, decode или execute)"""
         if self.processor.is_halted:
             return False
         
+        # Изменения RAM/регистров между шагами фиксируются контрольной точкой
+        self._timeline_sync()
+        
         # КРИТИЧНО: Убеждаемся, что память инициализирована перед выполнением шага
         if not self.memory.ram:
             min_size = max(0x0200, self.memory_size)
@@ -622,33 +918,33 @@ class RISCProcessor:
             # ФАЗА FETCH: читаем команду из compiled_code[pc]
             if not self.compiled_code or self.processor.program_counter >= len(self.compiled_code):
                 self.processor.is_halted = True
+                self._timeline_mark = self._timeline_state()
                 return False
             
-            # Читаем команду из памяти команд
-            self._current_instruction_line = self.compiled_code[self.processor.program_counter]
+            # В режиме фон Неймана команда, в слова которой писали, декодируется заново из RAM
+            if self.fetch_from_ram and self._decoded[self.processor.program_counter][0] == DECODE_STALE:
+                self._refetch(self.processor.program_counter)
+            
+            # Читаем команду из памяти команд (строка и ее декодированное представление)
+            line, instruction_name, _, ir_value = self._program_meta[self.processor.program_counter]
+            self._current_instruction_line = line
             
             # Сохраняем состояние аккумулятора ДО fetch (аккумулятор НЕ меняется в fetch)
             accumulator_before = int(self.processor.accumulator) & 0xFFFF
             registers_before = [accumulator_before]  # Для совместимости с историей
-            flags_before = dict(self.processor.flags)
+            flags_before = self.get_flags()
             pc_before = self.processor.program_counter
             
             # Загружаем команду в IR
             self.processor.current_command = self._current_instruction_line
             self.processor.instruction_register_asm = self._current_instruction_line
             
-            # Определяем опкод команды для IR
-            parts = self._current_instruction_line.replace(',', ' ').split()
-            instruction_name = parts[0] if parts else ""
-            ir_value = self.instructions.get(instruction_name, 0)
+            # Опкод команды для IR определен при декодировании программы
             self.processor.instruction_register = ir_value
             
             # Сохраняем в историю с фазой fetch
             registers_before_final = registers_before if registers_before else [0]
             
-            # Сохраняем состояние RAM на момент fetch
-            ram_state = list(self.memory.ram) if self.memory.ram else []
-            
             history_entry = {
                 'command': str(self._current_instruction_line).strip(),
                 'instruction': '',
@@ -657,9 +953,6 @@ class RISCProcessor:
                 'registers_before': registers_before_final,
                 'registers_after': registers_before_final.copy(),  # В fetch регистры не меняются
                 'registers': registers_before_final.copy(),
-                'ram': ram_state.copy(),  # Состояние RAM на момент fetch
-                'ram_before': ram_state.copy(),
-                'ram_after': ram_state.copy(),  # В fetch RAM не меняется
                 'flags_before': {
                     'zero': bool(flags_before.get('zero', False)),
                     'carry': bool(flags_before.get('carry', False)),
@@ -690,35 +983,29 @@ class RISCProcessor:
             print(f"🔵 ФАЗА FETCH | PC=0x{pc_before:04X} | Команда: {self._current_instruction_line}")
             print(f"   {acc_str}")
             print(f"═══════════════════════════════════════════════════════════════")
-            self.memory.history.append(history_entry)
+            # RAM в fetch не меняется - в историю попадает только дельта (пустая)
+            self.memory.history.append(self._serialize_history_entry(history_entry), self.memory.ram)
             return True
                 
         # Если команда загружена, но не распарсена, переходим к decode
         elif self._current_instruction is None:
             # ФАЗА DECODE: парсим команду и операнды
-            instruction_line = self._current_instruction_line
-            parts = instruction_line.replace(',', ' ').split()
-            self._current_instruction = parts[0]
-            self._current_operands = [p.strip() for p in parts[1:] if p.strip()] if len(parts) > 1 else []
+            instruction_line, instruction_name, operands, ir_value = self._program_meta[self.processor.program_counter]
+            self._current_instruction = instruction_name
+            self._current_operands = operands
             
             # Устанавливаем опкод команды в IR
-            if self._current_instruction in self.instructions:
-                self.processor.instruction_register = self.instructions[self._current_instruction]
-            else:
-                self.processor.instruction_register = 0
+            self.processor.instruction_register = ir_value
             
             # Сохраняем состояние аккумулятора ДО decode (аккумулятор НЕ меняется в decode)
             accumulator_before = int(self.processor.accumulator) & 0xFFFF
             registers_before = [accumulator_before]  # Для совместимости с историей
-            flags_before = dict(self.processor.flags)
+            flags_before = self.get_flags()
             pc_before = self.processor.program_counter
             
             # Сохраняем в историю с фазой decode
             registers_before_final = registers_before if registers_before else [0]
             
-            # Сохраняем состояние RAM на момент decode
-            ram_state = list(self.memory.ram) if self.memory.ram else []
-            
             # Получаем IR и IR_asm
             ir_value = int(self.processor.instruction_register) & 0xFFFF
             ir_asm = str(self.processor.instruction_register_asm) if self.processor.instruction_register_asm else str(instruction_line).strip()
@@ -731,9 +1018,6 @@ class RISCProcessor:
                 'registers_before': registers_before_final,
                 'registers_after': registers_before_final.copy(),  # В decode регистры не меняются
                 'registers': registers_before_final.copy(),
-                'ram': ram_state.copy(),  # Состояние RAM на момент decode
-                'ram_before': ram_state.copy(),
-                'ram_after': ram_state.copy(),  # В decode RAM не меняется
                 'flags_before': {
                     'zero': bool(flags_before.get('zero', False)),
                     'carry': bool(flags_before.get('carry', False)),
@@ -764,7 +1048,8 @@ class RISCProcessor:
             print(f"🟡 ФАЗА DECODE | PC=0x{pc_before:04X} | Инструкция: {self._current_instruction} | Операнды: {self._current_operands}")
             print(f"   {acc_str}")
             print(f"═══════════════════════════════════════════════════════════════")
-            self.memory.history.append(history_entry)
+            # RAM в decode не меняется - в историю попадает только дельта (пустая)
+            self.memory.history.append(self._serialize_history_entry(history_entry), self.memory.ram)
             return True
                 
         else:
@@ -773,12 +1058,13 @@ class RISCProcessor:
             operands = self._current_operands
             instruction_line = self._current_instruction_line
             
-            # КРИТИЧНО: Сохраняем состояние аккумулятора и RAM ПЕРЕД выполнением
+            # КРИТИЧНО: Сохраняем состояние аккумулятора ПЕРЕД выполнением
             accumulator_before = int(self.processor.accumulator) & 0xFFFF
             registers_before = [accumulator_before]  # Для совместимости с историей
-            flags_before = dict(self.processor.flags)
+            flags_before = self.get_flags()
             pc_before = self.processor.program_counter
-            ram_before_state = list(self.memory.ram) if self.memory.ram else []  # Сохраняем RAM ДО выполнения
+            # Вместо копии RAM собираем записи в память, сделанные командой
+            self._ram_writes = []
             
             # Форматируем аккумулятор ДО выполнения
             acc_before_str = f"ACC=0x{accumulator_before:04X}({accumulator_before})"
@@ -786,17 +1072,19 @@ class RISCProcessor:
             print(f"🟢 ФАЗА EXECUTE | PC=0x{pc_before:04X} | Инструкция: {instruction} | Операнды: {operands}")
             print(f"   {acc_before_str}")
             
-            # Выполняем инструкцию
+            # Выполняем инструкцию через таблицу обработчиков (программа уже декодирована)
             try:
-                self.execute_instruction(instruction, operands)
+                opcode, operand, mode = self._decoded[pc_before]
+                self._handlers[opcode](operand, mode)
                 self.processor.cycles += 1
+                ram_writes = self._ram_writes
+                self._ram_writes = None
                 
-                # КРИТИЧНО: Сохраняем состояние аккумулятора и RAM ПОСЛЕ выполнения
+                # КРИТИЧНО: Сохраняем состояние аккумулятора ПОСЛЕ выполнения
                 accumulator_after = int(self.processor.accumulator) & 0xFFFF
                 registers_after = [accumulator_after]  # Для совместимости с историей
-                flags_after = dict(self.processor.flags)
+                flags_after = self.get_flags()
                 pc_after = self.processor.program_counter
-                ram_after_state = list(self.memory.ram) if self.memory.ram else []  # Сохраняем RAM ПОСЛЕ выполнения
                 
                 # Форматируем аккумулятор ПОСЛЕ выполнения
                 acc_after_str = f"ACC=0x{accumulator_after:04X}({accumulator_after})"
@@ -813,22 +1101,15 @@ class RISCProcessor:
                 
                 # Обновляем IR для следующей команды (если программа не остановлена)
                 if not self.processor.is_halted and pc_after < len(self.compiled_code):
-                    next_instruction_line = self.compiled_code[pc_after]
-                    next_parts = next_instruction_line.replace(',', ' ').split()
-                    next_instruction = next_parts[0] if next_parts else ""
+                    next_instruction_line, _, _, next_ir_value = self._program_meta[pc_after]
                     self.processor.current_command = next_instruction_line
                     self.processor.instruction_register_asm = next_instruction_line
-                    if next_instruction in self.instructions:
-                        self.processor.instruction_register = self.instructions[next_instruction]
-                    else:
-                        self.processor.instruction_register = 0
+                    self.processor.instruction_register = next_ir_value
                 
                 # Сохраняем состояние в историю с фазой execute
                 registers_before_final = registers_before if registers_before else [0]
                 registers_after_final = registers_after if registers_after else [0]
                 
-                # ram_before_state и ram_after_state уже сохранены выше
-                
                 # Получаем IR и IR_asm для execute фазы
                 ir_value_before = int(self.processor.instruction_register) & 0xFFFF
                 ir_asm = str(self.processor.instruction_register_asm) if self.processor.instruction_register_asm else str(instruction_line).strip()
@@ -841,9 +1122,6 @@ class RISCProcessor:
                     'registers_before': registers_before_final,
                     'registers_after': registers_after_final,
                     'registers': registers_after_final,
-                    'ram': ram_after_state.copy(),  # Состояние RAM после выполнения
-                    'ram_before': ram_before_state.copy(),  # Состояние RAM до выполнения
-                    'ram_after': ram_after_state.copy(),  # Состояние RAM после выполнения
                     'flags_before': {
                         'zero': bool(flags_before.get('zero', False)),
                         'carry': bool(flags_before.get('carry', False)),
@@ -868,34 +1146,310 @@ class RISCProcessor:
                     'instruction_register': int(ir_value_before) & 0xFFFF,
                     'instruction_register_asm': ir_asm
                 }
-                self.memory.history.append(history_entry)
+                # ram/ram_before/ram_after восстанавливаются историей по журналу записей
+                self.memory.history.append(self._serialize_history_entry(history_entry), self.memory.ram, ram_writes)
                 
                 # Сбрасываем промежуточные переменные для следующей команды
                 self._current_instruction_line = None
                 self._current_instruction = None
                 self._current_operands = None
                 
+                self._timeline_reached()
                 return not self.processor.is_halted
                 
             except Exception as e:
+                self._ram_writes = None
                 self.processor.is_halted = True
                 self.processor.current_command = f"ERROR: {str(e)}"
                 # Сбрасываем промежуточные переменные
                 self._current_instruction_line = None
                 self._current_instruction = None
                 self._current_operands = None
+                self._timeline_mark = self._timeline_state()
                 return False
     
+    def run(self, max_instructions: Optional[int] = None, breakpoints: Optional[Set[int]] = None,
+            use_blocks: bool = True, use_fusion: bool = True, trace=None) -> Dict[str, Any]:
+        """Быстрое выполнение программы целыми командами, без истории фаз
+        
+        Команды выполняются напрямую через таблицу обработчиков: без записей
+        fetch/decode/execute в истории и без копий RAM. Если команда была начата
+        в пошаговом режиме (fetch/decode), она сначала дозавершается через step().
+        
+        По умолчанию программа выполняется скомпилированными базовыми блоками
+        (см. BlockCompiler); блоки переходят друг в друга через таблицу _blocks
+        по PC. Команды вне блоков выполняет интерпретатор, по возможности
+        суперкомандами (см. _fuse_program). Если заданы точки останова или
+        трасса, нужна покомандная точность: блоки и суперкоманды не используются.
+        
+        Выполнение идет отрезками до следующей границы контрольных точек
+        (см. CheckpointTimeline); на границе сохраняется контрольная точка
+        и проверяется запрос отмены (cancel_check). Отмена не останавливает
+        процессор: выполнение можно продолжить следующим вызовом.
+        
+        Args:
+            max_instructions: Максимальное число выполняемых команд (None - без ограничения)
+            breakpoints: PC, перед выполнением которых нужно остановиться
+                (кроме первой команды запуска, чтобы можно было продолжить)
+            use_blocks: Использовать скомпилированные блоки
+            use_fusion: Использовать суперкоманды в интерпретаторе
+            trace: TraceWriter, в который записывается каждая выполненная
+                команда (шаг, PC, опкод, операнд, ACC, флаги, записи в память)
+            
+        Returns:
+            Сводка выполнения: число команд и фаз, циклы, PC остановки, ошибка,
+            число диспетчеризаций и сэкономленных диспетчеризаций
+        """
+        cpu = self.processor
+        phases = 0
+        while self._current_instruction_line is not None and not cpu.is_halted:
+            self.step()
+            phases += 1
+        self._timeline_sync()
+        timeline = self.timeline
+        start_cycles = cpu.cycles
+        
+        decoded = self._decoded
+        handlers = self._handlers if trace is None else self._traced_handlers(trace)
+        code_len = len(decoded)
+        limit = max_instructions if max_instructions is not None else float('inf')
+        exact = breakpoints or trace is not None
+        blocks = self._blocks if use_blocks and not exact else None
+        fused = self._fused if use_fusion and not exact else None
+        ram = self.memory.ram
+        executed = 0
+        dispatches = 0
+        block_runs = 0
+        fused_runs = 0
+        last_pc = None
+        error = None
+        stopped_at = None
+        cancelled = False
+        
+        try:
+            while executed < limit and not cpu.is_halted:
+                # Отрезок до ближайшей границы контрольных точек или внешней точки
+                position = start_cycles + executed
+                stop = timeline.next_boundary(position)
+                external = timeline.next_external(position)
+                if external is not None and external < stop:
+                    stop = external
+                segment = min(limit, executed + stop - position)
+                
+                while executed < segment and not cpu.is_halted:
+                    pc = cpu.program_counter
+                    if pc >= code_len:
+                        # Как и в фазе fetch: выход за пределы программы останавливает процессор
+                        cpu.is_halted = True
+                        phases += 1
+                        break
+                    if blocks is not None and pc >= 0:
+                        block = blocks[pc]
+                        if block is None:
+                            block = self._block_compiler.get_block(self._program_key, decoded, pc, self.code_range()) or False
+                            blocks[pc] = block
+                        if block and executed + block.length <= segment and block.max_address < len(ram):
+                            last_pc = pc
+                            block.func(self, cpu, ram)
+                            executed += block.length
+                            dispatches += 1
+                            block_runs += 1
+                            last_pc = pc + block.length - 1
+                            continue
+                    elif breakpoints and executed and pc in breakpoints:
+                        stopped_at = pc
+                        break
+                    if fused is not None and pc >= 0:
+                        superinstruction = fused[pc]
+                        if superinstruction is not None and executed + superinstruction[0] <= segment:
+                            length, handler, args = superinstruction
+                            handler(*args)
+                            executed += length
+                            dispatches += 1
+                            fused_runs += 1
+                            last_pc = pc + length - 1
+                            continue
+                    last_pc = pc
+                    opcode, operand, mode = decoded[pc]
+                    handlers[opcode](operand, mode)
+                    executed += 1
+                    dispatches += 1
+                
+                if stopped_at is not None:
+                    break
+                if executed == segment and executed < limit:
+                    cpu.cycles = start_cycles + executed
+                    self._timeline_reached()
+                    if self.cancel_requested():
+                        cancelled = True
+                        break
+        except Exception as e:
+            error = str(e)
+            cpu.is_halted = True
+        
+        cpu.cycles = start_cycles + executed
+        self._timeline_mark = self._timeline_state()
+        phases += 3 * executed
+        
+        # Приводим IR к тому же виду, что и после пошагового выполнения
+        if last_pc is not None:
+            line, _, _, ir_value = self._program_meta[last_pc]
+            cpu.current_command = line
+            cpu.instruction_register_asm = line
+            cpu.instruction_register = ir_value
+            if error is not None:
+                cpu.current_command = f"ERROR: {error}"
+                phases += 3
+            elif not cpu.is_halted and cpu.program_counter < code_len:
+                line, _, _, ir_value = self._program_meta[cpu.program_counter]
+                cpu.current_command = line
+                cpu.instruction_register_asm = line
+                cpu.instruction_register = ir_value
+        
+        return {
+            "instructions": executed,
+            "phases": phases,
+            "cycles": cpu.cycles,
+            "halted": cpu.is_halted,
+            "program_counter": cpu.program_counter,
+            "error": error,
+            "blocks": block_runs,
+            "fused": fused_runs,
+            "dispatches": dispatches,
+            "dispatches_saved": executed - dispatches,
+            "breakpoint": stopped_at,
+            "cancelled": cancelled
+        }
+    
+    def _traced_handlers(self, trace) -> Dict[int, Any]:
+        """Таблица обработчиков, записывающих каждую выполненную команду в trace"""
+        cpu = self.processor
+        decoded = self._decoded
+        position = cpu.cycles
+        
+        def traced(handler):
+            def execute(operand, mode):
+                nonlocal position
+                pc = cpu.program_counter
+                opcode = decoded[pc][0]
+                self._ram_writes = writes = []
+                try:
+                    handler(operand, mode)
+                finally:
+                    self._ram_writes = None
+                if opcode == DECODE_STALE:
+                    # Команда декодирована заново из RAM (см. _op_refetch)
+                    opcode, operand, _ = decoded[pc]
+                position += 1
+                trace.record(position, pc, opcode, operand, cpu.accumulator, self.flag_bits, writes)
+            return execute
+        
+        return {opcode: traced(handler) for opcode, handler in self._handlers.items()}
+    
+    def cancel_requested(self) -> bool:
+        """Запрошена ли отмена текущего выполнения"""
+        return self.cancel_check is not None and self.cancel_check()
+    
+    def seek(self, position: int) -> Dict[str, Any]:
+        """Перейти к состоянию после position выполненных команд
+        
+        Восстанавливается ближайшая контрольная точка до position, затем
+        команды выполняются заново (run без истории), поэтому переход стоит
+        не больше интервала контрольных точек. Если программа останавливается
+        раньше, процессор остается в точке остановки. История фаз (memory.history)
+        не перематывается.
+        """
+        if position < 0:
+            raise Exception(f"Invalid position: {position}")
+        self._timeline_sync()
+        checkpoint = self.timeline.nearest(position)
+        if checkpoint is None:
+            raise Exception("No checkpoints recorded")
+        self._restore_checkpoint(checkpoint)
+        replayed = 0
+        if position > checkpoint.position and not self.processor.is_halted:
+            replayed = self.run(max_instructions=position - checkpoint.position)["instructions"]
+        return {
+            "position": self.processor.cycles,
+            "requested": position,
+            "checkpoint": checkpoint.position,
+            "replayed": replayed,
+            "halted": self.processor.is_halted
+        }
+    
+    def step_back(self, count: int = 1) -> Dict[str, Any]:
+        """Вернуться на count команд назад
+        
+        Начатая, но не выполненная команда (после fetch/decode) считается одним шагом.
+        """
+        if count < 1:
+            raise Exception(f"Invalid step count: {count}")
+        if self._current_instruction_line is not None:
+            count -= 1
+        return self.seek(max(self.processor.cycles - count, 0))
+    
+    def _timeline_state(self) -> Tuple:
+        """Отпечаток состояния для обнаружения изменений извне"""
+        cpu = self.processor
+        ram = self.memory.ram
+        return (ram.version, len(ram), cpu.accumulator, cpu.program_counter,
+                cpu.is_halted, cpu.cycles, self.flag_bits)
+    
+    def _timeline_sync(self):
+        """Записать внешнюю контрольную точку, если состояние менялось не процессором"""
+        if self._timeline_mark != self._timeline_state():
+            self.timeline.capture(self.processor.cycles, self.processor, self.flag_bits,
+                                  self.memory.ram, external=True)
+            self._timeline_mark = self._timeline_state()
+    
+    def _timeline_reached(self):
+        """Выполнение дошло до новой позиции (границы команды)
+        
+        На внешней точке (повторное выполнение после перемотки назад) заново
+        применяются сделанные тогда изменения, на границе интервала сохраняется
+        контрольная точка.
+        """
+        position = self.processor.cycles
+        external = self.timeline.external_at(position)
+        if external is not None:
+            self._restore_checkpoint(external)
+            return
+        if position % self.timeline.interval == 0:
+            self.timeline.capture(position, self.processor, self.flag_bits, self.memory.ram)
+        self._timeline_mark = self._timeline_state()
+    
+    def _restore_checkpoint(self, checkpoint: Checkpoint):
+        """Восстановить регистры, флаги и RAM из контрольной точки"""
+        for name, value in checkpoint.registers.items():
+            setattr(self.processor, name, value)
+        self.set_flags(checkpoint.flag_bits)
+        self.memory.ram.load(checkpoint.ram())
+        self.timeline.mark(checkpoint, self.memory.ram)
+        self._current_instruction_line = None
+        self._current_instruction = None
+        self._current_operands = None
+        self._timeline_mark = self._timeline_state()
+    
     def load_program(self, compiled_code: List[str], source_code: str = ""):
         """Загрузить скомпилированную программу"""
         self.compiled_code = compiled_code
         self.source_code = source_code
         self.processor.program_counter = 0
+        
+        # Декодируем программу один раз: при выполнении строки больше не разбираются
+        self._decode_program(compiled_code)
+        if self.fetch_from_ram:
+            # Режим фон Неймана: программа живет в RAM и выбирается оттуда
+            self.install_code()
+        else:
+            self.memory.ram.unwatch()
         self.processor.is_halted = False
         
         # Очищаем историю выполнения (все execution_phase из предыдущих записей удаляются)
         # После очистки истории execution_phase будет None (так как история пустая)
-        self.memory.history = []
+        self.memory.history.clear()
+        self.timeline.clear()
+        self._timeline_mark = None
         
         # Сбрасываем промежуточные переменные для системы фаз выполнения
         # Это гарантирует, что следующий вызов step() начнет с фазы fetch
@@ -906,12 +1460,7 @@ class RISCProcessor:
         # Сбрасываем аккумулятор в начальное состояние
         self.processor.accumulator = 0
         # Сбрасываем флаги
-        self.processor.flags = {
-            "zero": False,
-            "carry": False,
-            "overflow": False,
-            "negative": False
-        }
+        self.set_flags(0)
         # Сбрасываем счетчик циклов
         self.processor.cycles = 0
         
@@ -931,8 +1480,310 @@ class RISCProcessor:
             self.processor.instruction_register_asm = ""
             self.processor.instruction_register = 0
     
-    def get_state(self) -> Dict[str, Any]:
-        """Получить текущее состояние процессора"""
+    def get_memory(self, start: int = 0, length: Optional[int] = None) -> Dict[str, Any]:
+        """Окно RAM [start, start + length)
+
+        Args:
+            start: Адрес первой ячейки
+            length: Число ячеек (по умолчанию - до конца памяти)
+        """
+        ram = self.memory.ram
+        size = len(ram)
+        if length is None:
+            length = max(size - start, 0)
+        if start < 0 or start > size or length < 0:
+            raise Exception(f"Invalid RAM range: start={start}, length={length}")
+        stop = min(start + length, size)
+        return {
+            "start": start,
+            "length": stop - start,
+            "size": size,
+            "values": ram[start:stop].tolist(),
+        }
+    
+    def get_history(self, start: int = 0, limit: int = 100,
+                    fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Страница истории выполнения
+        
+        Args:
+            start: Индекс первой записи
+            limit: Максимальное число записей (не больше MAX_HISTORY_PAGE)
+            fields: Возвращаемые поля записей (по умолчанию - все). Копии RAM
+                (ram, ram_before, ram_after) восстанавливаются, только если
+                запрошены; поле writes - записи в память фазы [адрес, было, стало].
+        
+        Записи до history.start вытеснены из подробной истории: для них
+        возвращаются сводки фаз execute (summary = True, без копий RAM).
+        retention - статистика объема и вытеснения истории.
+        """
+        history = self.memory.history
+        total = len(history)
+        if start < 0 or start > total:
+            raise Exception(f"Invalid history start: {start} (history has {total} entries)")
+        if not 1 <= limit <= MAX_HISTORY_PAGE:
+            raise Exception(f"Invalid history limit: {limit} (1..{MAX_HISTORY_PAGE})")
+        
+        wanted = set(fields) if fields else None
+        with_ram = wanted is None or not wanted.isdisjoint(HISTORY_RAM_FIELDS)
+        with_writes = wanted is not None and 'writes' in wanted
+        entries = []
+        position = start
+        if start < history.start:
+            summaries = history.summaries(start, history.start)[:limit]
+            for summary in summaries:
+                entry = {key: value for key, value in summary.items()
+                         if wanted is None or key in wanted or key == 'index'}
+                entry['summary'] = True
+                entries.append(entry)
+            position = summaries[-1]['index'] + 1 if len(summaries) == limit else history.start
+        stop = min(position + limit - len(entries), total) if position >= history.start else position
+        if with_ram:
+            records = (
+                {key: value for key, value in entry.items() if wanted is None or key in wanted}
+                for entry in history.entries(position, stop)
+            )
+        else:
+            # Без копий RAM нужные поля собираются прямо из столбцов истории
+            records = history.records(position, stop, wanted)
+        for index, entry in enumerate(records, position):
+            if with_writes:
+                entry['writes'] = [list(write) for write in history.writes(index)]
+            entry['index'] = index
+            entries.append(entry)
+        return {
+            "start": start,
+            "count": len(entries),
+            "total": total,
+            "first": history.start,
+            "next": stop if stop < total else None,
+            "entries": entries,
+            "retention": history.stats(),
+        }
+    
+    def replay_history(self, start: int, limit: int = 100,
+                       fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """История фаз команд [start, start + limit), восстановленная повтором
+        
+        Args:
+            start: Номер первой команды (позиция, как в seek)
+            limit: Число команд (не больше MAX_REPLAY_INSTRUCTIONS)
+            fields: Возвращаемые поля записей (как в get_history)
+        
+        Для повтора не нужна сохраненная история: на копии процессора
+        восстанавливается ближайшая контрольная точка до start, команды до
+        start выполняются быстро (run), а окно - по фазам (step), с записью
+        истории. Внешние контрольные точки повторяют загрузку данных и правки
+        RAM, сделанные тогда извне, поэтому записи совпадают с записями
+        исходного пошагового выполнения, а для run() появляются впервые.
+        Состояние процессора не меняется. Поле position записи - номер
+        команды, к которой относится фаза.
+        """
+        if not 0 <= start <= self.processor.cycles:
+            raise Exception(f"Invalid replay start: {start} (executed {self.processor.cycles} instructions)")
+        if not 1 <= limit <= MAX_REPLAY_INSTRUCTIONS:
+            raise Exception(f"Invalid replay limit: {limit} (1..{MAX_REPLAY_INSTRUCTIONS})")
+        checkpoint = self.timeline.nearest(start)
+        if checkpoint is None:
+            raise Exception("No checkpoints recorded")
+        stop = min(start + limit, self.processor.cycles)
+        
+        replica = self._replica()
+        replica._restore_checkpoint(checkpoint)
+        cpu = replica.processor
+        if start > checkpoint.position and not cpu.is_halted:
+            result = replica.run(max_instructions=start - checkpoint.position)
+            if result["cancelled"]:
+                raise Exception("Replay cancelled")
+        
+        history = replica.memory.history
+        positions = []
+        while cpu.cycles < stop and not cpu.is_halted:
+            position = cpu.cycles
+            replica.step()
+            positions.extend([position] * (len(history) - len(positions)))
+            if cpu.cycles != position and replica.timeline.external_at(cpu.cycles) is not None:
+                replica._journal_external()
+        
+        entries = replica.get_history(0, len(history), fields)["entries"] if positions else []
+        for entry, position in zip(entries, positions):
+            del entry['index']
+            entry['position'] = position
+        return {
+            "start": start,
+            "stop": cpu.cycles,
+            "count": len(entries),
+            "entries": entries,
+            "checkpoint": checkpoint.position,
+            "replayed": start - checkpoint.position,
+            "next": cpu.cycles if cpu.cycles < self.processor.cycles and not cpu.is_halted else None,
+        }
+    
+    def _replica(self) -> "RISCProcessor":
+        """Копия процессора с той же программой и контрольными точками, без истории"""
+        replica = RISCProcessor(self.memory_size, history_capacity=None, summary_capacity=None,
+                                write_index_capacity=None)
+        replica.cancel_check = self.cancel_check
+        replica.fetch_from_ram = self.fetch_from_ram
+        replica.code_base = self.code_base
+        replica.labels = dict(self.labels)
+        replica.load_program(self.compiled_code, self.source_code)
+        replica.timeline = self.timeline.copy()
+        return replica
+    
+    def _journal_external(self):
+        """Добавить в историю изменения RAM, примененные внешней контрольной точкой
+        
+        Восстановление точки меняет RAM в обход журнала истории; разница с RAM
+        по журналу дописывается к последней фазе, как при загрузке данных задачи.
+        """
+        history = self.memory.history
+        if not history:
+            return
+        expected = history.ram_after(len(history) - 1)
+        ram = self.memory.ram
+        for address in range(min(len(expected), len(ram))):
+            if expected[address] != ram[address]:
+                history.record_write(address, expected[address], ram[address])
+    
+    def get_writes(self, address: int, before: Optional[int] = None, limit: int = 1) -> Dict[str, Any]:
+        """Записи в ячейку RAM по индексу записей истории, от новых к старым
+        
+        Args:
+            address: Адрес ячейки
+            before: Индекс фазы истории: вернуть записи, сделанные до нее
+                (по умолчанию - все); next - курсор следующей страницы
+            limit: Максимальное число записей (не больше MAX_HISTORY_PAGE)
+        
+        Индекс заполняется записями фаз истории (пошаговое выполнение и
+        запись данных задачи); быстрое выполнение run() в него не попадает.
+        Самые старые записи удаляются по емкости индекса (см. WriteIndex).
+        """
+        if not 0 <= address < len(self.memory.ram):
+            raise Exception(f"Invalid RAM address: {address}")
+        if before is not None and before < 0:
+            raise Exception(f"Invalid history step: {before}")
+        if not 1 <= limit <= MAX_HISTORY_PAGE:
+            raise Exception(f"Invalid write limit: {limit} (1..{MAX_HISTORY_PAGE})")
+        history = self.memory.history
+        index = history.write_index
+        writes = history.writes_to(address, before, limit)
+        last = writes[-1]['step'] if writes else None
+        return {
+            "address": address,
+            "count": len(writes),
+            "total": index.count(address),
+            "writes": writes,
+            "next": last if last is not None and index.query(address, last, 1) else None,
+            "first_step": index.first_step,
+            "index": index.stats(),
+        }
+    
+    def state_etag(self) -> str:
+        """ETag текущей версии состояния"""
+        self.versions.observe(self)
+        return self.versions.etag
+    
+    def get_state_diff(self, since: int) -> Dict[str, Any]:
+        """Изменения состояния с версии since
+        
+        Возвращаются только изменившиеся регистры и флаги, ячейки RAM
+        ([адрес, значение]) и новые записи истории. Если история была
+        очищена, history.reset = True и передается вся история. Если версия
+        since неизвестна (слишком старая или из другого экземпляра эмулятора),
+        full = True и state - полное состояние.
+        """
+        version = self.versions.observe(self)
+        changes = self.versions.changes_since(since)
+        if changes is None:
+            return {"version": version, "since": since, "full": True, "state": self.get_state()}
+        mark, addresses = changes
+        
+        processor = {}
+        for name, old in zip(VERSION_REGISTERS, mark.registers):
+            value = getattr(self.processor, name)
+            if value != old:
+                processor[name] = value
+        if 'accumulator' in processor:
+            processor['registers'] = [int(self.processor.accumulator) & 0xFFFF]
+        flag_bits = self.flag_bits
+        if flag_bits != mark.flag_bits:
+            before = flags_to_dict(mark.flag_bits)
+            processor['flags'] = {name: value for name, value in flags_to_dict(flag_bits).items()
+                                  if before[name] != value}
+        
+        ram = self.memory.ram
+        size = len(ram)
+        history = self.memory.history
+        reset = mark.history() is not history or history.generation != mark.history_generation \
+            or len(history) < mark.history_length
+        # Вытесненные записи не передаются: start - индекс первой переданной
+        start = max(0 if reset else mark.history_length, history.start)
+        diff = {
+            "version": version,
+            "since": since,
+            "full": False,
+            "processor": processor,
+            "ram": [[address, ram[address]] for address in addresses if address < size],
+            "history": {
+                "reset": reset,
+                "start": start,
+                "entries": list(history.entries(start, len(history))),
+            },
+        }
+        if size != mark.ram_size:
+            diff["ram_size"] = size
+        if self.versions.program_key(self) != mark.program:
+            diff["source_code"] = self.source_code
+            diff["machine_code"] = self.compiled_code
+        return diff
+    
+    @staticmethod
+    def _serialize_history_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Запись истории из базовых типов Python (приводится один раз, при добавлении в историю)"""
+        history_entry = {}
+        for key, value in entry.items():
+            if key in ['registers_before', 'registers_after', 'registers']:
+                # Преобразуем аккумулятор в список целых чисел (для совместимости)
+                if isinstance(value, list) and len(value) > 0:
+                    # Преобразуем каждый элемент в int и ограничиваем 16-битным диапазоном
+                    regs = [int(r) & 0xFFFF for r in value]
+                    history_entry[key] = regs
+                else:
+                    history_entry[key] = [0]
+            elif key in ['flags_before', 'flags_after', 'flags']:
+                # Преобразуем флаги в словарь с булевыми значениями
+                if isinstance(value, dict):
+                    history_entry[key] = {
+                        'zero': bool(value.get('zero', False)),
+                        'carry': bool(value.get('carry', False)),
+                        'overflow': bool(value.get('overflow', False)),
+                        'negative': bool(value.get('negative', False))
+                    }
+                else:
+                    history_entry[key] = {'zero': False, 'carry': False, 'overflow': False, 'negative': False}
+            elif key == 'execution_phase':
+                # Сериализуем execution_phase как строку
+                history_entry[key] = str(value) if value is not None else None
+            else:
+                # Для остальных полей просто копируем значение
+                history_entry[key] = value
+        return history_entry
+    
+    def get_state(self, history_from: int = 0,
+                  sections: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Получить текущее состояние процессора
+        
+        Args:
+            history_from: Первая возвращаемая запись истории (курсор клиента,
+                у которого уже есть предыдущие записи); memory.history_start -
+                индекс первой записи в ответе
+            sections: Разделы и профили состояния (см. STATE_SECTIONS,
+                STATE_PROFILES; по умолчанию - все). Незапрошенные разделы не
+                собираются и отсутствуют в результате; current_task и version
+                возвращаются всегда.
+        """
+        sections = resolve_state_sections(sections)
+        
         # Проверяем память перед сериализацией (для отладки задачи 1)
         if self.memory.ram and len(self.memory.ram) > 0x0100:
             check_val = self.memory.ram[0x0100]
@@ -944,64 +1795,41 @@ class RISCProcessor:
             print(f"WARNING get_state: Память не инициализирована, создаем пустую память")
             self.memory.ram = [0] * self.memory_size
         
-        # Гарантируем, что история правильно сериализуется
-        # Преобразуем каждый элемент истории, чтобы убедиться, что все значения - это базовые типы Python
-        history_serialized = []
-        for entry in self.memory.history:
-            history_entry = {}
-            for key, value in entry.items():
-                if key in ['registers_before', 'registers_after', 'registers']:
-                    # Преобразуем аккумулятор в список целых чисел (для совместимости)
-                    if isinstance(value, list) and len(value) > 0:
-                        # Преобразуем каждый элемент в int и ограничиваем 16-битным диапазоном
-                        regs = [int(r) & 0xFFFF for r in value]
-                        history_entry[key] = regs
-                    else:
-                        history_entry[key] = [0]
-                elif key in ['flags_before', 'flags_after', 'flags']:
-                    # Преобразуем флаги в словарь с булевыми значениями
-                    if isinstance(value, dict):
-                        history_entry[key] = {
-                            'zero': bool(value.get('zero', False)),
-                            'carry': bool(value.get('carry', False)),
-                            'overflow': bool(value.get('overflow', False)),
-                            'negative': bool(value.get('negative', False))
-                        }
-                    else:
-                        history_entry[key] = {'zero': False, 'carry': False, 'overflow': False, 'negative': False}
-                elif key == 'execution_phase':
-                    # Сериализуем execution_phase как строку
-                    print(f"DEBUG get_state: execution_phase serialization: key={key}, value={value} (type={type(value)}), result={value}")
-                    history_entry[key] = str(value) if value is not None else None
-                else:
-                    # Для остальных полей просто копируем значение
-                    history_entry[key] = value
-            history_serialized.append(history_entry)
+        # Флаги вычисляются из отложенной операции; словарь в ProcessorState
+        # обновляется только здесь, для сериализации
+        flags = self.get_flags()
+        self.processor.flags = dict(flags)
+        version = self.versions.observe(self)
         
-        return {
-            "processor": {
+        state = {}
+        if 'processor' in sections:
+            state["processor"] = {
                 "accumulator": int(self.processor.accumulator) & 0xFFFF,
                 "registers": [int(self.processor.accumulator) & 0xFFFF],  # Для совместимости с frontend
                 "program_counter": self.processor.program_counter,
                 "instruction_register": self.processor.instruction_register,
                 "instruction_register_asm": self.processor.instruction_register_asm,
-                "flags": {
-                    'zero': bool(self.processor.flags.get('zero', False)),
-                    'carry': bool(self.processor.flags.get('carry', False)),
-                    'overflow': bool(self.processor.flags.get('overflow', False)),
-                    'negative': bool(self.processor.flags.get('negative', False))
-                },
+                "flags": flags,
                 "current_command": self.processor.current_command,
                 "is_halted": self.processor.is_halted,
                 "cycles": self.processor.cycles
-            },
-            "memory": {
-                # КРИТИЧНО: Создаем новый список для сериализации, чтобы Pydantic видел изменения
-                # Убеждаемся, что память инициализирована
-                "ram": [int(r) & 0xFFFF for r in (self.memory.ram if self.memory.ram else [])],  # 16-битные значения
-                "history": history_serialized
-            },
-            "source_code": self.source_code,
-            "machine_code": self.compiled_code,
-            "current_task": None
-        }
\ No newline at end of file
+            }
+        memory = {}
+        if 'ram' in sections:
+            # КРИТИЧНО: Создаем новый список для сериализации, чтобы Pydantic видел изменения
+            memory["ram"] = self.memory.ram.tolist()  # 16-битные значения
+        if 'history' in sections:
+            # Записи истории приводятся к базовым типам Python один раз, при добавлении
+            # (_serialize_history_entry), здесь только восстанавливаются копии RAM
+            history = self.memory.history
+            history_from = min(max(history_from, history.start), len(history))
+            memory["history"] = list(history.entries(history_from, len(history)))
+            memory["history_start"] = history_from
+        if memory:
+            state["memory"] = memory
+        if 'program' in sections:
+            state["source_code"] = self.source_code
+            state["machine_code"] = self.compiled_code
+        state["current_task"] = None
+        state["version"] = version
+        return state
\ No newline at end of file
@@ -0,0 +1,89 @@
+"""
+Поток прогресса выполнения (Server-Sent Events)
+"""
+import json
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict
+
+from .emulator import RISCEmulator
+
+# Допустимая частота кадров прогресса (Гц)
+MIN_PROGRESS_HZ = 0.5
+MAX_PROGRESS_HZ = 60.0
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Кадр Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def run_with_progress(emulator: RISCEmulator, submit: Callable[..., Awaitable[Any]],
+                            max_steps: int, hz: float = 10.0) -> AsyncIterator[str]:
+    """Выполнить программу до остановки, выдавая кадры прогресса не чаще hz раз в секунду
+
+    Выполнение идет порциями RISCProcessor.run() через submit (пул потоков),
+    поэтому между порциями эмулятор доступен другим запросам сессии, а
+    отключение клиента останавливает выполнение на ближайшей порции. Размер
+    порции подстраивается под скорость эмулятора так, чтобы порция занимала
+    около половины интервала между кадрами: частота кадров не зависит от того,
+    насколько быстро выполняются команды.
+
+    Args:
+        emulator: Эмулятор сессии
+        submit: Корутина выполнения в пуле: submit(emulator, func, *args)
+        max_steps: Бюджет в фазах (одна команда = 3 фазы)
+        hz: Частота кадров progress
+    """
+    hz = min(max(hz, MIN_PROGRESS_HZ), MAX_PROGRESS_HZ)
+    interval = 1.0 / hz
+    budget = max_steps // 3
+    processor = emulator.processor
+    cpu = processor.processor
+
+    def frame(rate: float, elapsed: float) -> Dict[str, Any]:
+        return {
+            "instructions": executed,
+            "steps": phases,
+            "instructions_per_second": round(rate),
+            "steps_per_second": round(rate * 3),
+            "program_counter": cpu.program_counter,
+            "accumulator": cpu.accumulator,
+            "cycles": cpu.cycles,
+            "halted": cpu.is_halted,
+            "elapsed": round(elapsed, 3),
+        }
+
+    executed = 0
+    phases = 0
+    chunk = 1000
+    summary = None
+    started = time.perf_counter()
+    next_frame = started
+    rate = 0.0
+    while executed < budget and not cpu.is_halted:
+        chunk_started = time.perf_counter()
+        try:
+            summary = await submit(emulator, processor.run, min(chunk, budget - executed))
+        except Exception as e:
+            yield sse_event("error", {"message": str(getattr(e, "detail", e))})
+            return
+        chunk_elapsed = time.perf_counter() - chunk_started
+        executed += summary["instructions"]
+        phases += summary["phases"]
+        if summary["error"] or summary["cancelled"] or not summary["instructions"]:
+            break
+
+        # Порция ~ половина интервала между кадрами при текущей скорости
+        if chunk_elapsed > 0:
+            chunk = max(1, int(summary["instructions"] / chunk_elapsed * interval / 2))
+        now = time.perf_counter()
+        if now >= next_frame:
+            rate = executed / (now - started) if now > started else 0.0
+            yield sse_event("progress", frame(rate, now - started))
+            next_frame = now + interval
+
+    elapsed = time.perf_counter() - started
+    rate = executed / elapsed if elapsed > 0 else 0.0
+    done = frame(rate, elapsed)
+    done["error"] = summary["error"] if summary else None
+    yield sse_event("done", done)
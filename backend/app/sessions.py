@@ -0,0 +1,201 @@
+"""
+Пул эмуляторов по сессиям: LRU-вытеснение, тайм-аут простоя, компактные снимки
+"""
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+from .emulator import RISCEmulator
+from .timeline import CheckpointTimeline
+
+# Регистры ProcessorState, которые переносятся в снимок сессии
+SNAPSHOT_REGISTERS = CheckpointTimeline.REGISTERS
+
+
+def snapshot_emulator(emulator: RISCEmulator) -> Dict[str, Any]:
+    """Компактный снимок эмулятора: регистры, флаги, сжатая RAM и программа
+
+    История фаз и контрольные точки в снимок не входят. Начатая команда
+    (после fetch/decode) после восстановления выполняется заново с фазы fetch.
+    """
+    processor = emulator.processor
+    ram = processor.memory.ram
+    return {
+        "registers": {name: getattr(processor.processor, name) for name in SNAPSHOT_REGISTERS},
+        "flag_bits": processor.flag_bits,
+        "ram": zlib.compress(ram.tobytes()),
+        "ram_size": len(ram),
+        "compiled_code": list(processor.compiled_code),
+        "source_code": processor.source_code,
+        "fetch_from_ram": processor.fetch_from_ram,
+        "code_base": processor.code_base,
+        "current_task": emulator.current_task,
+        "task_data_write_index": emulator._task_data_write_index,
+    }
+
+
+def restore_emulator(snapshot: Dict[str, Any],
+                     factory: Callable[[], RISCEmulator] = RISCEmulator) -> RISCEmulator:
+    """Восстановить эмулятор из снимка snapshot_emulator()"""
+    emulator = factory()
+    processor = emulator.processor
+    processor.fetch_from_ram = snapshot["fetch_from_ram"]
+    processor.code_base = snapshot["code_base"]
+    if snapshot["compiled_code"]:
+        processor.load_program(snapshot["compiled_code"], snapshot["source_code"])
+
+    ram = array('H')
+    ram.frombytes(zlib.decompress(snapshot["ram"]))
+    processor.memory.ram = ram
+    for name, value in snapshot["registers"].items():
+        setattr(processor.processor, name, value)
+    processor.set_flags(snapshot["flag_bits"])
+
+    emulator.current_task = snapshot["current_task"]
+    emulator._task_data_write_index = snapshot["task_data_write_index"]
+    return emulator
+
+
+class SessionPool:
+    """Эмуляторы, привязанные к сессиям
+
+    Активных эмуляторов не больше max_sessions: при переполнении и по
+    истечении idle_timeout секунд простоя сессия сохраняется в компактный
+    снимок (snapshot_emulator) и выгружается. Снимков хранится не больше
+    max_snapshots (самые старые удаляются), поэтому память пула ограничена
+    при любом числе пользователей. При следующем обращении сессия
+    восстанавливается из снимка. Эмулятор, занятый выполнением в пуле
+    потоков, не выгружается (активных сессий временно может быть больше).
+    """
+
+    def __init__(self, max_sessions: int = 64, idle_timeout: float = 900.0, max_snapshots: int = 1024,
+                 factory: Callable[[], RISCEmulator] = RISCEmulator,
+                 clock: Callable[[], float] = time.monotonic):
+        if max_sessions < 1:
+            raise Exception(f"Invalid session limit: {max_sessions}")
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_snapshots = max_snapshots
+        self.factory = factory
+        self.clock = clock
+        self._sessions: "OrderedDict[str, Tuple[RISCEmulator, float]]" = OrderedDict()
+        self._snapshots: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.created = 0
+        self.restored = 0
+        self.evicted = 0
+        self.expired = 0
+        self.dropped_snapshots = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions or session_id in self._snapshots
+
+    def get(self, session_id: str) -> RISCEmulator:
+        """Эмулятор сессии (создается или восстанавливается из снимка)"""
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                emulator = entry[0]
+                self._sessions.move_to_end(session_id)
+            else:
+                snapshot = self._snapshots.pop(session_id, None)
+                if snapshot is not None:
+                    emulator = restore_emulator(snapshot, self.factory)
+                    self.restored += 1
+                else:
+                    emulator = self.factory()
+                    self.created += 1
+                for candidate in list(self._sessions):
+                    if len(self._sessions) < self.max_sessions:
+                        break
+                    if self._evict(candidate):
+                        self.evicted += 1
+            self._sessions[session_id] = (emulator, now)
+            return emulator
+
+    def drop(self, session_id: str) -> bool:
+        """Удалить сессию вместе со снимком"""
+        with self._lock:
+            found = self._sessions.pop(session_id, None) is not None
+            found = self._snapshots.pop(session_id, None) is not None or found
+            return found
+
+    def evict_idle(self) -> int:
+        """Выгрузить сессии, простаивающие дольше idle_timeout"""
+        with self._lock:
+            return self._expire(self.clock())
+
+    def session_ids(self) -> List[str]:
+        """Идентификаторы активных сессий (от давно не использованных к недавним)"""
+        with self._lock:
+            return list(self._sessions)
+
+    def history_stats(self) -> Dict[str, int]:
+        """Суммарный объем и вытеснение истории фаз активных сессий"""
+        totals = dict.fromkeys(("entries", "summaries", "bytes", "evictions", "evicted",
+                                "summarized", "summaries_dropped", "indexed_writes"), 0)
+        with self._lock:
+            emulators = [emulator for emulator, _ in self._sessions.values()]
+        for emulator in emulators:
+            stats = emulator.processor.memory.history.stats()
+            for key in totals:
+                totals[key] += stats[key]
+        return totals
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика пула"""
+        with self._lock:
+            return {
+                "active": len(self._sessions),
+                "snapshots": len(self._snapshots),
+                "snapshot_bytes": sum(len(s["ram"]) for s in self._snapshots.values()),
+                "max_sessions": self.max_sessions,
+                "max_snapshots": self.max_snapshots,
+                "idle_timeout": self.idle_timeout,
+                "created": self.created,
+                "restored": self.restored,
+                "evicted": self.evicted,
+                "expired": self.expired,
+                "dropped_snapshots": self.dropped_snapshots,
+                "history": self.history_stats(),
+            }
+
+    def _expire(self, now: float) -> int:
+        """Выгрузить простаивающие сессии (порядок OrderedDict - по времени обращения)"""
+        if self.idle_timeout is None:
+            return 0
+        expired = 0
+        for session_id, (_, last_used) in list(self._sessions.items()):
+            if now - last_used < self.idle_timeout:
+                break
+            if self._evict(session_id):
+                expired += 1
+        self.expired += expired
+        return expired
+
+    def _evict(self, session_id: str) -> bool:
+        """Сохранить сессию в снимок и выгрузить эмулятор
+
+        Занятый эмулятор (идет выполнение в пуле потоков) не выгружается.
+        """
+        emulator, _ = self._sessions[session_id]
+        if not emulator.lock.acquire(blocking=False):
+            return False
+        try:
+            del self._sessions[session_id]
+            self._snapshots[session_id] = snapshot_emulator(emulator)
+            self._snapshots.move_to_end(session_id)
+        finally:
+            emulator.lock.release()
+        while len(self._snapshots) > self.max_snapshots:
+            self._snapshots.popitem(last=False)
+            self.dropped_snapshots += 1
+        return True
@@ -3,7 +3,6 @@
 """
 from typing import List, Dict, Any
 from .processor import RISCProcessor
-from .models import MemoryState
 
 class TaskManager:
     """Менеджер задач для эмулятора"""
@@ -419,17 +418,10 @@ HALT               ; остановка программы
             current_size = len(processor.memory.ram) if processor.memory.ram else 0
             if current_size < required_size:
                 print(f"WARNING: Memory too small ({current_size}), expanding to {required_size}")
-                # Создаем новый список памяти с расширением
-                new_ram = list(processor.memory.ram) if processor.memory.ram else [0] * processor.memory_size
-                new_ram.extend([0] * (required_size - len(new_ram)))
-                processor.memory.ram = new_ram
+                processor.memory.ram.ensure_size(required_size)
             
-            # Создаем новый список памяти для гарантии обновления (Pydantic требует нового объекта)
-            new_ram = list(processor.memory.ram) if processor.memory.ram else [0] * max(required_size, processor.memory_size)
-            
-            # Гарантируем достаточный размер
-            while len(new_ram) < required_size:
-                new_ram.append(0)
+            # Пишем прямо в RAM процессора (на месте, без копирования)
+            new_ram = processor.memory.ram
             
             # Загружаем массив в память начиная с 0x0100
             # [0x0100] = размер массива
@@ -446,10 +438,6 @@ HALT               ; остановка программы
                 else:
                     print(f"ERROR: Address 0x{addr:04X} out of bounds! memory_size={len(new_ram)}")
             
-            # Присваиваем новый список памяти (Pydantic увидит изменение)
-            # ВАЖНО: создаем полностью новый список для Pydantic
-            processor.memory.ram = list(new_ram)  # Создаем новый список
-            
             # Проверяем, что данные действительно загружены СРАЗУ после присваивания
             if 0x0100 < len(processor.memory.ram):
                 verify_val = processor.memory.ram[0x0100]
@@ -473,11 +461,10 @@ HALT               ; остановка программы
                 # Если данные не записались, принудительно исправляем
                 if verify_val != size or not all_ok:
                     print(f"ERROR: Данные не совпадают! Принудительно исправляем память")
-                    # Создаем новый список с правильными данными
-                    fixed_ram = list(processor.memory.ram)
+                    # Исправляем данные прямо в RAM
+                    fixed_ram = processor.memory.ram
                     # Гарантируем достаточный размер
-                    while len(fixed_ram) < required_size:
-                        fixed_ram.append(0)
+                    fixed_ram.ensure_size(required_size)
                     # Устанавливаем размер
                     fixed_ram[0x0100] = int(size) & 0xFFFF
                     # Обновляем элементы массива
@@ -486,9 +473,6 @@ HALT               ; остановка программы
                         if addr < len(fixed_ram):
                             fixed_ram[addr] = int(value) & 0xFFFF
                             print(f"FORCE FIX: fixed_ram[0x{addr:04X}] = {value} (0x{value:04X})")
-                    # Присваиваем исправленную память (создаем новый объект для Pydantic)
-                    from .models import MemoryState
-                    processor.memory = MemoryState(ram=fixed_ram, history=processor.memory.history)
                     last_addr = 0x0100 + len(elements)
                     last_val = processor.memory.ram[last_addr] if last_addr < len(processor.memory.ram) else 'OUT_OF_BOUNDS'
                     print(f"FORCE FIX: Память исправлена, проверка: memory.ram[0x0100]={processor.memory.ram[0x0100]}, memory.ram[0x{last_addr:04X}]={last_val}")
@@ -516,16 +500,10 @@ HALT               ; остановка программы
             current_size = len(processor.memory.ram) if processor.memory.ram else 0
             if current_size < required_size:
                 print(f"WARNING: Memory too small ({current_size}), expanding to {required_size}")
-                new_ram = list(processor.memory.ram) if processor.memory.ram else [0] * processor.memory_size
-                new_ram.extend([0] * (required_size - len(new_ram)))
-                processor.memory.ram = new_ram
+                processor.memory.ram.ensure_size(required_size)
             
-            # Создаем новый список памяти для гарантии обновления (Pydantic требует нового объекта)
-            new_ram = list(processor.memory.ram) if processor.memory.ram else [0] * max(required_size, processor.memory_size)
-            
-            # Гарантируем достаточный размер
-            while len(new_ram) < required_size:
-                new_ram.append(0)
+            # Пишем прямо в RAM процессора (на месте, без копирования)
+            new_ram = processor.memory.ram
             
             # Загружаем массив A в память (0x0200-0x020A)
             # [0x0200] = размер массива A
@@ -555,10 +533,6 @@ HALT               ; остановка программы
                 else:
                     print(f"ERROR: Address 0x{addr:04X} out of bounds! memory_size={len(new_ram)}")
             
-            # Присваиваем новый список памяти (Pydantic увидит изменение)
-            # ВАЖНО: создаем полностью новый список для Pydantic
-            processor.memory.ram = list(new_ram)
-            
             # Проверяем, что данные действительно загружены СРАЗУ после присваивания
             if 0x0200 < len(processor.memory.ram) and 0x0300 < len(processor.memory.ram):
                 verify_size_a = processor.memory.ram[0x0200]
@@ -599,11 +573,10 @@ HALT               ; остановка программы
                 # Если данные не записались, принудительно исправляем
                 if verify_size_a != size_a or verify_size_b != size_b or not all_ok_a or not all_ok_b:
                     print(f"ERROR: Данные не совпадают! Принудительно исправляем память для задачи 2")
-                    # Создаем новый список с правильными данными
-                    fixed_ram = list(processor.memory.ram)
+                    # Исправляем данные прямо в RAM
+                    fixed_ram = processor.memory.ram
                     # Гарантируем достаточный размер
-                    while len(fixed_ram) < required_size:
-                        fixed_ram.append(0)
+                    fixed_ram.ensure_size(required_size)
                     # Устанавливаем размер массива A
                     fixed_ram[0x0200] = int(size_a) & 0xFFFF
                     # Обновляем элементы массива A
@@ -620,8 +593,6 @@ HALT               ; остановка программы
                         if addr < len(fixed_ram):
                             fixed_ram[addr] = int(value) & 0xFFFF
                             print(f"FORCE FIX: fixed_ram[0x{addr:04X}] (B[{i}]) = {value} (0x{value:04X})")
-                    # Присваиваем исправленную память (создаем новый объект для Pydantic)
-                    processor.memory = MemoryState(ram=fixed_ram, history=processor.memory.history)
                     print(f"FORCE FIX: Память исправлена для задачи 2, проверка: memory.ram[0x0200]={processor.memory.ram[0x0200]}, memory.ram[0x0300]={processor.memory.ram[0x0300]}")
                 else:
                     print(f"OK: Все данные задачи 2 успешно записаны в память")
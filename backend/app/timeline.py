@@ -0,0 +1,218 @@
+"""
+Контрольные точки выполнения для перемотки (seek / step back)
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import List, Dict, Any, Optional, Tuple
+
+
+class Checkpoint:
+    """Состояние процессора на границе команды
+
+    position - число выполненных команд (cycles) в момент снимка.
+    RAM хранится постранично; неизмененные страницы разделяются
+    с предыдущей контрольной точкой (один и тот же объект array).
+    external - точка записана после изменения состояния извне процессора
+    (загрузка данных, правка RAM): такие точки не прореживаются.
+    """
+
+    __slots__ = ('position', 'registers', 'flag_bits', 'pages', 'ram_size', 'external')
+
+    def __init__(self, position: int, registers: Dict[str, Any], flag_bits: int,
+                 pages: Tuple[array, ...], ram_size: int, external: bool = False):
+        self.position = position
+        self.registers = registers
+        self.flag_bits = flag_bits
+        self.pages = pages
+        self.ram_size = ram_size
+        self.external = external
+
+    def ram(self) -> array:
+        """Содержимое RAM в момент снимка"""
+        ram = array('H')
+        for page in self.pages:
+            ram.extend(page)
+        return ram
+
+
+class CheckpointTimeline:
+    """Контрольные точки каждые interval команд
+
+    Чтобы попасть на команду N, восстанавливается ближайшая контрольная точка
+    с position <= N и выполнение детерминированно повторяется до N, поэтому
+    повтор стоит не больше interval команд. Число точек ограничено
+    max_checkpoints: при переполнении каждая вторая точка удаляется, а
+    интервал удваивается, так что память остается ограниченной при любой
+    длине выполнения.
+
+    Изменения состояния извне (записи в RAM между шагами, смена регистров)
+    фиксируются внешними точками: повтор никогда не проходит через них,
+    а при повторном выполнении вперед после перемотки назад состояние
+    внешней точки применяется заново (см. RISCProcessor._timeline_reached).
+    """
+
+    # Регистры ProcessorState, которые сохраняются в контрольной точке
+    REGISTERS = ('accumulator', 'program_counter', 'instruction_register', 'instruction_register_asm',
+                 'current_command', 'is_halted', 'cycles')
+
+    def __init__(self, interval: int = 1024, max_checkpoints: int = 1024):
+        if interval < 1:
+            raise Exception(f"Invalid checkpoint interval: {interval}")
+        self.base_interval = interval
+        self.max_checkpoints = max(max_checkpoints, 2)
+        self.clear()
+
+    def clear(self):
+        """Удалить все контрольные точки"""
+        self.interval = self.base_interval
+        self._positions: List[int] = []
+        self._checkpoints: List[Checkpoint] = []
+        # Точка, с которой совпадает RAM на версии _base_version (для разделения страниц)
+        self._base: Optional[Checkpoint] = None
+        self._base_version = -1
+        self.thinned = 0
+
+    def __len__(self) -> int:
+        return len(self._checkpoints)
+
+    def __bool__(self) -> bool:
+        return bool(self._checkpoints)
+
+    def copy(self) -> "CheckpointTimeline":
+        """Независимый список тех же контрольных точек (для повтора на копии процессора)
+
+        Сами точки неизменяемы и не копируются. Разделение страниц привязано
+        к конкретной RAM, поэтому в копии оно начинается заново.
+        """
+        timeline = CheckpointTimeline(self.base_interval, self.max_checkpoints)
+        timeline.interval = self.interval
+        timeline._positions = list(self._positions)
+        timeline._checkpoints = list(self._checkpoints)
+        timeline.thinned = self.thinned
+        return timeline
+
+    def has(self, position: int) -> bool:
+        """Есть ли контрольная точка ровно на position"""
+        i = bisect_left(self._positions, position)
+        return i < len(self._positions) and self._positions[i] == position
+
+    def next_boundary(self, position: int) -> int:
+        """Ближайшая граница интервала строго после position"""
+        return (position // self.interval + 1) * self.interval
+
+    def capture(self, position: int, cpu, flag_bits: int, ram, external: bool = False) -> Checkpoint:
+        """Сохранить контрольную точку
+
+        Внешняя точка заменяет все точки с position и дальше: прежнее будущее
+        выполнения больше недостижимо. Обычная точка добавляется, только если
+        на этой позиции точки еще нет.
+
+        Args:
+            position: Число выполненных команд
+            cpu: ProcessorState
+            flag_bits: Флаги процессора (битовая маска)
+            ram: PagedRAM
+            external: Точка фиксирует изменение состояния извне
+        """
+        if external:
+            self.truncate(position)
+        i = bisect_left(self._positions, position)
+        if i < len(self._positions) and self._positions[i] == position:
+            return self._checkpoints[i]
+        checkpoint = Checkpoint(
+            position,
+            {name: getattr(cpu, name) for name in self.REGISTERS},
+            flag_bits,
+            self._share_pages(ram),
+            len(ram),
+            external,
+        )
+        self._positions.insert(i, position)
+        self._checkpoints.insert(i, checkpoint)
+        self.mark(checkpoint, ram)
+        if len(self._checkpoints) > self.max_checkpoints:
+            self._thin()
+        return checkpoint
+
+    def mark(self, checkpoint: Checkpoint, ram):
+        """Запомнить, что RAM сейчас совпадает с памятью контрольной точки"""
+        self._base = checkpoint
+        self._base_version = ram.version
+
+    def nearest(self, position: int) -> Optional[Checkpoint]:
+        """Последняя контрольная точка с position <= указанного"""
+        i = bisect_right(self._positions, position) - 1
+        return self._checkpoints[i] if i >= 0 else None
+
+    def external_at(self, position: int) -> Optional[Checkpoint]:
+        """Внешняя контрольная точка ровно на position (или None)"""
+        i = bisect_left(self._positions, position)
+        if i < len(self._positions) and self._positions[i] == position and self._checkpoints[i].external:
+            return self._checkpoints[i]
+        return None
+
+    def next_external(self, position: int) -> Optional[int]:
+        """Позиция первой внешней точки строго после position (или None)"""
+        for i in range(bisect_right(self._positions, position), len(self._positions)):
+            if self._checkpoints[i].external:
+                return self._positions[i]
+        return None
+
+    def truncate(self, position: int):
+        """Удалить контрольные точки с position >= указанного"""
+        i = bisect_left(self._positions, position)
+        if i < len(self._positions):
+            del self._positions[i:]
+            del self._checkpoints[i:]
+
+    @property
+    def last_position(self) -> Optional[int]:
+        return self._positions[-1] if self._positions else None
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика контрольных точек"""
+        unique = {}
+        for checkpoint in self._checkpoints:
+            for page in checkpoint.pages:
+                unique[id(page)] = len(page)
+        return {
+            "checkpoints": len(self._checkpoints),
+            "interval": self.interval,
+            "first": self._positions[0] if self._positions else None,
+            "last": self.last_position,
+            "external": sum(1 for c in self._checkpoints if c.external),
+            "pages_stored": len(unique),
+            "words_stored": sum(unique.values()),
+            "thinned": self.thinned,
+        }
+
+    def _share_pages(self, ram) -> Tuple[array, ...]:
+        """Страницы RAM: измененные копируются, остальные берутся из базовой точки"""
+        size = ram.PAGE_SIZE
+        count = ram.page_count
+        base = self._base
+        if base is None or base.ram_size != len(ram):
+            changed = None
+        else:
+            changed = set(ram.pages_changed_since(self._base_version))
+        pages = []
+        for page in range(count):
+            if changed is not None and page not in changed:
+                pages.append(base.pages[page])
+            else:
+                lo = page * size
+                pages.append(ram[lo:lo + size])
+        return tuple(pages)
+
+    def _thin(self):
+        """Удвоить интервал и удалить точки не на его границах
+
+        Первая, последняя и внешние точки сохраняются.
+        """
+        self.interval *= 2
+        last = len(self._checkpoints) - 1
+        keep = [c for i, c in enumerate(self._checkpoints)
+                if i == 0 or i == last or c.external or c.position % self.interval == 0]
+        self.thinned += len(self._checkpoints) - len(keep)
+        self._checkpoints = keep
+        self._positions = [c.position for c in keep]
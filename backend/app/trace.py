@@ -0,0 +1,333 @@
+"""
+Трасса выполнения в файле: потоковая запись порциями и чтение
+
+Формат (все числа - little-endian):
+
+    заголовок    HEADER: магическое число, версия формата, признаки
+    порции       CHUNK: первый шаг, число команд, число записей в память,
+                 размер данных, размер в файле; затем данные порции
+
+Данные порции - столбцы (см. COLUMNS): шаг, PC, опкод, операнд, ACC и
+флаги после команды, число записей в память; затем столбцы записей в
+память: адрес, старое и новое значение. С признаком TRACE_COMPRESSED
+данные порции сжаты zlib. Порция, не дописанная до конца (процесс
+остановлен во время записи), при чтении пропускается.
+"""
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from typing import List, Dict, Any, BinaryIO, Iterator, Optional, Sequence, Tuple, Union
+
+MEDIA_TYPE = "application/octet-stream"
+
+MAGIC = b"RTRC"
+FORMAT_VERSION = 1
+
+# Признаки заголовка
+TRACE_COMPRESSED = 0x1
+
+# Операнд, который не является числом (нет операнда, ошибка декодирования)
+NO_OPERAND = -0x80000000
+
+# Команд в порции по умолчанию
+DEFAULT_CHUNK_RECORDS = 4096
+
+# magic, версия формата, признаки
+HEADER = struct.Struct("<4sHH")
+# первый шаг, команды, записи в память, размер данных, размер в файле
+CHUNK = struct.Struct("<QIIII")
+
+# Столбцы команд и записей в память (имя, тип array)
+COLUMNS = (('step', 'Q'), ('pc', 'I'), ('opcode', 'h'), ('operand', 'i'),
+           ('accumulator', 'H'), ('flags', 'B'), ('writes', 'B'))
+WRITE_COLUMNS = (('address', 'I'), ('old', 'H'), ('new', 'H'))
+
+
+def _le(values: array) -> bytes:
+    """Байты массива в порядке little-endian"""
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+class TraceWriter:
+    """Потоковая запись трассы выполнения
+
+    Команды копятся в столбцах текущей порции; когда в ней набирается
+    chunk_records команд, порция записывается в файл (при compress - со
+    сжатием zlib) и столбцы очищаются. Поэтому память писателя ограничена
+    одной порцией, сколько бы команд ни было выполнено.
+
+    Args:
+        file: Путь (файл создается) или открытый двоичный файл
+        chunk_records: Команд в порции
+        compress: Сжимать порции zlib
+        level: Уровень сжатия zlib
+    """
+
+    def __init__(self, file: Union[str, Path, BinaryIO], chunk_records: int = DEFAULT_CHUNK_RECORDS,
+                 compress: bool = True, level: int = 6):
+        if chunk_records < 1:
+            raise Exception(f"Invalid trace chunk size: {chunk_records}")
+        self.chunk_records = chunk_records
+        self.compress = compress
+        self.level = level
+        self._owns = isinstance(file, (str, Path))
+        self._file = open(file, "wb") if self._owns else file
+        self._columns = [array(code) for _, code in COLUMNS]
+        self._write_columns = [array(code) for _, code in WRITE_COLUMNS]
+        self.records = 0          # Команд записано (вместе с текущей порцией)
+        self.writes = 0           # Записей в память
+        self.chunks = 0           # Порций в файле
+        self.bytes_written = HEADER.size
+        self.closed = False
+        self._file.write(HEADER.pack(MAGIC, FORMAT_VERSION, TRACE_COMPRESSED if compress else 0))
+
+    def __enter__(self) -> "TraceWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, step: int, pc: int, opcode: int, operand: Any, accumulator: int, flags: int,
+               writes: Sequence[Tuple[int, int, int]] = ()):
+        """Добавить выполненную команду
+
+        Args:
+            step: Номер шага (число выполненных команд после этой)
+            pc: Адрес команды
+            opcode: Опкод
+            operand: Операнд (не число - NO_OPERAND)
+            accumulator: ACC после команды
+            flags: Флаги после команды (битовая маска)
+            writes: Записи в память: (адрес, было, стало)
+        """
+        if type(operand) is not int or not -0x80000000 < operand <= 0x7FFFFFFF:
+            operand = NO_OPERAND
+        step_column, pc_column, opcode_column, operand_column, acc_column, flags_column, count_column = self._columns
+        step_column.append(step)
+        pc_column.append(pc & 0xFFFFFFFF)
+        opcode_column.append(opcode)
+        operand_column.append(operand)
+        acc_column.append(accumulator & 0xFFFF)
+        flags_column.append(flags & 0xFF)
+        count_column.append(min(len(writes), 0xFF))
+        if writes:
+            addresses, old, new = self._write_columns
+            for address, old_value, new_value in writes[:0xFF]:
+                addresses.append(address)
+                old.append(old_value & 0xFFFF)
+                new.append(new_value & 0xFFFF)
+            self.writes += min(len(writes), 0xFF)
+        self.records += 1
+        if len(step_column) >= self.chunk_records:
+            self.flush()
+
+    def flush(self):
+        """Записать текущую порцию в файл"""
+        count = len(self._columns[0])
+        if not count:
+            return
+        data = b"".join(_le(column) for column in self._columns + self._write_columns)
+        stored = zlib.compress(data, self.level) if self.compress else data
+        header = CHUNK.pack(self._columns[0][0], count, len(self._write_columns[0]), len(data), len(stored))
+        self._file.write(header)
+        self._file.write(stored)
+        self._file.flush()
+        self.bytes_written += len(header) + len(stored)
+        self.chunks += 1
+        for column in self._columns + self._write_columns:
+            del column[:]
+
+    def close(self):
+        """Дописать последнюю порцию и закрыть файл (если он открыт писателем)"""
+        if self.closed:
+            return
+        self.flush()
+        self.closed = True
+        if self._owns:
+            self._file.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Объем записанной трассы"""
+        return {
+            "records": self.records,
+            "writes": self.writes,
+            "chunks": self.chunks,
+            "bytes": self.bytes_written,
+            "compressed": self.compress,
+        }
+
+
+class TraceReader:
+    """Чтение трассы, записанной TraceWriter
+
+    При открытии читаются только заголовки порций (данные пропускаются),
+    поэтому открытие не зависит от объема трассы. Итерация и выборка
+    диапазона распаковывают по одной порции; в памяти хранится только
+    последняя распакованная порция.
+
+    Args:
+        file: Путь или открытый двоичный файл с произвольным доступом
+    """
+
+    def __init__(self, file: Union[str, Path, BinaryIO]):
+        self._owns = isinstance(file, (str, Path))
+        self._file = open(file, "rb") if self._owns else file
+        header = self._file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise Exception("Truncated trace header")
+        magic, version, flags = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise Exception("Not a trace file")
+        if version != FORMAT_VERSION:
+            raise Exception(f"Unsupported trace format version: {version}")
+        self.compressed = bool(flags & TRACE_COMPRESSED)
+        self.truncated = False    # Последняя порция не дописана (пропущена)
+        self._chunks: List[Tuple[int, int, int, int, int, int]] = []  # смещение, шаг, команды, записи, размеры
+        self._starts: List[int] = []  # Номер первой команды порции
+        self._cached: Optional[Tuple[int, Dict[str, array]]] = None
+        self._scan()
+
+    def __enter__(self) -> "TraceReader":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._starts[-1] + self._chunks[-1][2] if self._chunks else 0
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Все команды трассы по порядку"""
+        for chunk in range(len(self._chunks)):
+            yield from self._records(self.chunk_columns(chunk), 0, self._chunks[chunk][2])
+
+    def __getitem__(self, index: Union[int, slice]):
+        """Команда по номеру или список команд среза (шаг среза - 1)"""
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise Exception("Trace slices do not support a step")
+            return self.records(start, stop)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("trace index out of range")
+        return self.records(index, index + 1)[0]
+
+    @property
+    def chunk_count(self) -> int:
+        return len(self._chunks)
+
+    def records(self, start: int, stop: int) -> List[Dict[str, Any]]:
+        """Команды с номерами [start, stop)"""
+        result = []
+        for chunk, lo, hi in self._spans(start, stop):
+            result.extend(self._records(self.chunk_columns(chunk), lo, hi))
+        return result
+
+    def columns(self, start: int, stop: int) -> Dict[str, array]:
+        """Столбцы COLUMNS команд [start, stop) (без записей в память)"""
+        result = {name: array(code) for name, code in COLUMNS}
+        for chunk, lo, hi in self._spans(start, stop):
+            columns = self.chunk_columns(chunk)
+            for name, _ in COLUMNS:
+                result[name].extend(columns[name][lo:hi])
+        return result
+
+    def chunk_columns(self, chunk: int) -> Dict[str, array]:
+        """Распакованные столбцы порции (COLUMNS и WRITE_COLUMNS)"""
+        if self._cached is not None and self._cached[0] == chunk:
+            return self._cached[1]
+        offset, _, count, writes, size, stored = self._chunks[chunk]
+        self._file.seek(offset)
+        data = self._file.read(stored)
+        if self.compressed:
+            data = zlib.decompress(data)
+        if len(data) != size:
+            raise Exception(f"Corrupted trace chunk {chunk}")
+        columns = {}
+        position = 0
+        for names, length in ((COLUMNS, count), (WRITE_COLUMNS, writes)):
+            for name, code in names:
+                values = array(code)
+                end = position + values.itemsize * length
+                values.frombytes(data[position:end])
+                if sys.byteorder == "big":
+                    values.byteswap()
+                columns[name] = values
+                position = end
+        self._cached = (chunk, columns)
+        return columns
+
+    def stats(self) -> Dict[str, Any]:
+        """Объем трассы"""
+        return {
+            "records": len(self),
+            "writes": sum(chunk[3] for chunk in self._chunks),
+            "chunks": len(self._chunks),
+            "compressed": self.compressed,
+            "truncated": self.truncated,
+        }
+
+    def close(self):
+        if self._owns:
+            self._file.close()
+
+    def _scan(self):
+        """Прочитать заголовки порций"""
+        file = self._file
+        start = file.tell()
+        size = file.seek(0, 2)
+        file.seek(start)
+        total = 0
+        while True:
+            header = file.read(CHUNK.size)
+            if not header:
+                break
+            first_step, count, writes, raw_size, stored = CHUNK.unpack(header) \
+                if len(header) == CHUNK.size else (0, 0, 0, 0, size)
+            offset = file.tell()
+            if offset + stored > size:
+                self.truncated = True
+                break
+            file.seek(stored, 1)
+            self._chunks.append((offset, first_step, count, writes, raw_size, stored))
+            self._starts.append(total)
+            total += count
+
+    def _spans(self, start: int, stop: int) -> Iterator[Tuple[int, int, int]]:
+        """Порции и диапазоны команд в них для [start, stop)"""
+        start = max(start, 0)
+        stop = min(stop, len(self))
+        if start >= stop:
+            return
+        chunk = bisect_right(self._starts, start) - 1
+        while chunk < len(self._chunks) and self._starts[chunk] < stop:
+            base = self._starts[chunk]
+            yield chunk, max(start - base, 0), min(stop - base, self._chunks[chunk][2])
+            chunk += 1
+
+    @staticmethod
+    def _records(columns: Dict[str, array], lo: int, hi: int) -> Iterator[Dict[str, Any]]:
+        """Словари команд [lo, hi) порции"""
+        counts = columns['writes']
+        position = sum(counts[:lo])
+        addresses, old, new = columns['address'], columns['old'], columns['new']
+        for step, pc, opcode, operand, accumulator, flags, count in zip(
+                *(columns[name][lo:hi] for name, _ in COLUMNS)):
+            yield {
+                "step": step,
+                "pc": pc,
+                "opcode": opcode,
+                "operand": None if operand == NO_OPERAND else operand,
+                "accumulator": accumulator,
+                "flags": flags,
+                "writes": [[addresses[i], old[i], new[i]] for i in range(position, position + count)],
+            }
+            position += count
@@ -0,0 +1,152 @@
+"""
+Версии состояния процессора: ETag и изменения с версии клиента
+"""
+import uuid
+import weakref
+from array import array
+from collections import deque
+from typing import List, Dict, Any, Optional, Tuple
+
+from .timeline import CheckpointTimeline
+
+# Регистры ProcessorState, изменения которых отслеживаются по версиям
+VERSION_REGISTERS = CheckpointTimeline.REGISTERS
+
+
+class VersionMark:
+    """Состояние процессора на момент выдачи версии
+
+    writes - адреса ячеек RAM, изменившихся с предыдущей версии
+    (None для первой версии: сравнивать не с чем). История хранится по
+    слабой ссылке, чтобы после сброса процессора старая история не
+    удерживалась в памяти.
+    """
+
+    __slots__ = ('version', 'registers', 'flag_bits', 'program', 'history', 'history_generation',
+                 'history_length', 'ram_size', 'writes')
+
+    def __init__(self, version: int, registers: Tuple, flag_bits: int, program: Tuple, history,
+                 history_generation: int, history_length: int, ram_size: int, writes: Optional[array]):
+        self.version = version
+        self.registers = registers
+        self.flag_bits = flag_bits
+        self.program = program
+        self.history = history
+        self.history_generation = history_generation
+        self.history_length = history_length
+        self.ram_size = ram_size
+        self.writes = writes
+
+
+class StateVersions:
+    """Монотонная версия состояния процессора
+
+    Версия увеличивается, когда при очередном обращении (observe) состояние
+    отличается от предыдущего: сравниваются регистры, флаги, программа,
+    счетчик записей PagedRAM и длина истории - все это O(1), поэтому
+    выполнение команд не платит за учет версий, а несколько изменений
+    между обращениями дают одну новую версию. Для последних max_versions
+    версий хранится, какие ячейки RAM изменились (по теневой копии RAM и
+    страницам, измененным после прошлой версии), поэтому изменения с версии
+    клиента вычисляются без полной копии памяти на каждую версию.
+
+    epoch различает экземпляры (после сброса сессии или восстановления из
+    снимка номера версий начинаются заново), поэтому входит в ETag.
+    """
+
+    def __init__(self, max_versions: int = 32):
+        self.max_versions = max_versions
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+        self._marks: deque = deque(maxlen=max_versions)
+        self._key = None
+        self._ram = None
+        self._ram_version = 0
+        self._history = None
+        self._shadow: Optional[array] = None
+
+    @property
+    def etag(self) -> str:
+        """ETag текущей версии"""
+        return f'"{self.epoch}-{self.version}"'
+
+    def observe(self, processor) -> int:
+        """Текущая версия состояния процессора (новая, если состояние изменилось)"""
+        cpu = processor.processor
+        ram = processor.memory.ram
+        history = processor.memory.history
+        registers = tuple(getattr(cpu, name) for name in VERSION_REGISTERS)
+        program = self.program_key(processor)
+        flag_bits = processor.flag_bits
+        key = (registers, flag_bits, program, ram.version, len(ram), history.generation, len(history))
+        if key == self._key and ram is self._ram and history is self._history:
+            return self.version
+
+        writes = self._changed_cells(ram)
+        self.version += 1
+        self._key = key
+        self._ram = ram
+        self._ram_version = ram.version
+        self._history = history
+        self._marks.append(VersionMark(self.version, registers, flag_bits, program, weakref.ref(history),
+                                       history.generation, len(history), len(ram), writes))
+        return self.version
+
+    @staticmethod
+    def program_key(processor) -> Tuple:
+        """Признаки загруженной программы и режима выборки команд"""
+        return (processor.source_code, len(processor.compiled_code), processor.fetch_from_ram,
+                processor.code_base)
+
+    def changes_since(self, version: int) -> Optional[Tuple[VersionMark, List[int]]]:
+        """Состояние на версии version и адреса RAM, изменившиеся после нее
+
+        Возвращает None, если версия неизвестна (слишком старая или из
+        другого экземпляра) - тогда клиенту нужно полное состояние.
+        Перед вызовом текущая версия должна быть получена через observe().
+        """
+        if not 0 < version <= self.version:
+            return None
+        marks = list(self._marks)
+        for i, mark in enumerate(marks):
+            if mark.version == version:
+                addresses = set()
+                for later in marks[i + 1:]:
+                    addresses.update(later.writes)
+                return mark, sorted(addresses)
+        return None
+
+    def _changed_cells(self, ram) -> Optional[array]:
+        """Адреса ячеек, отличающихся от теневой копии; копия обновляется"""
+        if self._shadow is None:
+            self._shadow = array('H', ram)
+            return None
+
+        shadow = self._shadow
+        if len(shadow) != len(ram):
+            if len(shadow) < len(ram):
+                shadow.extend([0] * (len(ram) - len(shadow)))
+            else:
+                del shadow[len(ram):]
+            pages = range(ram.page_count)
+        elif ram is not self._ram:
+            # Новая RAM (сброс процессора): сравниваются все страницы
+            pages = range(ram.page_count)
+        else:
+            pages = ram.pages_changed_since(self._ram_version)
+
+        writes = array('I')
+        current = memoryview(ram)
+        previous = memoryview(shadow)
+        for page in pages:
+            cells = ram.page_range(page)
+            lo, hi = cells.start, cells.stop
+            if current[lo:hi] == previous[lo:hi]:
+                continue
+            for address in cells:
+                if ram[address] != shadow[address]:
+                    writes.append(address)
+            previous[lo:hi] = current[lo:hi]
+        current.release()
+        previous.release()
+        return writes
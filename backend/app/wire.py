@@ -0,0 +1,340 @@
+"""
+Кодирование состояния эмулятора для ответов API
+
+encode_state_json / encode_result_json - JSON без повторной валидации и обхода
+jsonable_encoder по всем копиям RAM истории.
+encode_state / decode_state - компактный двоичный формат (application/octet-stream).
+
+Двоичный формат: все числа - little-endian. Структура сообщения:
+
+    заголовок      HEADER: магическое число, версия формата, признаки, версия состояния
+    процессор      PROCESSOR: регистры, флаги (битовая маска), индексы строк
+    размеры        COUNTS: число строк, машинных команд, слов RAM, слов базовой RAM,
+                   записей истории, записей журнала, индекс первой записи истории
+    строки         для каждой: u32 длина + UTF-8 (таблица строк без повторов)
+    машинный код   u32 индекс строки на команду
+    RAM            u16 на слово
+    базовая RAM    u16 на слово: RAM до первой передаваемой записи истории
+    история        RECORD (фиксированная длина) на запись
+    журнал         адреса u32, старые значения u16, новые значения u16 (по столбцам)
+
+Передаются подробные записи истории (вытесненные по емкости истории - нет).
+Копии RAM записей истории (ram_before/ram_after) не передаются: они
+восстанавливаются из базовой RAM и журнала записей (см. decode_state).
+"""
+import json
+import struct
+import sys
+from array import array
+from typing import List, Dict, Any, Tuple
+
+from fastapi.encoders import jsonable_encoder
+
+from .flags import flags_to_dict, flags_from_dict
+from .history import HISTORY_RAM_FIELDS
+from .models import EmulatorState, MemoryState, ProcessorState
+
+MEDIA_TYPE = "application/octet-stream"
+
+MAGIC = b"RSTB"
+FORMAT_VERSION = 2
+
+# Признаки заголовка
+WIRE_HALTED = 0x1
+WIRE_HAS_TASK = 0x2
+
+# Индекс строки для значения None
+NO_STRING = 0xFFFFFFFF
+# Разделитель операндов команды в строке
+OPERAND_SEPARATOR = "\x1f"
+
+# magic, версия формата, признаки, версия состояния
+HEADER = struct.Struct("<4sHHI")
+# ACC, флаги, PC, IR, cycles, задача, строки: IR (asm), текущая команда, исходный код
+PROCESSOR = struct.Struct("<HBxIIQi3I")
+# строки, машинный код, RAM, базовая RAM, записи истории, записи журнала,
+# индекс первой записи истории
+COUNTS = struct.Struct("<7I")
+# флаги до/после, ACC до/после, PC до/после, IR, строки: фаза, команда,
+# инструкция, операнды, IR (asm); конец участка журнала
+RECORD = struct.Struct("<BBHHIIH6I")
+
+_U32 = struct.Struct("<I")
+
+# Поля ответа по схемам EmulatorState/ProcessorState/MemoryState
+STATE_FIELDS = tuple(EmulatorState.model_fields)
+PROCESSOR_FIELDS = tuple(ProcessorState.model_fields)
+MEMORY_FIELDS = tuple(MemoryState.model_fields)
+
+_json = json.JSONEncoder(ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+
+
+def encode_state_json(state: Dict[str, Any], history=None, schema: bool = True) -> bytes:
+    """Состояние (RISCProcessor.get_state) в JSON по схеме EmulatorState
+
+    get_state уже собирает состояние из базовых типов Python, поэтому
+    модель не строится и не валидируется: значения кодируются напрямую,
+    а лишние поля отбрасываются по списку полей схемы (без schema -
+    передаются все поля, как в ответах с результатом операции). Разделы,
+    не запрошенные у get_state, в ответе отсутствуют. Записи истории
+    разделяют списки RAM (ram и ram_after - один список, ram_before -
+    список предыдущей записи), поэтому каждый такой список кодируется
+    один раз. Если передана история (ExecutionHistory), из которой взяты
+    записи, JSON остальных полей записей собирается по ее столбцам (fragments).
+    """
+    encode = _json.encode
+    encoded: Dict[int, str] = {}
+
+    def encode_ram(values) -> str:
+        text = encoded.get(id(values))
+        if text is None:
+            text = encoded[id(values)] = encode(values)
+        return text
+
+    memory = state.get("memory", {})
+    start = memory.get("history_start", 0)
+    records = memory.get("history", ())
+    fragments = history.fragments(start, start + len(records)) if history is not None else None
+    entries = []
+    for index, entry in enumerate(records):
+        if fragments is not None:
+            text = fragments[index]
+        else:
+            text = encode({key: value for key, value in entry.items() if key not in HISTORY_RAM_FIELDS})
+        rams = ",".join(f'"{key}":{encode_ram(entry[key])}' for key in HISTORY_RAM_FIELDS if key in entry)
+        if rams:
+            text = text[:-1] + ("," if len(text) > 2 else "") + rams + "}"
+        entries.append(text)
+
+    processor = state.get("processor")
+    parts = []
+    for name in STATE_FIELDS if schema else state:
+        if name not in state:
+            continue
+        if name == "processor":
+            value = encode({key: processor[key] for key in processor if not schema or key in PROCESSOR_FIELDS})
+        elif name == "memory":
+            fields = [f'"{key}":{"[" + ",".join(entries) + "]" if key == "history" else encode(value)}'
+                      for key, value in memory.items() if not schema or key in MEMORY_FIELDS]
+            value = "{" + ",".join(fields) + "}"
+        else:
+            value = encode(state[name])
+        parts.append(f'"{name}":{value}')
+    return ("{" + ",".join(parts) + "}").encode("utf-8")
+
+
+def encode_result_json(result: Dict[str, Any], history=None) -> bytes:
+    """Результат операции с полем state в JSON (state - через encode_state_json)"""
+    state = result.get("state")
+    rest = _json.encode(jsonable_encoder({key: value for key, value in result.items() if key != "state"}))
+    if state is None:
+        return rest.encode("utf-8")
+    state_json = encode_state_json(state, history, schema=False).decode("utf-8")
+    return (rest[:-1] + ("," if len(rest) > 2 else "") + '"state":' + state_json + "}").encode("utf-8")
+
+
+class _Strings:
+    """Таблица строк без повторов"""
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def add(self, value) -> int:
+        if value is None:
+            return NO_STRING
+        value = str(value)
+        index = self.index.get(value)
+        if index is None:
+            index = self.index[value] = len(self.values)
+            self.values.append(value)
+        return index
+
+
+def _le(words: array) -> bytes:
+    """Байты массива в порядке little-endian"""
+    if sys.byteorder == "big":
+        words = array(words.typecode, words)
+        words.byteswap()
+    return words.tobytes()
+
+
+def _from_le(typecode: str, data, count: int, offset: int) -> Tuple[array, int]:
+    words = array(typecode)
+    size = words.itemsize * count
+    words.frombytes(data[offset:offset + size])
+    if sys.byteorder == "big":
+        words.byteswap()
+    return words, offset + size
+
+
+def _accumulator(registers) -> int:
+    return int(registers[0]) & 0xFFFF if isinstance(registers, list) and registers else 0
+
+
+def _flag_bits(flags) -> int:
+    return flags_from_dict(flags) if isinstance(flags, dict) else 0
+
+
+def encode_state(processor) -> bytes:
+    """Состояние процессора (как RISCProcessor.get_state) в двоичном формате"""
+    cpu = processor.processor
+    version = processor.versions.observe(processor)
+    strings = _Strings()
+    asm_index = strings.add(cpu.instruction_register_asm)
+    command_index = strings.add(cpu.current_command)
+    source_index = strings.add(processor.source_code)
+    machine_code = array("I", [strings.add(word) for word in processor.compiled_code])
+
+    history = processor.memory.history
+    ends, addrs, old, new = history.journal()
+    journal_start = history.journal_start
+    count = len(ends)
+    records = bytearray(RECORD.size * count)
+    pack = RECORD.pack_into
+    offset = 0
+    for entry, end in zip(history.entries(history.start, len(history), with_ram=False), ends):
+        operands = entry.get("operands") or []
+        pack(records, offset,
+             _flag_bits(entry.get("flags_before")),
+             _flag_bits(entry.get("flags_after")),
+             _accumulator(entry.get("registers_before")),
+             _accumulator(entry.get("registers_after")),
+             int(entry.get("programCounter_before", 0)),
+             int(entry.get("programCounter_after", 0)),
+             int(entry.get("instruction_register", 0)) & 0xFFFF,
+             strings.add(entry.get("execution_phase")),
+             strings.add(entry.get("command", "")),
+             strings.add(entry.get("instruction", "")),
+             strings.add(OPERAND_SEPARATOR.join(str(op) for op in operands)),
+             strings.add(entry.get("instruction_register_asm", "")),
+             end - journal_start)
+        offset += RECORD.size
+
+    ram = processor.memory.ram
+    base = array("H", history.ram_at_offset(journal_start)) if count else array("H")
+    flags = WIRE_HALTED if cpu.is_halted else 0
+    parts = [
+        HEADER.pack(MAGIC, FORMAT_VERSION, flags, version),
+        PROCESSOR.pack(int(cpu.accumulator) & 0xFFFF, processor.flag_bits, cpu.program_counter,
+                       cpu.instruction_register, cpu.cycles, -1, asm_index, command_index, source_index),
+        COUNTS.pack(len(strings.values), len(machine_code), len(ram), len(base), count, len(addrs),
+                    history.start),
+    ]
+    for value in strings.values:
+        encoded = value.encode("utf-8")
+        parts.append(_U32.pack(len(encoded)))
+        parts.append(encoded)
+    parts.append(_le(machine_code))
+    parts.append(_le(ram))
+    parts.append(_le(base))
+    parts.append(bytes(records))
+    parts.append(_le(addrs))
+    parts.append(_le(old))
+    parts.append(_le(new))
+    return b"".join(parts)
+
+
+def decode_state(data: bytes, materialize_ram: bool = True) -> Dict[str, Any]:
+    """Эталонный декодер: двоичное состояние -> словарь как RISCProcessor.get_state()
+
+    Args:
+        data: Сообщение encode_state()
+        materialize_ram: Восстановить ram/ram_before/ram_after записей истории.
+            Без него записи получают поле writes: [[адрес, было, стало], ...]
+    """
+    data = memoryview(data)
+    magic, format_version, flags, version = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise Exception("Not an emulator state message")
+    if format_version != FORMAT_VERSION:
+        raise Exception(f"Unsupported state format version: {format_version}")
+    offset = HEADER.size
+    (accumulator, flag_bits, program_counter, instruction_register, cycles, task,
+     asm_index, command_index, source_index) = PROCESSOR.unpack_from(data, offset)
+    offset += PROCESSOR.size
+    (string_count, code_count, ram_size, base_size, history_count, write_count,
+     history_start) = COUNTS.unpack_from(data, offset)
+    offset += COUNTS.size
+
+    strings = []
+    for _ in range(string_count):
+        (length,) = _U32.unpack_from(data, offset)
+        offset += _U32.size
+        strings.append(bytes(data[offset:offset + length]).decode("utf-8"))
+        offset += length
+
+    def string(index: int):
+        return None if index == NO_STRING else strings[index]
+
+    machine_code, offset = _from_le("I", data, code_count, offset)
+    ram, offset = _from_le("H", data, ram_size, offset)
+    base, offset = _from_le("H", data, base_size, offset)
+    records_offset = offset
+    offset += RECORD.size * history_count
+    addrs, offset = _from_le("I", data, write_count, offset)
+    old, offset = _from_le("H", data, write_count, offset)
+    new, offset = _from_le("H", data, write_count, offset)
+
+    history = []
+    state = base.tolist()
+    start = 0
+    for (flags_before, flags_after, acc_before, acc_after, pc_before, pc_after, ir,
+         phase, command, instruction, operands, ir_asm, end) in RECORD.iter_unpack(
+            data[records_offset:records_offset + RECORD.size * history_count]):
+        operands = string(operands)
+        entry = {
+            "command": string(command),
+            "instruction": string(instruction),
+            "operands": operands.split(OPERAND_SEPARATOR) if operands else [],
+            "execution_phase": string(phase),
+            "registers_before": [acc_before],
+            "registers_after": [acc_after],
+            "registers": [acc_after],
+            "flags_before": flags_to_dict(flags_before),
+            "flags_after": flags_to_dict(flags_after),
+            "flags": flags_to_dict(flags_after),
+            "programCounter": pc_after,
+            "programCounter_before": pc_before,
+            "programCounter_after": pc_after,
+            "instruction_register": ir,
+            "instruction_register_asm": string(ir_asm),
+        }
+        if materialize_ram:
+            ram_before = state
+            if end != start:
+                state = list(state)
+                for i in range(start, end):
+                    if addrs[i] >= len(state):
+                        state.extend([0] * (addrs[i] + 1 - len(state)))
+                    state[addrs[i]] = new[i]
+            entry["ram"] = state
+            entry["ram_before"] = ram_before
+            entry["ram_after"] = state
+        else:
+            entry["writes"] = [[addrs[i], old[i], new[i]] for i in range(start, end)]
+        start = end
+        history.append(entry)
+
+    return {
+        "processor": {
+            "accumulator": accumulator,
+            "registers": [accumulator],
+            "program_counter": program_counter,
+            "instruction_register": instruction_register,
+            "instruction_register_asm": string(asm_index),
+            "flags": flags_to_dict(flag_bits),
+            "current_command": string(command_index),
+            "is_halted": bool(flags & WIRE_HALTED),
+            "cycles": cycles,
+        },
+        "memory": {
+            "ram": ram.tolist(),
+            "history": history,
+            "history_start": history_start,
+        },
+        "source_code": string(source_index),
+        "machine_code": [strings[index] for index in machine_code],
+        "current_task": task if flags & WIRE_HAS_TASK else None,
+        "version": version,
+    }
@@ -0,0 +1,127 @@
+"""
+Индекс записей в RAM по адресам: кто и когда записал ячейку
+"""
+from array import array
+from bisect import bisect_left
+from typing import List, Dict, Optional, Tuple
+
+# Емкость индекса по умолчанию (записей в память)
+DEFAULT_WRITE_INDEX_CAPACITY = 1 << 18
+
+
+class WriteIndex:
+    """Записи в RAM по адресам: фаза, PC, команда, старое и новое значение
+
+    Записи хранятся по столбцам в порядке выполнения; номер записи (seq)
+    сквозной с последней очистки и совпадает со смещением журнала
+    ExecutionHistory. Для каждого адреса хранится возрастающий массив
+    номеров его записей, поэтому последняя запись адреса - O(1), а записи
+    адреса до заданной фазы - бинарный поиск по этому массиву (O(log n)),
+    без просмотра истории.
+
+    Объем ограничен capacity записями (None - без ограничения): когда их
+    становится больше на четверть capacity, самые старые удаляются пачкой,
+    так что индекс покрывает последние записи и после вытеснения
+    подробной истории.
+    """
+
+    def __init__(self, capacity: Optional[int] = DEFAULT_WRITE_INDEX_CAPACITY):
+        if capacity is not None and capacity < 1:
+            raise Exception(f"Invalid write index capacity: {capacity}")
+        self.capacity = capacity
+        self.clear()
+
+    def clear(self):
+        """Очистить индекс"""
+        self._first = 0                 # Номер первой хранимой записи
+        self._steps = array('Q')        # Индекс фазы истории
+        self._pcs = array('I')          # PC команды (programCounter_before фазы)
+        self._commands = array('I')     # Номер строки команды в таблице строк истории
+        self._old = array('H')
+        self._new = array('H')
+        self._by_address: Dict[int, array] = {}  # Адрес -> номера записей (array('Q'))
+        self.dropped = 0                # Записей удалено по capacity
+
+    def __len__(self) -> int:
+        return len(self._steps)
+
+    @property
+    def first_step(self) -> Optional[int]:
+        """Фаза самой старой хранимой записи (None - записей нет)"""
+        return self._steps[0] if self._steps else None
+
+    def add(self, step: int, pc: int, command: int, address: int, old: int, new: int):
+        """Добавить запись в память (фазы добавляются по возрастанию)"""
+        seq = self._first + len(self._steps)
+        self._steps.append(step)
+        self._pcs.append(pc & 0xFFFFFFFF)
+        self._commands.append(command)
+        self._old.append(old & 0xFFFF)
+        self._new.append(new & 0xFFFF)
+        positions = self._by_address.get(address)
+        if positions is None:
+            positions = self._by_address[address] = array('Q')
+        positions.append(seq)
+        if self.capacity is not None and len(self._steps) >= self.capacity + max(self.capacity // 4, 1):
+            self._drop(len(self._steps) - self.capacity)
+
+    def count(self, address: int) -> int:
+        """Число хранимых записей адреса"""
+        positions = self._by_address.get(address)
+        return len(positions) if positions is not None else 0
+
+    def query(self, address: int, before: Optional[int] = None,
+              limit: int = 1) -> List[Tuple[int, int, int, int, int, int]]:
+        """Записи адреса, сделанные до фазы before, от новых к старым
+
+        Возвращает до limit кортежей (seq, фаза, PC, номер строки команды,
+        было, стало). Записи одной фазы не разделяются между страницами:
+        последняя фаза страницы возвращается целиком.
+        """
+        positions = self._by_address.get(address)
+        if not positions:
+            return []
+        first, steps = self._first, self._steps
+        stop = len(positions)
+        if before is not None:
+            stop = bisect_left(positions, before, key=lambda seq: steps[seq - first])
+        records = []
+        i = stop - 1
+        while i >= 0:
+            offset = positions[i] - first
+            if len(records) >= limit and steps[offset] != records[-1][1]:
+                break
+            records.append((positions[i], steps[offset], self._pcs[offset], self._commands[offset],
+                            self._old[offset], self._new[offset]))
+            i -= 1
+        return records
+
+    def stats(self) -> Dict[str, int]:
+        """Статистика индекса"""
+        return {
+            "writes": len(self._steps),
+            "addresses": len(self._by_address),
+            "capacity": self.capacity,
+            "dropped": self.dropped,
+        }
+
+    def bytes_retained(self) -> int:
+        """Объем массивов индекса (байт)"""
+        columns = (self._steps, self._pcs, self._commands, self._old, self._new)
+        return (sum(len(values) * values.itemsize for values in columns)
+                + sum(len(positions) * positions.itemsize for positions in self._by_address.values()))
+
+    def _drop(self, count: int):
+        """Удалить count самых старых записей"""
+        cut = self._first + count
+        for address in list(self._by_address):
+            positions = self._by_address[address]
+            i = bisect_left(positions, cut)
+            if i == len(positions):
+                del self._by_address[address]
+            elif i:
+                del positions[:i]
+        for column in (self._steps, self._pcs, self._commands, self._old, self._new):
+            del column[:count]
+        self._first = cut
+        self.dropped += count
@@ -0,0 +1,82 @@
+"""
+Бенчмарк быстрого выполнения (run) на встроенных задачах
+
+Запуск из каталога backend:
+    python benchmarks/bench_blocks.py [--repeat N]
+
+Сравнивает run() через интерпретатор (таблица обработчиков), интерпретатор
+с суперкомандами и скомпилированные блоки. Данные задачи загружаются
+один раз, затем программа многократно запускается с PC = 0.
+"""
+import argparse
+import contextlib
+import io
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.emulator import RISCEmulator  # noqa: E402
+
+
+def prepare(task_id: int) -> RISCEmulator:
+    """Эмулятор с загруженной задачей и ее данными"""
+    emulator = RISCEmulator()
+    with contextlib.redirect_stdout(io.StringIO()):
+        emulator.load_task(task_id)
+        emulator.task_manager.setup_task_data(emulator.processor, task_id)
+    return emulator
+
+
+def restart(emulator: RISCEmulator):
+    """Вернуть процессор к началу программы, не трогая RAM"""
+    cpu = emulator.processor.processor
+    cpu.program_counter = 0
+    cpu.accumulator = 0
+    cpu.is_halted = False
+    cpu.cycles = 0
+    emulator.processor.set_flags(0)
+
+
+def measure(task_id: int, use_blocks: bool, use_fusion: bool, repeat: int):
+    """Число команд в секунду, результат (ACC) и сводка последнего запуска"""
+    emulator = prepare(task_id)
+    processor = emulator.processor
+    executed = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        restart(emulator)
+        summary = processor.run(use_blocks=use_blocks, use_fusion=use_fusion)
+        executed += summary["instructions"]
+    elapsed = time.perf_counter() - started
+    return executed / elapsed, processor.processor.accumulator, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=2000, help="Число запусков каждой программы")
+    args = parser.parse_args()
+
+    modes = (
+        ("интерпретатор", False, False),
+        ("суперкоманды", False, True),
+        ("блоки", True, False),
+    )
+    for task_id in (1, 2):
+        base_rate = None
+        results = set()
+        print(f"Задача {task_id}")
+        for title, use_blocks, use_fusion in modes:
+            rate, acc, summary = measure(task_id, use_blocks, use_fusion, args.repeat)
+            results.add(acc)
+            base_rate = base_rate or rate
+            print(f"  {title:<15}{rate:>12,.0f} команд/с {rate / base_rate:>6.2f}x  "
+                  f"команд={summary['instructions']} диспетчеризаций={summary['dispatches']} "
+                  f"сэкономлено={summary['dispatches_saved']}")
+        if len(results) != 1:
+            raise SystemExit(f"Задача {task_id}: результаты различаются ({sorted(results)})")
+
+
+if __name__ == "__main__":
+    main()
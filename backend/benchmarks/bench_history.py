@@ -0,0 +1,108 @@
+"""
+Бенчмарк истории выполнения: словари записей против столбцов ExecutionHistory
+
+Запуск из каталога backend:
+    python benchmarks/bench_history.py [--entries 30000] [--repeat 5]
+
+Процессор выполняет фазы встроенной задачи, записи истории (без копий RAM)
+собираются в список словарей - прежнее хранение - и добавляются в
+ExecutionHistory без ограничения емкости. Память считается по tracemalloc,
+выборка диапазона - records() и fragments() против среза списка словарей
+и кодирования их JSON.
+"""
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.emulator import RISCEmulator  # noqa: E402
+from app.history import ExecutionHistory  # noqa: E402
+
+TASK_ID = 2
+RANGE = 1000
+
+
+def collect(count: int):
+    """Записи истории count фаз задачи TASK_ID и RAM после каждой фазы"""
+    emulator = RISCEmulator(history_capacity=None)
+    processor = emulator.processor
+    with contextlib.redirect_stdout(io.StringIO()):
+        emulator.load_task(TASK_ID)
+        emulator.task_manager.setup_task_data(processor, TASK_ID)
+        while len(processor.memory.history) < count:
+            if processor.processor.is_halted:
+                # Программа завершилась - запускается заново с PC = 0
+                processor.processor.program_counter = 0
+                processor.processor.is_halted = False
+            emulator.advance_step()
+    history = processor.memory.history
+    return list(history.entries(0, count, with_ram=False)), [history.writes(index) for index in range(count)]
+
+
+def traced(build):
+    """Результат build() и прирост памяти по tracemalloc (байт)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, size
+
+
+def median_time(func, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=30000, help="Число записей истории")
+    parser.add_argument("--repeat", type=int, default=5, help="Число повторов замера выборки")
+    args = parser.parse_args()
+
+    entries, writes = collect(args.entries)
+    payload = json.dumps(entries)
+    ram = [0] * 8192
+
+    dicts, dict_bytes = traced(lambda: json.loads(payload))
+
+    def fill():
+        history = ExecutionHistory(capacity=None)
+        for entry, phase_writes in zip(json.loads(payload), writes):
+            history.append(entry, ram, phase_writes)
+        return history
+
+    history, history_bytes = traced(fill)
+    if history.records(0, len(history)) != dicts:
+        raise SystemExit("записи истории различаются")
+
+    count = len(dicts)
+    print(f"Записей истории: {count}, задача {TASK_ID}")
+    print(f"  память: словари {dict_bytes / count:>7.0f} Б/запись  столбцы {history_bytes / count:>5.0f} Б/запись  "
+          f"{dict_bytes / history_bytes:>5.1f}x  (оценка bytes_retained {history.bytes_retained() / count:.0f})")
+
+    start = count // 2
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    before = median_time(lambda: [dict(entry) for entry in dicts[start:start + RANGE]], args.repeat)
+    after = median_time(lambda: history.records(start, start + RANGE), args.repeat)
+    print(f"  {RANGE} записей словарями: до {before * 1000:>6.2f} мс  после {after * 1000:>6.2f} мс")
+    before = median_time(lambda: [encoder.encode(entry) for entry in dicts[start:start + RANGE]], args.repeat)
+    after = median_time(lambda: history.fragments(start, start + RANGE), args.repeat)
+    print(f"  {RANGE} записей в JSON:      до {before * 1000:>6.2f} мс  после {after * 1000:>6.2f} мс")
+    after = median_time(lambda: history.column("pc_after", start, start + RANGE), args.repeat)
+    print(f"  {RANGE} значений PC (столбец): {after * 1e6:.1f} мкс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Бенчмарк GET /api/state: модель EmulatorState против прямого кодирования JSON
+
+Запуск из каталога backend:
+    python benchmarks/bench_state.py [--entries 0,1000,10000] [--ram-size 512] [--repeat 3]
+
+Запросы выполняются через ASGI-приложение в том же процессе (без сети).
+"До" - прежний путь: EmulatorState(**state) с response_model, то есть
+валидация, model_dump и повторная сериализация FastAPI; "после" - текущий
+/api/state. Каждая запись истории содержит полные копии RAM, поэтому по
+умолчанию RAM уменьшена до 512 слов: при 8192 словах и 10000 записях
+прежний путь требует нескольких гигабайт памяти.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi import Depends  # noqa: E402
+
+from app import main as api  # noqa: E402
+from app.emulator import RISCEmulator  # noqa: E402
+from app.models import EmulatorState  # noqa: E402
+
+SESSION = "bench-state"
+PROGRAM = "LDI 1\nSTA 0x40\nloop:\nLDA 0x41\nADD 0x40\nSTA 0x41\nJMP loop\n"
+
+
+async def legacy_state(emulator: RISCEmulator = Depends(api.get_emulator)):
+    """Прежняя реализация GET /api/state"""
+    state = await api.run_emulator(emulator, emulator.get_state)
+    return EmulatorState(**state)
+
+
+async def request(path: str) -> bytes:
+    """GET-запрос к приложению через ASGI; возвращает тело ответа"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"x-session-id", SESSION.encode())],
+        "client": ("bench", 0), "server": ("bench", 80), "scheme": "http",
+    }
+    body = []
+    status = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+        elif message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    await api.app(scope, receive, send)
+    if status[0] != 200:
+        raise SystemExit(f"{path}: статус {status[0]}")
+    return b"".join(body)
+
+
+def fill_history(emulator: RISCEmulator, entries: int):
+    """Загрузить программу и выполнить фазы, пока в истории не станет entries записей"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        emulator.reset()
+        compiled = emulator.compile_code(PROGRAM)
+        emulator.processor.load_program(compiled["machine_code"], PROGRAM)
+        while len(emulator.processor.memory.history) < entries:
+            emulator.advance_step()
+
+
+async def measure(path: str, repeat: int):
+    """Медиана времени ответа (с) и тело последнего ответа"""
+    times = []
+    body = b""
+    for _ in range(repeat):
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            body = await request(path)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times), body
+
+
+async def run(args):
+    api.app.add_api_route("/bench/legacy-state", legacy_state, response_model=EmulatorState)
+    lifespan = api.app.router.lifespan_context(api.app)
+    await lifespan.__aenter__()
+    try:
+        # Ограничение времени запроса не должно влиять на замер
+        api.executor.timeout = 3600
+        api.sessions.factory = lambda: RISCEmulator(memory_size=args.ram_size, history_capacity=None)
+        emulator = api.sessions.get(SESSION)
+        print(f"RAM: {args.ram_size} слов, повторов: {args.repeat}")
+        for entries in args.entries:
+            fill_history(emulator, entries)
+            before, legacy_body = await measure("/bench/legacy-state", args.repeat)
+            after, body = await measure("/api/state", args.repeat)
+            if json.loads(legacy_body) != json.loads(body):
+                raise SystemExit(f"{entries} записей: ответы различаются")
+            print(f"  записей истории {entries:>6}: до {before * 1000:>9.1f} мс  после {after * 1000:>9.1f} мс  "
+                  f"{before / after:>5.2f}x  ответ {len(body) / 1e6:.1f} МБ")
+    finally:
+        await lifespan.__aexit__(None, None, None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", default="0,1000,10000",
+                        help="Число записей истории через запятую")
+    parser.add_argument("--ram-size", type=int, default=512, help="Размер RAM (слов)")
+    parser.add_argument("--repeat", type=int, default=3, help="Число запросов на замер")
+    args = parser.parse_args()
+    args.entries = [int(value) for value in args.entries.split(",")]
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
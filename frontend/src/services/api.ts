@@ -1,4 +1,4 @@
-import type { EmulatorState, ExecuteRequest, TaskInfo } from '../types/emulator';
+import type { EmulatorState, ExecuteRequest, HistoryPage, MemoryWindow, MemoryWrites, ReplayedHistory, TaskInfo } from '../types/emulator';
 
 // Используем переменную окружения или определяем автоматически
 const getApiBaseUrl = (): string => {
@@ -24,17 +24,31 @@ console.log('[API] Используется адрес API:', API_BASE_URL);
 console.log('[API] Текущий hostname:', window.location.hostname);
 console.log('[API] Текущий URL:', window.location.href);
 
+// Идентификатор сессии: у каждой вкладки свой эмулятор на backend
+const getSessionId = (): string => {
+  const key = 'risc-session-id';
+  let sessionId = window.sessionStorage.getItem(key);
+  if (!sessionId) {
+    sessionId = Array.from({ length: 32 }, () => Math.floor(Math.random() * 16).toString(16)).join('');
+    window.sessionStorage.setItem(key, sessionId);
+  }
+  return sessionId;
+};
+
+const SESSION_ID = getSessionId();
+
 class ApiService {
   private async request<T>(endpoint: string, options: RequestInit = {}): Promise<T> {
     const url = `${API_BASE_URL}${endpoint}`;
 
     try {
       const response = await fetch(url, {
+        ...options,
         headers: {
           'Content-Type': 'application/json',
+          'X-Session-Id': SESSION_ID,
           ...options.headers,
         },
-        ...options,
       });
 
       if (!response.ok) {
@@ -57,6 +71,29 @@ class ApiService {
     return this.request<EmulatorState>('/api/state');
   }
 
+  // Получить окно RAM [start, start + length)
+  async getMemory(start: number, length: number): Promise<MemoryWindow> {
+    return this.request<MemoryWindow>(`/api/memory?start=${start}&len=${length}`);
+  }
+
+  // Получить страницу истории (fields - только нужные поля записей)
+  async getHistory(from: number, limit: number, fields?: string[]): Promise<HistoryPage> {
+    const query = fields && fields.length > 0 ? `&fields=${encodeURIComponent(fields.join(','))}` : '';
+    return this.request<HistoryPage>(`/api/history?from=${from}&limit=${limit}${query}`);
+  }
+
+  // Восстановить историю фаз команд [from, from + limit) повтором от контрольной точки
+  async replayHistory(from: number, limit: number, fields?: string[]): Promise<ReplayedHistory> {
+    const query = fields && fields.length > 0 ? `&fields=${encodeURIComponent(fields.join(','))}` : '';
+    return this.request<ReplayedHistory>(`/api/history/replay?from=${from}&limit=${limit}${query}`);
+  }
+
+  // Кто и когда писал в ячейку RAM (от новых записей к старым; before - индекс фазы)
+  async getMemoryWrites(address: number, limit = 1, before?: number): Promise<MemoryWrites> {
+    const query = before !== undefined ? `&before=${before}` : '';
+    return this.request<MemoryWrites>(`/api/memory/writes?address=${address}&limit=${limit}${query}`);
+  }
+
   // Компилировать код
   async compileCode(sourceCode: string, taskId?: number): Promise<{ success: boolean; machine_code: string[]; labels: any; state?: any }> {
     const requestBody: any = { source_code: sourceCode };
@@ -91,8 +128,16 @@ class ApiService {
   }
 
   // Выполнить один шаг
-  async executeStep(): Promise<{ success: boolean; state: EmulatorState; continues?: boolean }> {
-    return this.request('/api/step', {
+  // historyFrom - число уже полученных записей истории: в ответе будут только новые.
+  // fields - разделы состояния (по умолчанию backend отдает профиль light: регистры и writes)
+  async executeStep(historyFrom = 0, fields = 'all'): Promise<{
+    success: boolean;
+    state: EmulatorState;
+    continues?: boolean;
+    writes?: [number, number][];
+    ram_size?: number;
+  }> {
+    return this.request(`/api/step?history_from=${historyFrom}&fields=${fields}`, {
       method: 'POST',
     });
   }
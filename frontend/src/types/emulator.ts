@@ -29,6 +29,53 @@ export interface ProcessorState {
 export interface MemoryState {
     ram: number[];
     history: any[];
+    history_start?: number;  // Индекс первой записи history (запросы с history_from)
+}
+
+export interface MemoryWindow {
+    start: number;
+    length: number;
+    size: number;
+    values: number[];
+}
+
+export interface HistoryPage {
+    start: number;
+    count: number;
+    total: number;
+    first?: number;  // Индекс первой подробной записи (более ранние - сводки, summary: true)
+    next: number | null;
+    entries: any[];
+    retention?: Record<string, number | null>;  // Объем и вытеснение истории
+}
+
+export interface ReplayedHistory {
+    start: number;    // Номер первой команды окна
+    stop: number;     // Номер команды после окна
+    count: number;
+    entries: any[];   // Записи фаз; position - номер команды фазы
+    checkpoint: number;  // Позиция контрольной точки, от которой шел повтор
+    replayed: number;    // Команд выполнено быстро до начала окна
+    next: number | null; // from для следующего окна
+}
+
+export interface MemoryWrite {
+    seq: number;      // Номер записи в журнале истории
+    step: number;     // Индекс фазы истории
+    pc: number;       // PC команды, сделавшей запись
+    command: string;
+    old: number;
+    new: number;
+}
+
+export interface MemoryWrites {
+    address: number;
+    count: number;
+    total: number;    // Записей адреса в индексе
+    writes: MemoryWrite[];  // От новых к старым
+    next: number | null;    // before для следующей страницы
+    first_step: number | null;
+    index: Record<string, number | null>;
 }
 
 export interface EmulatorState {
@@ -37,6 +84,7 @@ export interface EmulatorState {
     source_code: string;
     machine_code: string[];
     current_task: number | null;
+    version?: number;  // Версия состояния (GET /api/state?since=)
 }
 
 export interface ApiResponse<T> {